@@ -0,0 +1,168 @@
+from typing import List, Optional, Dict, Any, Iterable
+from datetime import datetime, timedelta
+from pathlib import Path
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from models import GameLevel, LevelAnalytics, DailyAnalytics, LevelCompleteRequest, UpdateGameStatsRequest
+from storage import GameStorage, MotorGameStorage, COMPLETION_TIME_BUCKETS, completion_time_bucket
+import asyncio
+import typer
+import logging
+
+logger = logging.getLogger(__name__)
+
+def _ratio(numerator: float, denominator: float) -> Optional[float]:
+    return round(numerator / denominator, 4) if denominator else None
+
+def histogram_median(histogram: Dict[str, int]) -> Optional[int]:
+    """Estimate the median completion time by interpolating inside its bucket"""
+    total = sum(histogram.values())
+    if not total:
+        return None
+    half = total / 2
+    seen = 0
+    lower = 0
+    for bound in COMPLETION_TIME_BUCKETS:
+        count = histogram.get(str(bound), 0)
+        if count and seen + count >= half:
+            return int(lower + (bound - lower) * (half - seen) / count)
+        seen += count
+        lower = bound
+    # The median is in the open-ended bucket
+    return lower
+
+class AnalyticsService:
+    """Per-level and per-day gameplay rollups.
+
+    Session starts, level completions and stat updates add to one rollup
+    document per level and one per UTC day with atomic increments, so the
+    analytics endpoints read a handful of small documents instead of
+    scanning player states and sessions. Recording never fails the request
+    that triggered it; recompute() rebuilds the level counters that stored
+    data can reproduce, for backfills and drift repair.
+    """
+    def __init__(self, storage: GameStorage):
+        self.storage = storage
+
+    async def _record(self, now: datetime, daily: Dict[str, int],
+                      level_id: Optional[str] = None, level: Optional[Dict[str, int]] = None):
+        writes = [self.storage.increment_daily_analytics(now.strftime("%Y-%m-%d"), daily)] if daily else []
+        if level_id:
+            writes.append(self.storage.increment_level_analytics(level_id, level))
+        for result in await asyncio.gather(*writes, return_exceptions=True):
+            if isinstance(result, Exception):
+                logger.error(f"Error recording analytics: {result}")
+
+    async def record_session_start(self, level_id: str, now: datetime):
+        await self._record(now, {"sessions_started": 1}, level_id, {"sessions_started": 1})
+
+    async def record_completion(self, request: LevelCompleteRequest, first_completion: bool, now: datetime):
+        await self._record(
+            now,
+            {
+                "completions": 1,
+                "grabs": request.grabs_count,
+                "releases": request.releases_count,
+                "teleports": request.teleports_count
+            },
+            request.level_id,
+            {
+                "completions": 1,
+                "first_completions": 1 if first_completion else 0,
+                "teleports": request.teleports_count,
+                "total_completion_time": request.completion_time,
+                f"completion_time_histogram.{completion_time_bucket(request.completion_time)}": 1
+            }
+        )
+
+    async def record_session_completed(self, level_id: str, now: datetime):
+        """Count a session that was closed by completing its level"""
+        await self._record(now, {}, level_id, {"completed_sessions": 1})
+
+    async def record_stat_deltas(self, deltas: Iterable[UpdateGameStatsRequest], now: datetime):
+        """Add statistics updates (one or a coalesced batch) to today's rollup"""
+        totals = {"grabs": 0, "releases": 0, "teleports": 0, "play_time": 0}
+        for delta in deltas:
+            totals["grabs"] += delta.grabs
+            totals["releases"] += delta.releases
+            totals["teleports"] += delta.teleports
+            totals["play_time"] += delta.play_time
+        if any(totals.values()):
+            await self._record(now, totals)
+
+    async def get_level_analytics(self, levels: List[GameLevel]) -> List[LevelAnalytics]:
+        """Summaries for the given levels in play order"""
+        rollups = {rollup["level_id"]: rollup for rollup in await self.storage.get_level_analytics()}
+        ordered = sorted(levels, key=lambda level: level.order)
+        summaries = []
+        for index, level in enumerate(ordered):
+            rollup: Dict[str, Any] = rollups.get(level.id, {})
+            histogram = rollup.get("completion_time_histogram", {})
+            completions = rollup.get("completions", 0)
+            first_completions = rollup.get("first_completions", 0)
+            drop_off = None
+            if index + 1 < len(ordered) and first_completions:
+                next_completions = rollups.get(ordered[index + 1].id, {}).get("first_completions", 0)
+                drop_off = round(max(first_completions - next_completions, 0) / first_completions, 4)
+            mean = _ratio(rollup.get("total_completion_time", 0), sum(histogram.values()))
+            summaries.append(LevelAnalytics(
+                level_id=level.id,
+                order=level.order,
+                sessions_started=rollup.get("sessions_started", 0),
+                completed_sessions=rollup.get("completed_sessions", 0),
+                completions=completions,
+                first_completions=first_completions,
+                completion_rate=_ratio(rollup.get("completed_sessions", 0), rollup.get("sessions_started", 0)),
+                median_completion_time=histogram_median(histogram),
+                mean_completion_time=int(mean) if mean is not None else None,
+                teleports_per_completion=_ratio(rollup.get("teleports", 0), completions),
+                drop_off_to_next=drop_off
+            ))
+        return summaries
+
+    async def get_daily_analytics(self, days: int) -> List[DailyAnalytics]:
+        """One entry per UTC day for the last ``days`` days, oldest first"""
+        today = datetime.utcnow().date()
+        since = (today - timedelta(days=days - 1)).isoformat()
+        rollups = {rollup["day"]: rollup for rollup in await self.storage.get_daily_analytics(since)}
+        result = []
+        for offset in range(days - 1, -1, -1):
+            day = (today - timedelta(days=offset)).isoformat()
+            rollup = rollups.get(day, {})
+            summary = DailyAnalytics(day=day, **{
+                field: rollup.get(field, 0)
+                for field in ("sessions_started", "completions", "grabs", "releases", "teleports", "play_time")
+            })
+            summary.teleports_per_session = _ratio(summary.teleports, summary.sessions_started)
+            result.append(summary)
+        return result
+
+    async def recompute(self) -> int:
+        """Rebuild the level completion counters from player states"""
+        updated = await self.storage.recompute_level_analytics()
+        logger.info(f"Recomputed analytics for {updated} levels")
+        return updated
+
+# Batch jobs, run from the backend directory:
+#     python analytics.py recompute
+cli = typer.Typer(help="Analytics maintenance jobs")
+
+@cli.callback()
+def callback():
+    # Keeps the job a named subcommand; Typer runs a lone command without its name
+    pass
+
+@cli.command("recompute")
+def recompute_command(
+    mongo_url: str = typer.Option(..., envvar="MONGO_URL"),
+    db_name: str = typer.Option(..., envvar="DB_NAME")
+):
+    """Rebuild level completion counters from player_game_state; session counters are kept"""
+    storage = MotorGameStorage(AsyncIOMotorClient(mongo_url)[db_name])
+    updated = asyncio.run(AnalyticsService(storage).recompute())
+    typer.echo(f"Recomputed analytics for {updated} levels")
+
+if __name__ == "__main__":
+    load_dotenv(Path(__file__).parent / '.env')
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    cli()
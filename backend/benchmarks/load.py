@@ -0,0 +1,259 @@
+"""Load and latency benchmark for the /api/game/* endpoints.
+
+Runs the FastAPI app in-process (no network, no uvicorn) against a local
+MongoDB (``--backend mongo``, the default), mongomock-motor as an in-memory
+stand-in (``--backend mongomock`` or ``--fake``) or the pure in-memory
+storage engine (``--backend memory``). Each endpoint is driven in its own
+phase at the requested concurrency and reported with p50/p95/p99 latency,
+throughput and database operations per request (storage calls for
+``--backend memory``). Results are written as JSON so runs can be compared
+between commits.
+
+Run from the backend directory:
+
+    python -m benchmarks.load --fake --requests 500 --concurrency 20
+    python -m benchmarks.load --backend memory --requests 500 --concurrency 20
+    python -m benchmarks.load --mongo-url mongodb://localhost:27017 --output bench.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List
+
+import httpx
+
+# server.py reads these at import time; the benchmark rebinds the database below
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "bench")
+
+import server  # noqa: E402
+from game_service import GameService  # noqa: E402
+from models import PlayerGameState  # noqa: E402
+from stats_aggregator import StatsAggregator  # noqa: E402
+from storage import GameStorage, MemoryGameStorage, MotorGameStorage  # noqa: E402
+
+# Collection methods that each cost one database round trip
+DB_OPERATIONS = {
+    "find", "find_one", "find_one_and_update", "insert_one", "insert_many",
+    "update_one", "update_many", "replace_one", "delete_one", "delete_many",
+    "bulk_write", "count_documents", "aggregate", "create_indexes"
+}
+
+class OperationCounter:
+    def __init__(self):
+        self.count = 0
+
+class CountingCollection:
+    """Collection proxy that counts database operations"""
+    def __init__(self, collection, counter: OperationCounter):
+        self._collection = collection
+        self._counter = counter
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._collection, name)
+        if name not in DB_OPERATIONS:
+            return attr
+
+        def counted(*args, **kwargs):
+            self._counter.count += 1
+            return attr(*args, **kwargs)
+        return counted
+
+class CountingDatabase:
+    """Database proxy whose collections count database operations"""
+    def __init__(self, db, counter: OperationCounter):
+        self._db = db
+        self._counter = counter
+
+    def __getitem__(self, name: str) -> CountingCollection:
+        return CountingCollection(self._db[name], self._counter)
+
+    def __getattr__(self, name: str) -> CountingCollection:
+        return self[name]
+
+class CountingStorage:
+    """Storage proxy that counts calls into a backend without a database"""
+    def __init__(self, storage: GameStorage, counter: OperationCounter):
+        self._storage = storage
+        self._counter = counter
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._storage, name)
+        if name.startswith("_") or not asyncio.iscoroutinefunction(attr):
+            return attr
+
+        def counted(*args, **kwargs):
+            self._counter.count += 1
+            return attr(*args, **kwargs)
+        return counted
+
+def open_database(args):
+    if args.backend == "mongomock":
+        try:
+            from mongomock_motor import AsyncMongoMockClient
+        except ImportError:
+            sys.exit("--fake needs mongomock-motor: pip install mongomock-motor")
+        return AsyncMongoMockClient()[args.db_name]
+    from motor.motor_asyncio import AsyncIOMotorClient
+    return AsyncIOMotorClient(args.mongo_url)[args.db_name]
+
+def open_storage(args, counter: OperationCounter):
+    """Create the benchmarked storage backend, wrapped to count operations"""
+    if args.backend == "memory":
+        return None, CountingStorage(MemoryGameStorage(), counter)
+    db = CountingDatabase(open_database(args), counter)
+    return db, MotorGameStorage(db)
+
+def bind_app(db, storage) -> None:
+    """Point the app's module-level services at the benchmark storage"""
+    if db is not None:
+        server.db = db
+    server.game_service = GameService(storage)
+    server.stats_aggregator = StatsAggregator(server.game_service)
+
+async def seed_players(db, storage, players: int) -> List[str]:
+    player_ids = [f"bench_{index}" for index in range(players)]
+    if db is not None:
+        await db.player_game_state.delete_many({"player_id": {"$in": player_ids}})
+    for player_id in player_ids:
+        await storage.insert_player_state(PlayerGameState(player_id=player_id).model_dump())
+    return player_ids
+
+Scenario = Callable[[httpx.AsyncClient, str, int], Awaitable[httpx.Response]]
+
+SCENARIOS: Dict[str, Scenario] = {
+    "state": lambda c, p, i: c.get("/api/game/state", params={"player_id": p}),
+    "levels": lambda c, p, i: c.get("/api/game/levels"),
+    "level": lambda c, p, i: c.get("/api/game/levels/level3"),
+    "hand-skins": lambda c, p, i: c.get("/api/game/hand-skins"),
+    "achievements": lambda c, p, i: c.get("/api/game/achievements"),
+    "complete-level": lambda c, p, i: c.post(
+        "/api/game/complete-level", params={"player_id": p},
+        json={"level_id": f"level{i % 5 + 1}", "completion_time": 20000 + i % 20000,
+              "grabs_count": 3, "releases_count": 3, "teleports_count": 1}
+    ),
+    "update-stats": lambda c, p, i: c.post(
+        "/api/game/update-stats", params={"player_id": p},
+        json={"grabs": 1, "releases": 1, "teleports": 0, "play_time": 1}
+    ),
+    "update-stats-batch": lambda c, p, i: c.post(
+        "/api/game/update-stats/batch",
+        json={"updates": [{"player_id": p, "grabs": 1, "releases": 1, "play_time": 1}]}
+    ),
+    "start-session": lambda c, p, i: c.post(
+        "/api/game/start-session", params={"player_id": p}, json={"level_id": "level1"}
+    ),
+    "settings": lambda c, p, i: c.post(
+        "/api/game/settings", params={"player_id": p},
+        json={"settings": {"audio": {"master_volume": 0.5}}}
+    ),
+    "select-hand-skin": lambda c, p, i: c.post(
+        "/api/game/select-hand-skin", params={"player_id": p}, json={"hand_skin_id": "default"}
+    ),
+    "leaderboard": lambda c, p, i: c.get("/api/game/leaderboard/level1", params={"limit": 10})
+}
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    index = min(len(sorted_values) - 1, max(0, round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+async def run_phase(client: httpx.AsyncClient, scenario: Scenario, player_ids: List[str],
+                    requests: int, concurrency: int, counter: OperationCounter) -> Dict[str, Any]:
+    latencies: List[float] = []
+    errors = 0
+    next_index = 0
+
+    async def worker():
+        nonlocal next_index, errors
+        while next_index < requests:
+            index = next_index
+            next_index += 1
+            start = time.perf_counter()
+            response = await scenario(client, player_ids[index % len(player_ids)], index)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                errors += 1
+
+    ops_before = counter.count
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - start
+    ops = counter.count - ops_before
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "seconds": round(elapsed, 4),
+        "throughput_rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 3),
+        "db_ops_per_request": round(ops / len(latencies), 3)
+    }
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except Exception:
+        return "unknown"
+
+async def main(args) -> Dict[str, Any]:
+    counter = OperationCounter()
+    db, storage = open_storage(args, counter)
+    bind_app(db, storage)
+
+    results: Dict[str, Any] = {}
+    async with server.lifespan(server.app):
+        player_ids = await seed_players(db, storage, args.players)
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for name in args.endpoints:
+                results[name] = await run_phase(
+                    client, SCENARIOS[name], player_ids, args.requests, args.concurrency, counter
+                )
+                row = results[name]
+                print(f"{name:<20} {row['throughput_rps']:>9.1f} rps  p50 {row['p50_ms']:>8.2f} ms  "
+                      f"p95 {row['p95_ms']:>8.2f} ms  p99 {row['p99_ms']:>8.2f} ms  "
+                      f"{row['db_ops_per_request']:>6.2f} ops/req  {row['errors']} errors")
+
+    return {
+        "revision": git_revision(),
+        "timestamp": datetime.utcnow().isoformat(),
+        "backend": args.mongo_url if args.backend == "mongo" else args.backend,
+        "concurrency": args.concurrency,
+        "players": args.players,
+        "requests_per_endpoint": args.requests,
+        "results": results
+    }
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="In-process load benchmark for /api/game/* endpoints")
+    parser.add_argument("--mongo-url", default=os.environ.get("BENCH_MONGO_URL", "mongodb://localhost:27017"))
+    parser.add_argument("--db-name", default="bench")
+    parser.add_argument("--backend", choices=["mongo", "mongomock", "memory"], default="mongo")
+    parser.add_argument("--fake", action="store_const", dest="backend", const="mongomock",
+                        help="shorthand for --backend mongomock")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--players", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=1000, help="requests per endpoint")
+    parser.add_argument("--endpoints", nargs="+", default=list(SCENARIOS), choices=list(SCENARIOS))
+    parser.add_argument("--output", help="write JSON results to this file")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    arguments = parse_args()
+    report = asyncio.run(main(arguments))
+    if arguments.output:
+        with open(arguments.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {arguments.output}")
@@ -0,0 +1,120 @@
+"""Micro-benchmark: default FastAPI response path vs the fast JSON path.
+
+Run from the backend directory:
+
+    python -m benchmarks.serialization [--iterations N] [--levels N]
+"""
+import argparse
+import asyncio
+import time
+from datetime import datetime
+from typing import Callable, Awaitable
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from models import (
+    GameLevel, PlayerGameState, LevelProgress, GameStateResponse, LevelListResponse
+)
+from responses import FastJSONResponse
+
+def make_level_doc(order: int) -> dict:
+    """A level document shaped like the seeded 'Final Grasp' level"""
+    return {
+        "id": f"level{order}",
+        "name": f"Level {order}",
+        "description": "Master all abilities",
+        "mechanics": ["basic_movement", "grab_release", "gravity_shift", "teleporters", "time_challenge"],
+        "balls": [
+            {"id": "ball1", "position": [-3, 2, 0], "color": "#fd79a8"},
+            {"id": "ball2", "position": [3, 2, 0], "color": "#6c5ce7"}
+        ],
+        "targets": [{"id": "target1", "position": [0, 5, 0], "size": [2, 0.5, 2]}],
+        "teleporters": [
+            {"id": "portal1", "position": [-1, 0, 0], "linked_to": "portal2", "color": "#a29bfe"},
+            {"id": "portal2", "position": [1, 0, 0], "linked_to": "portal1", "color": "#a29bfe"}
+        ],
+        "enemy_hands": [
+            {"id": "shadow1", "position": [2, 1, 0], "behavior": "patrol",
+             "patrol_path": [[2, 1, 0], [2, 1, 2], [2, 1, -2]]}
+        ],
+        "gravity": [0, -9.81, 0],
+        "gravity_shift_trigger": {"time": 15000, "new_gravity": [9.81, 0, 0]},
+        "time_limit": 60000,
+        "voiceover": "The hand knows its purpose... one final reach...",
+        "environment": "ethereal",
+        "order": order,
+        "created_at": datetime.utcnow(),
+        "updated_at": datetime.utcnow()
+    }
+
+def make_state_doc(levels: int) -> dict:
+    """A player state document with progress on every level"""
+    return PlayerGameState(
+        player_id="bench",
+        completed_levels=[f"level{i}" for i in range(1, levels + 1)],
+        unlocked_levels=[f"level{i}" for i in range(1, levels + 1)],
+        level_progress=[
+            LevelProgress(level_id=f"level{i}", completed=True, best_time=20000 + i, attempts=3,
+                          last_played=datetime.utcnow())
+            for i in range(1, levels + 1)
+        ]
+    ).model_dump()
+
+async def default_response(response_model, content) -> bytes:
+    """What FastAPI does for a route declared with response_model"""
+    field = create_response_field(name="response", type_=response_model)
+    body = await serialize_response(field=field, response_content=content, is_coroutine=True)
+    return JSONResponse(body).body
+
+async def bench(name: str, func: Callable[[], Awaitable[bytes]], iterations: int):
+    await func()  # warm up
+    start = time.perf_counter()
+    for _ in range(iterations):
+        size = len(await func())
+    elapsed = time.perf_counter() - start
+    print(f"{name:<28} {elapsed / iterations * 1e6:10.1f} us/op  {size:8d} bytes")
+    return elapsed
+
+async def main(iterations: int, level_count: int):
+    # The catalog cache validates levels once at load time
+    levels = [GameLevel(**make_level_doc(order)) for order in range(1, level_count + 1)]
+    state_doc = make_state_doc(level_count)
+
+    async def levels_default():
+        return await default_response(
+            LevelListResponse,
+            LevelListResponse(success=True, data=levels, message="Levels retrieved successfully")
+        )
+
+    async def levels_fast():
+        return FastJSONResponse(
+            {"success": True, "data": levels, "message": "Levels retrieved successfully"}
+        ).body
+
+    async def state_default():
+        return await default_response(
+            GameStateResponse,
+            GameStateResponse(success=True, data=PlayerGameState(**state_doc),
+                              message="Game state retrieved successfully")
+        )
+
+    async def state_fast():
+        return FastJSONResponse(
+            {"success": True, "data": state_doc, "message": "Game state retrieved successfully"}
+        ).body
+
+    print(f"{iterations} iterations, {level_count} levels")
+    for route, default, fast in [("/game/levels", levels_default, levels_fast),
+                                 ("/game/state", state_default, state_fast)]:
+        slow = await bench(f"{route} default", default, iterations)
+        quick = await bench(f"{route} fast", fast, iterations)
+        print(f"{route:<28} {slow / quick:10.1f}x speed-up")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--levels", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(main(args.iterations, args.levels))
@@ -0,0 +1,199 @@
+from typing import List, Dict, Any
+import hashlib
+import json
+
+# Default game catalog. Edit these lists to change the catalog: startup
+# compares CATALOG_MANIFEST_VERSION with the stored version and upserts the
+# documents by id when they differ. created_at/updated_at are set on write.
+
+DEFAULT_LEVELS = [
+    {
+        "id": "level1",
+        "name": "First Touch",
+        "description": "Learn to grasp and release",
+        "mechanics": ["basic_movement", "grab_release"],
+        "balls": [{"id": "ball1", "position": [0, 2, 0], "color": "#ff6b6b"}],
+        "targets": [{"id": "target1", "position": [3, 0, 0], "size": [1, 0.5, 1]}],
+        "gravity": [0, -9.81, 0],
+        "voiceover": "A hand... reaches through the void...",
+        "environment": "minimal",
+        "order": 1
+    },
+    {
+        "id": "level2",
+        "name": "Gravity Shift",
+        "description": "Gravity changes direction",
+        "mechanics": ["basic_movement", "grab_release", "gravity_shift"],
+        "balls": [
+            {"id": "ball1", "position": [-2, 2, 0], "color": "#4ecdc4"},
+            {"id": "ball2", "position": [2, 2, 0], "color": "#45b7d1"}
+        ],
+        "targets": [{"id": "target1", "position": [0, 3, 0], "size": [1, 0.5, 1]}],
+        "gravity": [0, -9.81, 0],
+        "gravity_shift_trigger": {"time": 10000, "new_gravity": [0, 9.81, 0]},
+        "voiceover": "Reality bends... up becomes down...",
+        "environment": "floating",
+        "order": 2
+    },
+    {
+        "id": "level3",
+        "name": "Portal Maze",
+        "description": "Navigate through teleporters",
+        "mechanics": ["basic_movement", "grab_release", "teleporters"],
+        "balls": [{"id": "ball1", "position": [0, 2, 0], "color": "#96ceb4"}],
+        "targets": [{"id": "target1", "position": [8, 0, 0], "size": [1, 0.5, 1]}],
+        "teleporters": [
+            {"id": "portal1", "position": [2, 0, 0], "linked_to": "portal2", "color": "#ff9ff3"},
+            {"id": "portal2", "position": [6, 0, 0], "linked_to": "portal1", "color": "#ff9ff3"}
+        ],
+        "gravity": [0, -9.81, 0],
+        "voiceover": "Tears in space... pathways between worlds...",
+        "environment": "mystical",
+        "order": 3
+    },
+    {
+        "id": "level4",
+        "name": "Shadow Dance",
+        "description": "Avoid the shadow hands",
+        "mechanics": ["basic_movement", "grab_release", "enemy_hands"],
+        "balls": [{"id": "ball1", "position": [0, 2, 0], "color": "#ffeaa7"}],
+        "targets": [{"id": "target1", "position": [5, 0, 0], "size": [1, 0.5, 1]}],
+        "enemy_hands": [
+            {
+                "id": "shadow1",
+                "position": [2, 1, 0],
+                "behavior": "patrol",
+                "patrol_path": [[2, 1, 0], [2, 1, 2], [2, 1, -2]]
+            }
+        ],
+        "gravity": [0, -9.81, 0],
+        "voiceover": "Others have come before... they guard jealously...",
+        "environment": "dark",
+        "order": 4
+    },
+    {
+        "id": "level5",
+        "name": "Final Grasp",
+        "description": "Master all abilities",
+        "mechanics": ["basic_movement", "grab_release", "gravity_shift", "teleporters", "time_challenge"],
+        "balls": [
+            {"id": "ball1", "position": [-3, 2, 0], "color": "#fd79a8"},
+            {"id": "ball2", "position": [3, 2, 0], "color": "#6c5ce7"}
+        ],
+        "targets": [{"id": "target1", "position": [0, 5, 0], "size": [2, 0.5, 2]}],
+        "teleporters": [
+            {"id": "portal1", "position": [-1, 0, 0], "linked_to": "portal2", "color": "#a29bfe"},
+            {"id": "portal2", "position": [1, 0, 0], "linked_to": "portal1", "color": "#a29bfe"}
+        ],
+        "gravity": [0, -9.81, 0],
+        "gravity_shift_trigger": {"time": 15000, "new_gravity": [9.81, 0, 0]},
+        "time_limit": 60000,
+        "voiceover": "The hand knows its purpose... one final reach...",
+        "environment": "ethereal",
+        "order": 5
+    }
+]
+
+DEFAULT_HAND_SKINS = [
+    {
+        "id": "default",
+        "name": "Human",
+        "description": "The original hand",
+        "texture": "human",
+        "color": "#fdbcb4",
+        "metallic": 0.1,
+        "roughness": 0.8
+    },
+    {
+        "id": "robotic",
+        "name": "Cybernetic",
+        "description": "Steel and circuits",
+        "texture": "metal",
+        "color": "#8c9eff",
+        "metallic": 0.9,
+        "roughness": 0.1,
+        "unlock_requirement": "complete_level_2"
+    },
+    {
+        "id": "ethereal",
+        "name": "Ethereal",
+        "description": "Translucent and mystical",
+        "texture": "glass",
+        "color": "#e1f5fe",
+        "metallic": 0.0,
+        "roughness": 0.0,
+        "opacity": 0.7,
+        "unlock_requirement": "complete_level_3"
+    },
+    {
+        "id": "wooden",
+        "name": "Wooden",
+        "description": "Carved from ancient oak",
+        "texture": "wood",
+        "color": "#8d6e63",
+        "metallic": 0.0,
+        "roughness": 0.9,
+        "unlock_requirement": "complete_level_4"
+    },
+    {
+        "id": "shadow",
+        "name": "Shadow",
+        "description": "Darkness incarnate",
+        "texture": "shadow",
+        "color": "#424242",
+        "metallic": 0.0,
+        "roughness": 0.3,
+        "unlock_requirement": "complete_all_levels"
+    }
+]
+
+DEFAULT_ACHIEVEMENTS = [
+    {
+        "id": "first_touch",
+        "name": "First Touch",
+        "description": "Complete your first level",
+        "icon": "👋",
+        "unlock_condition": "complete_level_1"
+    },
+    {
+        "id": "gravity_master",
+        "name": "Gravity Master",
+        "description": "Complete a level with gravity shift",
+        "icon": "🌀",
+        "unlock_condition": "complete_level_2"
+    },
+    {
+        "id": "portal_runner",
+        "name": "Portal Runner",
+        "description": "Use teleporters 10 times",
+        "icon": "🌌",
+        "unlock_condition": "teleports_10"
+    },
+    {
+        "id": "speed_demon",
+        "name": "Speed Demon",
+        "description": "Complete any level in under 30 seconds",
+        "icon": "⚡",
+        "unlock_condition": "fast_completion_30s"
+    },
+    {
+        "id": "perfectionist",
+        "name": "Perfectionist",
+        "description": "Complete all levels",
+        "icon": "✨",
+        "unlock_condition": "complete_all_levels"
+    }
+]
+
+CATALOG_MANIFEST: Dict[str, List[Dict[str, Any]]] = {
+    "levels": DEFAULT_LEVELS,
+    "hand_skins": DEFAULT_HAND_SKINS,
+    "achievements": DEFAULT_ACHIEVEMENTS
+}
+
+def manifest_version(manifest: Dict[str, List[Dict[str, Any]]]) -> str:
+    """Content hash of a catalog manifest"""
+    canonical = json.dumps(manifest, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:16]
+
+CATALOG_MANIFEST_VERSION = manifest_version(CATALOG_MANIFEST)
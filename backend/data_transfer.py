@@ -0,0 +1,366 @@
+"""Streaming export and import of player_game_state and game_sessions.
+
+Documents are read with a cursor in batches of ``--batch-size``, validated
+against the models in models.py and written as NDJSON (gzip-compressed when
+the file name ends in .gz) or as a directory of zstd-compressed Parquet part
+files. Imports validate every record and upsert it with unordered bulk writes
+of ``--chunk-size`` documents. Memory use is bounded by the batch and chunk
+sizes, not by the size of the collection.
+
+Both directions save a checkpoint file after each durable step and delete it
+when they finish; rerun with ``--resume`` to continue an interrupted run.
+Imports are upserts keyed by player_id (player_game_state) or id
+(game_sessions), so replaying part of a file is harmless.
+
+Run from the backend directory (MONGO_URL and DB_NAME come from the
+environment or .env):
+
+    python data_transfer.py export player_game_state backup/players.ndjson.gz
+    python data_transfer.py export game_sessions backup/sessions --format parquet
+    python data_transfer.py import player_game_state backup/players.ndjson.gz --resume
+"""
+import asyncio
+import gzip
+import json
+import logging
+import os
+import types
+import typing
+from datetime import datetime
+from enum import Enum
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Type
+
+import typer
+from bson import json_util
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from pydantic import BaseModel, ValidationError
+from pymongo import ReplaceOne
+from pymongo.errors import BulkWriteError
+
+from models import GameSession, PlayerGameState
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - only needed for --format parquet
+    pa = pq = None
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+logger = logging.getLogger(__name__)
+
+class Collection(str, Enum):
+    player_game_state = "player_game_state"
+    game_sessions = "game_sessions"
+
+class Format(str, Enum):
+    ndjson = "ndjson"
+    parquet = "parquet"
+
+# Model each collection is validated against, and the unique field imports upsert on
+COLLECTION_MODELS: Dict[str, Type[BaseModel]] = {
+    "player_game_state": PlayerGameState,
+    "game_sessions": GameSession
+}
+COLLECTION_KEYS = {
+    "player_game_state": "player_id",
+    "game_sessions": "id"
+}
+
+def infer_format(path: Path) -> Format:
+    """Parquet for directories and .parquet files, NDJSON otherwise"""
+    if path.is_dir() or path.suffix == ".parquet":
+        return Format.parquet
+    return Format.ndjson
+
+def load_checkpoint(path: Path) -> Optional[Dict[str, Any]]:
+    if not path.exists():
+        return None
+    return json.loads(path.read_text())
+
+def save_checkpoint(path: Path, state: Dict[str, Any]):
+    """Write the checkpoint atomically so a crash never leaves half a file"""
+    temporary = path.with_name(path.name + ".tmp")
+    temporary.write_text(json.dumps(state))
+    os.replace(temporary, path)
+
+# Columnar layout
+def _scalar_type(annotation: Any):
+    """Arrow type for a scalar model field, or None for fields stored as JSON"""
+    if typing.get_origin(annotation) in (typing.Union, types.UnionType):
+        args = [arg for arg in typing.get_args(annotation) if arg is not type(None)]
+        if len(args) != 1:
+            return None
+        annotation = args[0]
+    return {
+        str: pa.string(),
+        int: pa.int64(),
+        float: pa.float64(),
+        bool: pa.bool_(),
+        datetime: pa.timestamp("us")
+    }.get(annotation)
+
+class ColumnLayout:
+    """Arrow schema derived from a model: scalar fields become typed columns,
+    lists and nested models become JSON string columns"""
+    def __init__(self, model: Type[BaseModel]):
+        if pa is None:
+            raise RuntimeError("Parquet support needs pyarrow (pip install pyarrow)")
+        fields = []
+        self.json_fields = set()
+        for name, field in model.model_fields.items():
+            arrow_type = _scalar_type(field.annotation)
+            if arrow_type is None:
+                arrow_type = pa.string()
+                self.json_fields.add(name)
+            fields.append(pa.field(name, arrow_type))
+        self.schema = pa.schema(fields)
+
+    def to_table(self, records: List[BaseModel]):
+        rows = []
+        for record in records:
+            row = record.model_dump(exclude=self.json_fields)
+            for name, value in record.model_dump(mode="json", include=self.json_fields).items():
+                row[name] = json.dumps(value)
+            rows.append(row)
+        return pa.Table.from_pylist(rows, schema=self.schema)
+
+    def from_rows(self, rows: List[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        for row in rows:
+            for name in self.json_fields:
+                if row.get(name) is not None:
+                    row[name] = json.loads(row[name])
+            yield row
+
+# Writers. write() returns True when everything written so far is durable
+# and the position can be checkpointed
+class NdjsonWriter:
+    """Appends one JSON document per line; with compression each batch is its
+    own gzip member, so the file can be cut back to any checkpoint"""
+    def __init__(self, path: Path, checkpoint: Optional[Dict[str, Any]]):
+        self.compress = path.suffix == ".gz"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if checkpoint:
+            self.file = open(path, "r+b")
+            self.file.truncate(checkpoint["offset"])
+            self.file.seek(checkpoint["offset"])
+        else:
+            self.file = open(path, "wb")
+
+    def write(self, records: List[BaseModel]) -> bool:
+        data = b"".join(record.model_dump_json().encode() + b"\n" for record in records)
+        self.file.write(gzip.compress(data) if self.compress else data)
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        return True
+
+    def state(self) -> Dict[str, Any]:
+        return {"offset": self.file.tell()}
+
+    def close(self):
+        self.file.close()
+
+class ParquetWriter:
+    """Writes part-NNNNN.parquet files of up to ``part_rows`` rows, one row
+    group per batch. Parts are renamed into place only once complete"""
+    def __init__(self, directory: Path, model: Type[BaseModel], part_rows: int,
+                 checkpoint: Optional[Dict[str, Any]]):
+        self.layout = ColumnLayout(model)
+        self.directory = directory
+        self.part_rows = part_rows
+        self.parts = checkpoint["parts"] if checkpoint else 0
+        directory.mkdir(parents=True, exist_ok=True)
+        # Drop anything written after the checkpoint
+        for path in list(directory.glob("part-*.parquet")) + list(directory.glob("part-*.tmp")):
+            if path.suffix == ".tmp" or int(path.stem.split("-")[1]) >= self.parts:
+                path.unlink()
+        self.writer = None
+        self.rows = 0
+
+    def _part_path(self, suffix: str) -> Path:
+        return self.directory / f"part-{self.parts:05d}{suffix}"
+
+    def write(self, records: List[BaseModel]) -> bool:
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(self._part_path(".tmp"), self.layout.schema, compression="zstd")
+        self.writer.write_table(self.layout.to_table(records))
+        self.rows += len(records)
+        if self.rows < self.part_rows:
+            return False
+        self._finish_part()
+        return True
+
+    def _finish_part(self):
+        self.writer.close()
+        os.replace(self._part_path(".tmp"), self._part_path(".parquet"))
+        self.writer = None
+        self.rows = 0
+        self.parts += 1
+
+    def state(self) -> Dict[str, Any]:
+        return {"parts": self.parts}
+
+    def close(self):
+        if self.writer is not None:
+            self._finish_part()
+
+# Readers
+def read_ndjson(path: Path) -> Iterator[Dict[str, Any]]:
+    opener = gzip.open if path.suffix == ".gz" else open
+    with opener(path, "rb") as file:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+
+def read_parquet(path: Path, model: Type[BaseModel], batch_size: int) -> Iterator[Dict[str, Any]]:
+    layout = ColumnLayout(model)
+    parts = sorted(path.glob("part-*.parquet")) if path.is_dir() else [path]
+    for part in parts:
+        for batch in pq.ParquetFile(part).iter_batches(batch_size=batch_size):
+            yield from layout.from_rows(batch.to_pylist())
+
+async def export_collection(db, collection: str, output: Path, format: Format, batch_size: int = 1000,
+                            part_rows: int = 100000, checkpoint_path: Optional[Path] = None,
+                            resume: bool = False) -> Dict[str, int]:
+    """Stream a collection to a file in _id order, checkpointing as it goes"""
+    model = COLLECTION_MODELS[collection]
+    checkpoint_path = checkpoint_path or output.with_name(output.name + ".checkpoint")
+    checkpoint = load_checkpoint(checkpoint_path) if resume else None
+    if format == Format.parquet:
+        writer = ParquetWriter(output, model, part_rows, checkpoint)
+    else:
+        writer = NdjsonWriter(output, checkpoint)
+
+    exported = checkpoint["exported"] if checkpoint else 0
+    invalid = checkpoint["invalid"] if checkpoint else 0
+    query = {"_id": {"$gt": json_util.loads(checkpoint["last_id"])}} if checkpoint else {}
+    cursor = db[collection].find(query).sort("_id", 1).batch_size(batch_size)
+
+    async def write(batch: List[BaseModel], last_id: Any):
+        nonlocal exported
+        exported += len(batch)
+        if writer.write(batch):
+            save_checkpoint(checkpoint_path, {
+                "last_id": json_util.dumps(last_id),
+                "exported": exported,
+                "invalid": invalid,
+                **writer.state()
+            })
+            logger.info(f"Exported {exported} {collection} documents")
+
+    batch: List[BaseModel] = []
+    async for document in cursor:
+        last_id = document.pop("_id")
+        try:
+            batch.append(model(**document))
+        except ValidationError as e:
+            invalid += 1
+            logger.warning(f"Skipping invalid {collection} document {last_id}: {e.error_count()} errors")
+        if len(batch) >= batch_size:
+            await write(batch, last_id)
+            batch = []
+    if batch:
+        await write(batch, last_id)
+    writer.close()
+    checkpoint_path.unlink(missing_ok=True)
+    return {"exported": exported, "invalid": invalid}
+
+async def import_collection(db, collection: str, source: Path, format: Format, chunk_size: int = 1000,
+                            checkpoint_path: Optional[Path] = None, resume: bool = False) -> Dict[str, int]:
+    """Validate and upsert the records of a file in unordered bulk writes"""
+    model = COLLECTION_MODELS[collection]
+    key = COLLECTION_KEYS[collection]
+    checkpoint_path = checkpoint_path or source.with_name(source.name + ".import-checkpoint")
+    checkpoint = load_checkpoint(checkpoint_path) if resume else None
+    counts = checkpoint["counts"] if checkpoint else {"records": 0, "written": 0, "invalid": 0, "failed": 0}
+    skip = counts["records"]
+
+    if format == Format.parquet:
+        records = read_parquet(source, model, chunk_size)
+    else:
+        records = read_ndjson(source)
+
+    operations: List[ReplaceOne] = []
+
+    async def flush():
+        try:
+            result = await db[collection].bulk_write(operations, ordered=False)
+            counts["written"] += result.upserted_count + result.matched_count
+        except BulkWriteError as e:
+            details = e.details
+            counts["written"] += details.get("nUpserted", 0) + details.get("nMatched", 0)
+            counts["failed"] += len(details.get("writeErrors", []))
+            logger.warning(f"{len(details.get('writeErrors', []))} {collection} writes failed in this chunk")
+        operations.clear()
+        save_checkpoint(checkpoint_path, {"counts": counts})
+        logger.info(f"Imported {counts['records']} {collection} records")
+
+    for index, record in enumerate(records):
+        if index < skip:
+            continue
+        counts["records"] += 1
+        try:
+            document = model(**record).model_dump()
+        except ValidationError as e:
+            counts["invalid"] += 1
+            logger.warning(f"Skipping invalid {collection} record {index}: {e.error_count()} errors")
+            continue
+        operations.append(ReplaceOne({key: document[key]}, document, upsert=True))
+        if len(operations) >= chunk_size:
+            await flush()
+    if operations:
+        await flush()
+    checkpoint_path.unlink(missing_ok=True)
+    return counts
+
+app = typer.Typer(help="Stream game collections to and from NDJSON or Parquet files")
+
+def _database(mongo_url: str, db_name: str):
+    return AsyncIOMotorClient(mongo_url)[db_name]
+
+@app.command("export")
+def export_command(
+    collection: Collection,
+    output: Path = typer.Argument(..., help="NDJSON file (.gz to compress) or Parquet directory"),
+    format: Optional[Format] = typer.Option(None, help="Defaults to parquet for directories and .parquet, else ndjson"),
+    batch_size: int = typer.Option(1000, min=1, help="Documents per cursor batch and written block"),
+    part_rows: int = typer.Option(100000, min=1, help="Rows per Parquet part file"),
+    checkpoint: Optional[Path] = typer.Option(None, help="Defaults to <output>.checkpoint"),
+    resume: bool = typer.Option(False, help="Continue from the checkpoint of an interrupted export"),
+    mongo_url: str = typer.Option(..., envvar="MONGO_URL"),
+    db_name: str = typer.Option(..., envvar="DB_NAME")
+):
+    """Export a collection without loading it into memory"""
+    result = asyncio.run(export_collection(
+        _database(mongo_url, db_name), collection.value, output, format or infer_format(output),
+        batch_size, part_rows, checkpoint, resume
+    ))
+    typer.echo(f"Exported {result['exported']} documents ({result['invalid']} invalid skipped) to {output}")
+
+@app.command("import")
+def import_command(
+    collection: Collection,
+    source: Path = typer.Argument(..., exists=True, help="NDJSON file or Parquet file/directory"),
+    format: Optional[Format] = typer.Option(None, help="Defaults to parquet for directories and .parquet, else ndjson"),
+    chunk_size: int = typer.Option(1000, min=1, help="Documents per bulk write"),
+    checkpoint: Optional[Path] = typer.Option(None, help="Defaults to <source>.import-checkpoint"),
+    resume: bool = typer.Option(False, help="Skip the records an interrupted import already wrote"),
+    mongo_url: str = typer.Option(..., envvar="MONGO_URL"),
+    db_name: str = typer.Option(..., envvar="DB_NAME")
+):
+    """Validate and upsert the records of an export"""
+    result = asyncio.run(import_collection(
+        _database(mongo_url, db_name), collection.value, source, format or infer_format(source),
+        chunk_size, checkpoint, resume
+    ))
+    typer.echo(
+        f"Imported {result['records']} records: {result['written']} written, "
+        f"{result['invalid']} invalid, {result['failed']} failed"
+    )
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    app()
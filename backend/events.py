@@ -0,0 +1,281 @@
+"""Push channel for per-player game events.
+
+GameService publishes compact events (an achievement, hand skin or level
+unlocked) to an EventBroker, and the /api/game/events endpoint streams them
+to the player as server-sent events. Each player holds one stream: opening
+a new one closes the previous one, on any worker.
+
+LocalBroker fans events out inside one process. With several workers, run
+the hub and point every worker's HubBroker at it; the hub relays each
+message to the other workers, standing in for a Redis-style pub/sub broker:
+
+    python events.py hub --address tcp://127.0.0.1:8765
+"""
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple
+from pathlib import Path
+import asyncio
+import json
+import logging
+import uuid
+
+import typer
+
+logger = logging.getLogger(__name__)
+
+# Sent when a stream opens, so older streams of the same player close
+CONNECTED_EVENT = "connected"
+
+class Subscription:
+    """One player's event stream on this worker"""
+    def __init__(self, broker: "LocalBroker", player_id: str, max_pending: int):
+        self.broker = broker
+        self.player_id = player_id
+        self.connection_id = uuid.uuid4().hex
+        self.closed = False
+        self._queue: asyncio.Queue = asyncio.Queue(max_pending)
+
+    def deliver(self, events: List[Dict[str, Any]]):
+        if self.closed:
+            return
+        if self._queue.full():
+            # A client this far behind refetches the state anyway
+            self._queue.get_nowait()
+            self.broker.dropped += 1
+        self._queue.put_nowait(events)
+
+    async def get(self) -> Optional[List[Dict[str, Any]]]:
+        """Next batch of events, or None once the stream is closed"""
+        return await self._queue.get()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        if self._queue.full():
+            self._queue.get_nowait()
+        self._queue.put_nowait(None)
+        self.broker._remove(self)
+
+class EventBroker:
+    """Delivers events published for a player to that player's stream"""
+    async def start(self):
+        """Connect to whatever the broker relays through"""
+
+    async def stop(self):
+        """Close every stream and disconnect"""
+
+    async def subscribe(self, player_id: str) -> Subscription:
+        """Open the player's stream, closing any stream they already have"""
+        raise NotImplementedError
+
+    async def publish(self, player_id: str, events: List[Dict[str, Any]]):
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, Any]:
+        return {}
+
+class LocalBroker(EventBroker):
+    """In-process fan-out to the streams open on this worker"""
+    def __init__(self, max_pending: int = 100):
+        self.max_pending = max_pending
+        self._subscriptions: Dict[str, Subscription] = {}
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+
+    async def stop(self):
+        for subscription in list(self._subscriptions.values()):
+            subscription.close()
+
+    async def subscribe(self, player_id: str) -> Subscription:
+        subscription = Subscription(self, player_id, self.max_pending)
+        connected = [{"type": CONNECTED_EVENT, "connection_id": subscription.connection_id}]
+        self._deliver(player_id, connected)
+        self._subscriptions[player_id] = subscription
+        # Streams of this player on other workers close when they see this
+        await self._relay(player_id, connected)
+        return subscription
+
+    def _remove(self, subscription: Subscription):
+        if self._subscriptions.get(subscription.player_id) is subscription:
+            del self._subscriptions[subscription.player_id]
+
+    async def publish(self, player_id: str, events: List[Dict[str, Any]]):
+        if not events:
+            return
+        self.published += 1
+        self._deliver(player_id, events)
+        await self._relay(player_id, events)
+
+    async def _relay(self, player_id: str, events: List[Dict[str, Any]]):
+        """Pass a message to the other workers (nothing to do in-process)"""
+
+    def _deliver(self, player_id: str, events: List[Dict[str, Any]]):
+        subscription = self._subscriptions.get(player_id)
+        if not subscription:
+            return
+        connected = next((event for event in events if event["type"] == CONNECTED_EVENT), None)
+        if connected:
+            # A newer stream replaces this one
+            if connected["connection_id"] != subscription.connection_id:
+                subscription.close()
+            return
+        subscription.deliver(events)
+        self.delivered += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "subscribers": len(self._subscriptions),
+            "published": self.published,
+            "delivered": self.delivered,
+            "dropped": self.dropped
+        }
+
+def _parse_address(address: str) -> Tuple[str, Any]:
+    """("unix", path) for unix:///path, ("tcp", (host, port)) for tcp://host:port"""
+    if address.startswith("unix://"):
+        return "unix", address[len("unix://"):]
+    host, _, port = address.removeprefix("tcp://").rpartition(":")
+    return "tcp", (host or "127.0.0.1", int(port))
+
+async def _open_connection(address: str):
+    kind, target = _parse_address(address)
+    if kind == "unix":
+        return await asyncio.open_unix_connection(target)
+    return await asyncio.open_connection(*target)
+
+class HubBroker(LocalBroker):
+    """LocalBroker that also relays every message through the event hub, so
+    streams held by other workers receive it. Messages published while the
+    hub is unreachable reach this worker's streams only"""
+    def __init__(self, address: str, max_pending: int = 100, reconnect_interval: float = 1.0):
+        super().__init__(max_pending)
+        self.address = address
+        self.reconnect_interval = reconnect_interval
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._task: Optional[asyncio.Task] = None
+        self.relay_errors = 0
+
+    async def start(self):
+        if not self._task:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await super().stop()
+
+    async def _run(self):
+        """Read messages relayed from other workers, reconnecting when the hub goes away"""
+        while True:
+            try:
+                reader, self._writer = await _open_connection(self.address)
+                logger.info(f"Connected to event hub at {self.address}")
+                while line := await reader.readline():
+                    message = json.loads(line)
+                    self._deliver(message["player_id"], message["events"])
+                logger.warning("Event hub closed the connection")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Event hub connection error: {e}")
+            finally:
+                if self._writer:
+                    self._writer.close()
+                self._writer = None
+            await asyncio.sleep(self.reconnect_interval)
+
+    async def _relay(self, player_id: str, events: List[Dict[str, Any]]):
+        if not self._writer:
+            self.relay_errors += 1
+            return
+        try:
+            self._writer.write(json.dumps({"player_id": player_id, "events": events}).encode() + b"\n")
+            await self._writer.drain()
+        except Exception as e:
+            self.relay_errors += 1
+            logger.error(f"Error relaying event: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {**super().stats(), "hub_connected": int(self._writer is not None), "relay_errors": self.relay_errors}
+
+async def run_hub(address: str, max_buffer_bytes: int = 1024 * 1024):
+    """Relay every line a worker sends to all the other connected workers.
+
+    A worker that falls ``max_buffer_bytes`` behind is disconnected rather
+    than buffered for without bound; its HubBroker reconnects, and the
+    events it missed reach only the streams on the publishing worker. A
+    burst of up to 128 KiB read from one worker is relayed before any of it
+    is sent, so keep the limit well above that.
+    """
+    workers: Set[asyncio.StreamWriter] = set()
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        workers.add(writer)
+        try:
+            while line := await reader.readline():
+                for other in list(workers):
+                    if other is writer:
+                        continue
+                    other.write(line)
+                    if other.transport.get_write_buffer_size() > max_buffer_bytes:
+                        logger.warning(f"Disconnecting a worker more than {max_buffer_bytes} bytes behind")
+                        workers.discard(other)
+                        # Aborted, as closing would wait to flush the backlog
+                        other.transport.abort()
+        except ConnectionError:
+            pass
+        finally:
+            workers.discard(writer)
+            writer.close()
+
+    kind, target = _parse_address(address)
+    if kind == "unix":
+        Path(target).unlink(missing_ok=True)
+        server = await asyncio.start_unix_server(handle, target)
+    else:
+        server = await asyncio.start_server(handle, *target)
+    logger.info(f"Event hub listening on {address}")
+    async with server:
+        await server.serve_forever()
+
+async def sse_stream(subscription: Subscription, keepalive: float = 15.0) -> AsyncIterator[str]:
+    """Server-sent events for a subscription, with comment lines as keepalives"""
+    try:
+        yield f"event: {CONNECTED_EVENT}\ndata: {json.dumps({'connection_id': subscription.connection_id})}\n\n"
+        while True:
+            try:
+                events = await asyncio.wait_for(subscription.get(), keepalive)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            if events is None:
+                return
+            yield f"data: {json.dumps(events, separators=(',', ':'))}\n\n"
+    finally:
+        subscription.close()
+
+cli = typer.Typer(help="Event relay for multi-worker deployments")
+
+@cli.callback()
+def callback():
+    # Keeps "hub" a named subcommand; Typer runs a lone command without its name
+    pass
+
+@cli.command("hub")
+def hub_command(
+    address: str = typer.Option("tcp://127.0.0.1:8765", envvar="EVENT_HUB_ADDRESS"),
+    max_buffer_kb: int = typer.Option(1024, envvar="EVENT_HUB_MAX_BUFFER_KB",
+                                      help="Unsent KB after which a slow worker is disconnected")
+):
+    """Run the hub that relays events between workers"""
+    asyncio.run(run_hub(address, max_buffer_kb * 1024))
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    cli()
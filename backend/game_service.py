@@ -1,265 +1,269 @@
-from typing import List, Optional, Dict, Any
-from datetime import datetime
-from motor.motor_asyncio import AsyncIOMotorDatabase
+from typing import List, Optional, Dict, Any, Tuple, Callable, Awaitable
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from responses import PrecomputedBody
+from storage import GameStorage, PartialWriteError, progress_entries, changed_since
+from leaderboard import LeaderboardService
+from analytics import AnalyticsService
+from events import EventBroker, LocalBroker
+from metrics import validation_timer
+from catalog_manifest import CATALOG_MANIFEST, CATALOG_MANIFEST_VERSION
+from unlocks import UnlockRegistry, Dependency, completion_changes, stat_changes
+from replay import ReplayVerifier, ReplayRejected, ReplayUnavailable, REPLAY_MODES
+from single_flight import SingleFlight, KeyedLocks
+from level_bundle import LevelBundle, level_bodies
+import asyncio
+import time
+import uuid
 from models import (
     PlayerGameState, GameLevel, HandSkin, Achievement, GameSession,
-    LevelProgress, GameStatistics, LevelCompleteRequest,
-    UpdateSettingsRequest, StartGameSessionRequest, UpdateGameStatsRequest
+    LevelProgress, GameStatistics, LevelCompleteRequest, LevelAnalytics, DailyAnalytics,
+    UpdateSettingsRequest, StartGameSessionRequest, UpdateGameStatsRequest,
+    SessionHeartbeatRequest, EndGameSessionRequest
 )
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Fields needed to evaluate unlock conditions without loading the whole state
+UNLOCK_STATE_FIELDS = [
+    "player_id",
+    "completed_levels",
+    "unlocked_hand_skins",
+    "unlocked_achievements",
+    "statistics"
+]
+
+class UnknownLevel(LookupError):
+    """A request naming a level that is not in the catalog"""
+
+class StatsNotApplied(Exception):
+    """Stat increments that were not written and can safely be retried"""
+    def __init__(self, deltas: Dict[str, UpdateGameStatsRequest]):
+        super().__init__(f"Stats increments for {len(deltas)} players were not applied")
+        self.deltas = deltas
+
+class CatalogCache:
+    """In-process snapshot of the static catalog (levels, hand skins, achievements)"""
+    def __init__(self):
+        self.version: Optional[int] = None
+        self.levels: List[GameLevel] = []
+        self.levels_by_id: Dict[str, GameLevel] = {}
+        self.next_level_ids: Dict[str, str] = {}
+        self.hand_skins: List[HandSkin] = []
+        self.hand_skins_by_id: Dict[str, HandSkin] = {}
+        self.achievements: List[Achievement] = []
+        self.achievements_by_id: Dict[str, Achievement] = {}
+        self.unlocks = UnlockRegistry([], [], 0)
+        # Serialized catalog responses, keyed by catalog name or by
+        # level/<id>, render_level/<id> and layout/<id>
+        self.bodies: Dict[str, PrecomputedBody] = {}
+        self.level_bundle: Optional[LevelBundle] = None
+        self.checked_at: float = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+
+    @property
+    def loaded(self) -> bool:
+        return self.version is not None
+
+    def load(self, version: int, levels: List[GameLevel], hand_skins: List[HandSkin], achievements: List[Achievement],
+             level_bundle: Optional[LevelBundle] = None):
+        """Replace the snapshot and rebuild the lookup indexes.
+
+        With a level bundle, the levels and their responses come from the
+        bundle and the levels argument is ignored.
+        """
+        self.levels = level_bundle.levels() if level_bundle else sorted(levels, key=lambda level: level.order)
+        self.levels_by_id = {level.id: level for level in self.levels}
+        self.next_level_ids = {level.id: following.id for level, following in zip(self.levels, self.levels[1:])}
+        self.hand_skins = hand_skins
+        self.hand_skins_by_id = {skin.id: skin for skin in hand_skins}
+        self.achievements = achievements
+        self.achievements_by_id = {achievement.id: achievement for achievement in achievements}
+        self.unlocks = UnlockRegistry(hand_skins, achievements, len(self.levels))
+        self.bodies = {
+            "hand_skins": PrecomputedBody(
+                {"success": True, "data": hand_skins, "message": "Hand skins retrieved successfully"}
+            ),
+            "achievements": PrecomputedBody(
+                {"success": True, "data": achievements, "message": "Achievements retrieved successfully"}
+            )
+        }
+        if level_bundle:
+            self.bodies.update(level_bundle.bodies())
+        else:
+            self.bodies.update({name: PrecomputedBody(content) for name, content in level_bodies(self.levels).items()})
+        self.level_bundle = level_bundle
+        self.version = version
+        self.checked_at = time.monotonic()
+        self.reloads += 1
+
+    def invalidate(self):
+        """Drop the snapshot so the next lookup reloads from the database"""
+        self.version = None
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "version": self.version,
+            "hits": self.hits,
+            "misses": self.misses,
+            "reloads": self.reloads,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "levels": len(self.levels),
+            "hand_skins": len(self.hand_skins),
+            "achievements": len(self.achievements),
+            "level_bundle": self.level_bundle.version if self.level_bundle else None
+        }
+
 class GameService:
-    def __init__(self, db: AsyncIOMotorDatabase):
-        self.db = db
+    def __init__(self, storage: GameStorage, catalog_check_interval: float = 5.0,
+                 session_ttl: int = 1800, session_retention_days: int = 7,
+                 replay_verifier: Optional[ReplayVerifier] = None, replay_mode: str = "off",
+                 event_broker: Optional[EventBroker] = None, level_bundle: Optional[LevelBundle] = None):
+        if replay_mode not in REPLAY_MODES:
+            raise ValueError(f"Unknown replay verification mode: {replay_mode}")
+        self.storage = storage
+        # Seconds without a heartbeat before an open session is treated as abandoned
+        self.session_ttl = session_ttl
+        # Days ended sessions are kept before being rolled up into daily aggregates
+        self.session_retention_days = session_retention_days
+        # How often (seconds) a worker re-reads the catalog version to pick up
+        # changes made by other workers
+        self.catalog_check_interval = catalog_check_interval
+        # Seconds a crashed worker's seeding lock blocks the others, and how
+        # often waiting workers re-check for the seeded manifest
+        self.seed_lock_ttl = 60.0
+        self.seed_lock_poll_interval = 0.2
+        # Level completions are checked against a replay of the client's
+        # input unless the mode is "off"
+        self.replay_verifier = replay_verifier
+        self.replay_mode = replay_mode if replay_verifier else "off"
+        # Levels served from a prebuilt bundle instead of the levels collection
+        self.level_bundle = level_bundle
+        self.catalog = CatalogCache()
+        self.leaderboard = LeaderboardService(storage)
+        self.analytics = AnalyticsService(storage)
+        # Unlocks are pushed to players' open event streams
+        self.events = event_broker or LocalBroker()
+        # Identical concurrent player reads share one storage call, and each
+        # player's writes run one at a time
+        self.single_flight = SingleFlight()
+        self._player_writes = KeyedLocks()
+        self._catalog_lock = asyncio.Lock()
         
     async def initialize_game_data(self):
         """Initialize the game with default data if not exists"""
-        await self._create_default_levels()
-        await self._create_default_hand_skins()
-        await self._create_default_achievements()
+        await self._seed_catalog()
         await self._ensure_player_game_state()
+        await self._load_catalog()
+
+    async def ensure_indexes(self):
+        """Create the indexes the storage backend needs"""
+        await self.storage.ensure_indexes()
+
+    async def verify_query_plans(self) -> Dict[str, bool]:
+        """Check that the storage backend's hot queries are index-backed"""
+        return await self.storage.verify_query_plans()
+
+    async def _get_catalog_version(self) -> int:
+        """Read the shared catalog version counter"""
+        return await self.storage.get_catalog_version()
+
+    async def bump_catalog_version(self) -> int:
+        """Increment the shared catalog version so every worker reloads its cache"""
+        version = await self.storage.bump_catalog_version()
+        self.catalog.invalidate()
+        return version
+
+    async def _load_catalog(self):
+        """Load levels, hand skins and achievements into the in-process cache"""
+        version = await self._get_catalog_version()
+        levels = await self.storage.load_catalog("levels") if not self.level_bundle else []
+        skins = await self.storage.load_catalog("hand_skins")
+        achievements = await self.storage.load_catalog("achievements")
+        with validation_timer("catalog"):
+            catalog_levels = [GameLevel(**level) for level in levels]
+            catalog_skins = [HandSkin(**skin) for skin in skins]
+            catalog_achievements = [Achievement(**achievement) for achievement in achievements]
+        self.catalog.load(version, catalog_levels, catalog_skins, catalog_achievements, self.level_bundle)
+        logger.info(f"Loaded game catalog version {version}")
+
+    async def _get_catalog(self) -> CatalogCache:
+        """Return the cached catalog, reloading it if another worker changed it"""
+        catalog = self.catalog
+        if catalog.loaded and time.monotonic() - catalog.checked_at < self.catalog_check_interval:
+            catalog.hits += 1
+            return catalog
+
+        async with self._catalog_lock:
+            if catalog.loaded and time.monotonic() - catalog.checked_at < self.catalog_check_interval:
+                catalog.hits += 1
+                return catalog
+            if catalog.loaded:
+                version = await self._get_catalog_version()
+                catalog.checked_at = time.monotonic()
+                if version == catalog.version:
+                    catalog.hits += 1
+                    return catalog
+            catalog.misses += 1
+            await self._load_catalog()
+            return catalog
+
+    async def get_catalog_body(self, name: str) -> PrecomputedBody:
+        """Get the precomputed response for levels, render_levels, hand_skins or achievements"""
+        catalog = await self._get_catalog()
+        return catalog.bodies[name]
+
+    async def get_level_body(self, level_id: str, view: str = "full") -> Optional[PrecomputedBody]:
+        """Get the precomputed response for a single level in the given view"""
+        catalog = await self._get_catalog()
+        return catalog.bodies.get(f"render_level/{level_id}" if view == "render" else f"level/{level_id}")
+
+    async def get_level_layout_body(self, level_id: str) -> Optional[PrecomputedBody]:
+        """Get the precomputed bounds, teleporter links, patrol lengths and neighbours of a level"""
+        catalog = await self._get_catalog()
+        return catalog.bodies.get(f"layout/{level_id}")
+
+    def get_catalog_stats(self) -> Dict[str, Any]:
+        """Get catalog cache hit/miss counters"""
+        return self.catalog.stats()
         
-    async def _create_default_levels(self):
-        """Create default game levels"""
-        existing_levels = await self.db.levels.count_documents({})
-        if existing_levels > 0:
-            return
-            
-        levels = [
-            {
-                "id": "level1",
-                "name": "First Touch",
-                "description": "Learn to grasp and release",
-                "mechanics": ["basic_movement", "grab_release"],
-                "balls": [{"id": "ball1", "position": [0, 2, 0], "color": "#ff6b6b"}],
-                "targets": [{"id": "target1", "position": [3, 0, 0], "size": [1, 0.5, 1]}],
-                "gravity": [0, -9.81, 0],
-                "voiceover": "A hand... reaches through the void...",
-                "environment": "minimal",
-                "order": 1,
-                "created_at": datetime.utcnow(),
-                "updated_at": datetime.utcnow()
-            },
-            {
-                "id": "level2",
-                "name": "Gravity Shift",
-                "description": "Gravity changes direction",
-                "mechanics": ["basic_movement", "grab_release", "gravity_shift"],
-                "balls": [
-                    {"id": "ball1", "position": [-2, 2, 0], "color": "#4ecdc4"},
-                    {"id": "ball2", "position": [2, 2, 0], "color": "#45b7d1"}
-                ],
-                "targets": [{"id": "target1", "position": [0, 3, 0], "size": [1, 0.5, 1]}],
-                "gravity": [0, -9.81, 0],
-                "gravity_shift_trigger": {"time": 10000, "new_gravity": [0, 9.81, 0]},
-                "voiceover": "Reality bends... up becomes down...",
-                "environment": "floating",
-                "order": 2,
-                "created_at": datetime.utcnow(),
-                "updated_at": datetime.utcnow()
-            },
-            {
-                "id": "level3",
-                "name": "Portal Maze",
-                "description": "Navigate through teleporters",
-                "mechanics": ["basic_movement", "grab_release", "teleporters"],
-                "balls": [{"id": "ball1", "position": [0, 2, 0], "color": "#96ceb4"}],
-                "targets": [{"id": "target1", "position": [8, 0, 0], "size": [1, 0.5, 1]}],
-                "teleporters": [
-                    {"id": "portal1", "position": [2, 0, 0], "linked_to": "portal2", "color": "#ff9ff3"},
-                    {"id": "portal2", "position": [6, 0, 0], "linked_to": "portal1", "color": "#ff9ff3"}
-                ],
-                "gravity": [0, -9.81, 0],
-                "voiceover": "Tears in space... pathways between worlds...",
-                "environment": "mystical",
-                "order": 3,
-                "created_at": datetime.utcnow(),
-                "updated_at": datetime.utcnow()
-            },
-            {
-                "id": "level4",
-                "name": "Shadow Dance",
-                "description": "Avoid the shadow hands",
-                "mechanics": ["basic_movement", "grab_release", "enemy_hands"],
-                "balls": [{"id": "ball1", "position": [0, 2, 0], "color": "#ffeaa7"}],
-                "targets": [{"id": "target1", "position": [5, 0, 0], "size": [1, 0.5, 1]}],
-                "enemy_hands": [
-                    {
-                        "id": "shadow1",
-                        "position": [2, 1, 0],
-                        "behavior": "patrol",
-                        "patrol_path": [[2, 1, 0], [2, 1, 2], [2, 1, -2]]
-                    }
-                ],
-                "gravity": [0, -9.81, 0],
-                "voiceover": "Others have come before... they guard jealously...",
-                "environment": "dark",
-                "order": 4,
-                "created_at": datetime.utcnow(),
-                "updated_at": datetime.utcnow()
-            },
-            {
-                "id": "level5",
-                "name": "Final Grasp",
-                "description": "Master all abilities",
-                "mechanics": ["basic_movement", "grab_release", "gravity_shift", "teleporters", "time_challenge"],
-                "balls": [
-                    {"id": "ball1", "position": [-3, 2, 0], "color": "#fd79a8"},
-                    {"id": "ball2", "position": [3, 2, 0], "color": "#6c5ce7"}
-                ],
-                "targets": [{"id": "target1", "position": [0, 5, 0], "size": [2, 0.5, 2]}],
-                "teleporters": [
-                    {"id": "portal1", "position": [-1, 0, 0], "linked_to": "portal2", "color": "#a29bfe"},
-                    {"id": "portal2", "position": [1, 0, 0], "linked_to": "portal1", "color": "#a29bfe"}
-                ],
-                "gravity": [0, -9.81, 0],
-                "gravity_shift_trigger": {"time": 15000, "new_gravity": [9.81, 0, 0]},
-                "time_limit": 60000,
-                "voiceover": "The hand knows its purpose... one final reach...",
-                "environment": "ethereal",
-                "order": 5,
-                "created_at": datetime.utcnow(),
-                "updated_at": datetime.utcnow()
-            }
-        ]
-        
-        await self.db.levels.insert_many(levels)
-        logger.info("Created default game levels")
+    async def _seed_catalog(self):
+        """Apply CATALOG_MANIFEST unless the stored catalog is already at its version.
         
-    async def _create_default_hand_skins(self):
-        """Create default hand skins"""
-        existing_skins = await self.db.hand_skins.count_documents({})
-        if existing_skins > 0:
+        Workers starting together take turns on a lock document; whoever
+        holds it upserts every collection and records the manifest version,
+        and the rest see that version and skip seeding.
+        """
+        if await self.storage.get_catalog_manifest() == CATALOG_MANIFEST_VERSION:
             return
-            
-        hand_skins = [
-            {
-                "id": "default",
-                "name": "Human",
-                "description": "The original hand",
-                "texture": "human",
-                "color": "#fdbcb4",
-                "metallic": 0.1,
-                "roughness": 0.8,
-                "created_at": datetime.utcnow(),
-                "updated_at": datetime.utcnow()
-            },
-            {
-                "id": "robotic",
-                "name": "Cybernetic",
-                "description": "Steel and circuits",
-                "texture": "metal",
-                "color": "#8c9eff",
-                "metallic": 0.9,
-                "roughness": 0.1,
-                "unlock_requirement": "complete_level_2",
-                "created_at": datetime.utcnow(),
-                "updated_at": datetime.utcnow()
-            },
-            {
-                "id": "ethereal",
-                "name": "Ethereal",
-                "description": "Translucent and mystical",
-                "texture": "glass",
-                "color": "#e1f5fe",
-                "metallic": 0.0,
-                "roughness": 0.0,
-                "opacity": 0.7,
-                "unlock_requirement": "complete_level_3",
-                "created_at": datetime.utcnow(),
-                "updated_at": datetime.utcnow()
-            },
-            {
-                "id": "wooden",
-                "name": "Wooden",
-                "description": "Carved from ancient oak",
-                "texture": "wood",
-                "color": "#8d6e63",
-                "metallic": 0.0,
-                "roughness": 0.9,
-                "unlock_requirement": "complete_level_4",
-                "created_at": datetime.utcnow(),
-                "updated_at": datetime.utcnow()
-            },
-            {
-                "id": "shadow",
-                "name": "Shadow",
-                "description": "Darkness incarnate",
-                "texture": "shadow",
-                "color": "#424242",
-                "metallic": 0.0,
-                "roughness": 0.3,
-                "unlock_requirement": "complete_all_levels",
-                "created_at": datetime.utcnow(),
-                "updated_at": datetime.utcnow()
-            }
-        ]
         
-        await self.db.hand_skins.insert_many(hand_skins)
-        logger.info("Created default hand skins")
+        owner = str(uuid.uuid4())
+        while not await self.storage.acquire_seed_lock(owner, self.seed_lock_ttl):
+            await asyncio.sleep(self.seed_lock_poll_interval)
+            if await self.storage.get_catalog_manifest() == CATALOG_MANIFEST_VERSION:
+                return
         
-    async def _create_default_achievements(self):
-        """Create default achievements"""
-        existing_achievements = await self.db.achievements.count_documents({})
-        if existing_achievements > 0:
-            return
-            
-        achievements = [
-            {
-                "id": "first_touch",
-                "name": "First Touch",
-                "description": "Complete your first level",
-                "icon": "👋",
-                "unlock_condition": "complete_level_1",
-                "created_at": datetime.utcnow(),
-                "updated_at": datetime.utcnow()
-            },
-            {
-                "id": "gravity_master",
-                "name": "Gravity Master",
-                "description": "Complete a level with gravity shift",
-                "icon": "🌀",
-                "unlock_condition": "complete_level_2",
-                "created_at": datetime.utcnow(),
-                "updated_at": datetime.utcnow()
-            },
-            {
-                "id": "portal_runner",
-                "name": "Portal Runner",
-                "description": "Use teleporters 10 times",
-                "icon": "🌌",
-                "unlock_condition": "teleports_10",
-                "created_at": datetime.utcnow(),
-                "updated_at": datetime.utcnow()
-            },
-            {
-                "id": "speed_demon",
-                "name": "Speed Demon",
-                "description": "Complete any level in under 30 seconds",
-                "icon": "⚡",
-                "unlock_condition": "fast_completion_30s",
-                "created_at": datetime.utcnow(),
-                "updated_at": datetime.utcnow()
-            },
-            {
-                "id": "perfectionist",
-                "name": "Perfectionist",
-                "description": "Complete all levels",
-                "icon": "✨",
-                "unlock_condition": "complete_all_levels",
-                "created_at": datetime.utcnow(),
-                "updated_at": datetime.utcnow()
-            }
-        ]
-        
-        await self.db.achievements.insert_many(achievements)
-        logger.info("Created default achievements")
+        try:
+            # Another worker may have finished between our check and the lock
+            if await self.storage.get_catalog_manifest() == CATALOG_MANIFEST_VERSION:
+                return
+            now = datetime.utcnow()
+            for collection, documents in CATALOG_MANIFEST.items():
+                changed = await self.storage.upsert_catalog(collection, documents, now)
+                logger.info(f"Seeded {collection}: {changed} documents inserted or updated")
+            await self.storage.bump_catalog_version(CATALOG_MANIFEST_VERSION)
+            self.catalog.invalidate()
+            logger.info(f"Applied catalog manifest {CATALOG_MANIFEST_VERSION}")
+        finally:
+            await self.storage.release_seed_lock(owner)
         
     async def _ensure_player_game_state(self):
         """Ensure player game state exists"""
-        existing_state = await self.db.player_game_state.find_one({"player_id": "default"})
+        existing_state = await self.storage.get_player_state("default", ["player_id"])
         if not existing_state:
             default_state = {
                 "id": "default_state",
@@ -298,155 +302,291 @@ class GameService:
                 "created_at": datetime.utcnow(),
                 "updated_at": datetime.utcnow()
             }
-            await self.db.player_game_state.insert_one(default_state)
-            logger.info("Created default player game state")
+            if await self.storage.insert_player_state(default_state):
+                logger.info("Created default player game state")
+    
+    async def _coalesced(self, player_id: str, key: Tuple, load: Callable[[], Awaitable[Any]]) -> Any:
+        """Run a player read, sharing it with identical reads already in flight"""
+        return await self.single_flight.do(player_id, key, load)
+    
+    @asynccontextmanager
+    async def _player_write(self, player_id: str):
+        """Serialize a write with the player's other writes; reads issued after it see its result"""
+        async with self._player_writes.hold(player_id):
+            try:
+                yield
+            finally:
+                self.single_flight.forget(player_id)
+    
+    def get_coalescing_stats(self) -> Dict[str, Any]:
+        """Get counters for coalesced reads and serialized player writes"""
+        writes = self._player_writes.stats()
+        return {
+            **self.single_flight.stats(),
+            "player_writes": writes["acquired"],
+            "player_write_waits": writes["waits"]
+        }
     
     async def get_game_state(self, player_id: str = "default") -> Optional[PlayerGameState]:
         """Get current game state for player"""
-        state_doc = await self.db.player_game_state.find_one({"player_id": player_id})
-        if state_doc:
-            return PlayerGameState(**state_doc)
-        return None
+        async def load():
+            state_doc = await self.storage.get_player_state(player_id)
+            if state_doc:
+                with validation_timer("PlayerGameState"):
+                    return PlayerGameState(**state_doc)
+            return None
+        return await self._coalesced(player_id, ("state",), load)
+    
+    async def get_game_state_document(self, player_id: str = "default") -> Optional[Dict[str, Any]]:
+        """Get the raw game state document for player, without model validation.
+        
+        Documents are only ever written from PlayerGameState, so the fast
+        response path serves them as-is apart from listing a map-layout
+        level_progress.
+        """
+        async def load():
+            state_doc = await self.storage.get_player_state(player_id)
+            if state_doc:
+                state_doc["level_progress"] = progress_entries(state_doc.get("level_progress"))
+                state_doc.setdefault("revision", 0)
+                state_doc.pop("field_revisions", None)
+            return state_doc
+        return await self._coalesced(player_id, ("document",), load)
+    
+    async def get_game_state_changes(self, player_id: str, since: int) -> Optional[Tuple[int, Dict[str, Any]]]:
+        """Get the player's current revision and the state fields changed after ``since``.
+        
+        Only the revisions are read when nothing changed. A ``since`` ahead
+        of the stored revision (say, after a restore) returns every field.
+        """
+        async def load():
+            revisions = await self.storage.get_player_state(player_id, ["revision", "field_revisions"])
+            if revisions is None:
+                return None
+            revision = revisions.get("revision", 0)
+            fields = changed_since(revisions, since if since <= revision else -1)
+            if not fields:
+                return revision, {}
+            # Fields changed after this read are reported again next time, as
+            # they carry a revision above the one returned here
+            state_doc = await self.storage.get_player_state(player_id, fields)
+            if state_doc is None:
+                return None
+            if "level_progress" in state_doc:
+                state_doc["level_progress"] = progress_entries(state_doc["level_progress"])
+            return revision, state_doc
+        return await self._coalesced(player_id, ("changes", since), load)
+    
+    async def get_player_fields(self, player_id: str, fields: List[str]) -> Optional[Dict[str, Any]]:
+        """Get only the given top-level fields of a player's state document"""
+        return await self._coalesced(
+            player_id, ("fields", tuple(fields)), lambda: self.storage.get_player_state(player_id, fields)
+        )
+    
+    async def get_game_states(self, player_ids: List[str], fields: Optional[List[str]] = None) -> Dict[str, Dict[str, Any]]:
+        """Get many players' state documents in one query, keyed by player_id.
+        
+        Unknown players are left out. Like get_game_state_document, the
+        documents are not validated.
+        """
+        query_fields = None if fields is None else list(dict.fromkeys(["player_id", *fields]))
+        states = {}
+        for state_doc in await self.storage.get_player_states(list(dict.fromkeys(player_ids)), query_fields):
+            player_id = state_doc["player_id"] if fields is None or "player_id" in fields else state_doc.pop("player_id")
+            state_doc.pop("field_revisions", None)
+            if "level_progress" in state_doc:
+                state_doc["level_progress"] = progress_entries(state_doc["level_progress"])
+            states[player_id] = state_doc
+        return states
+    
+    async def get_statistics(self, player_id: str = "default") -> Optional[GameStatistics]:
+        """Get a player's statistics without loading the rest of the state"""
+        async def load():
+            state_doc = await self.storage.get_player_state(player_id, ["statistics"])
+            if state_doc is None:
+                return None
+            return GameStatistics(**state_doc.get("statistics", {}))
+        return await self._coalesced(player_id, ("statistics",), load)
+    
+    async def get_level_progress(self, player_id: str, level_id: str) -> Optional[LevelProgress]:
+        """Get a player's progress on one level; an unplayed level has empty progress.
+
+        Raises UnknownLevel for a level that is not in the catalog.
+        """
+        await self._require_level(level_id)
+        async def load():
+            progress_doc = await self.storage.get_level_progress(player_id, level_id)
+            if progress_doc is None:
+                return None
+            return LevelProgress(**progress_doc) if progress_doc else LevelProgress(level_id=level_id)
+        return await self._coalesced(player_id, ("progress", level_id), load)
+    
+    async def get_unlocked_hand_skins(self, player_id: str) -> Optional[List[str]]:
+        """Get the ids of a player's unlocked hand skins"""
+        state_doc = await self.get_player_fields(player_id, ["unlocked_hand_skins"])
+        if state_doc is None:
+            return None
+        return state_doc.get("unlocked_hand_skins", [])
     
     async def get_all_levels(self) -> List[GameLevel]:
         """Get all game levels"""
-        levels = await self.db.levels.find().sort("order", 1).to_list(length=None)
-        return [GameLevel(**level) for level in levels]
+        catalog = await self._get_catalog()
+        return list(catalog.levels)
     
     async def get_level_by_id(self, level_id: str) -> Optional[GameLevel]:
         """Get specific level by ID"""
-        level_doc = await self.db.levels.find_one({"id": level_id})
-        if level_doc:
-            return GameLevel(**level_doc)
-        return None
+        catalog = await self._get_catalog()
+        return catalog.levels_by_id.get(level_id)
     
     async def get_all_hand_skins(self) -> List[HandSkin]:
         """Get all hand skins"""
-        skins = await self.db.hand_skins.find().to_list(length=None)
-        return [HandSkin(**skin) for skin in skins]
+        catalog = await self._get_catalog()
+        return list(catalog.hand_skins)
     
     async def get_all_achievements(self) -> List[Achievement]:
         """Get all achievements"""
-        achievements = await self.db.achievements.find().to_list(length=None)
-        return [Achievement(**achievement) for achievement in achievements]
+        catalog = await self._get_catalog()
+        return list(catalog.achievements)
+    
+    async def get_level_analytics(self) -> List[LevelAnalytics]:
+        """Per-level completion, timing and drop-off summaries in play order"""
+        return await self.analytics.get_level_analytics(await self.get_all_levels())
+    
+    async def get_daily_analytics(self, days: int = 30) -> List[DailyAnalytics]:
+        """Daily activity totals for the last ``days`` days"""
+        return await self.analytics.get_daily_analytics(days)
     
     async def complete_level(self, player_id: str, request: LevelCompleteRequest) -> bool:
-        """Complete a level and update game state"""
+        """Complete a level and update game state.
+
+        Raises UnknownLevel for a level that is not in the catalog,
+        ReplayRejected if replay verification rejects the completion and
+        ReplayUnavailable if verification could not run.
+        """
+        await self._require_level(request.level_id)
+        request = await self._verify_completion(request)
         try:
-            # Get current game state
-            game_state = await self.get_game_state(player_id)
-            if not game_state:
-                return False
-            
-            # Update level progress
-            level_progress = None
-            for progress in game_state.level_progress:
-                if progress.level_id == request.level_id:
-                    level_progress = progress
-                    break
-            
-            if not level_progress:
-                level_progress = LevelProgress(level_id=request.level_id)
-                game_state.level_progress.append(level_progress)
-            
-            # Update progress
-            level_progress.completed = True
-            level_progress.attempts += 1
-            level_progress.last_played = datetime.utcnow()
-            
-            if not level_progress.best_time or request.completion_time < level_progress.best_time:
-                level_progress.best_time = request.completion_time
-            
-            # Add to completed levels if not already there
-            if request.level_id not in game_state.completed_levels:
-                game_state.completed_levels.append(request.level_id)
-            
-            # Update statistics
-            game_state.statistics.total_grabs += request.grabs_count
-            game_state.statistics.total_releases += request.releases_count
-            game_state.statistics.total_teleports += request.teleports_count
-            game_state.statistics.levels_completed = len(game_state.completed_levels)
-            
-            if not game_state.statistics.fastest_time or request.completion_time < game_state.statistics.fastest_time:
-                game_state.statistics.fastest_time = request.completion_time
-            
-            # Unlock next level
-            await self._unlock_next_level(game_state, request.level_id)
-            
-            # Check for unlocks
-            await self._check_unlocks(game_state, request.level_id, request.completion_time)
-            
-            # Save game state
-            game_state.updated_at = datetime.utcnow()
-            await self.db.player_game_state.replace_one(
-                {"player_id": player_id},
-                game_state.dict()
-            )
-            
-            return True
-            
+            async with self._player_write(player_id):
+                next_level_id = await self._get_next_level_id(request.level_id)
+                now = datetime.utcnow()
+                
+                # Apply progress, statistics and the next-level unlock in one
+                # atomic storage update so concurrent completions cannot lose writes
+                state_doc = await self.storage.apply_level_completion(
+                    player_id, request, next_level_id, now
+                )
+                if not state_doc:
+                    return False
+                
+                await self._record_leaderboard(player_id, request)
+                # attempts only counts completions, so 1 means this was the first
+                progress = next(
+                    (p for p in progress_entries(state_doc.get("level_progress")) if p["level_id"] == request.level_id),
+                    {}
+                )
+                first_completion = progress.get("attempts") == 1
+                await self.analytics.record_completion(request, first_completion, now)
+                
+                if request.session_id:
+                    closed = await self._close_game_session(
+                        player_id,
+                        request.session_id,
+                        completed=True,
+                        completion_time=request.completion_time,
+                        grabs_count=request.grabs_count,
+                        releases_count=request.releases_count,
+                        teleports_count=request.teleports_count
+                    )
+                    # Only sessions that were open count as completed
+                    if closed:
+                        await self.analytics.record_session_completed(request.level_id, now)
+                
+                # Check for unlocks against the post-update state
+                with validation_timer("PlayerGameState"):
+                    game_state = PlayerGameState(**state_doc)
+                changes = completion_changes(
+                    request.level_id,
+                    grabs=request.grabs_count,
+                    releases=request.releases_count,
+                    teleports=request.teleports_count
+                )
+                new_skins, new_achievements = await self._check_unlocks(game_state, changes, request.completion_time)
+                await self._save_unlocks(player_id, new_skins, new_achievements)
+                # Only a level's first completion unlocks the level after it
+                new_levels = [next_level_id] if first_completion and next_level_id else []
+                await self._publish_unlocks(player_id, new_skins, new_achievements, new_levels)
+                
+                return True
+                
         except Exception as e:
             logger.error(f"Error completing level: {e}")
             return False
     
-    async def _unlock_next_level(self, game_state: PlayerGameState, completed_level_id: str):
-        """Unlock the next level in sequence"""
-        levels = await self.get_all_levels()
-        current_level = next((l for l in levels if l.id == completed_level_id), None)
-        
-        if current_level:
-            next_level = next((l for l in levels if l.order == current_level.order + 1), None)
-            if next_level and next_level.id not in game_state.unlocked_levels:
-                game_state.unlocked_levels.append(next_level.id)
-    
-    async def _check_unlocks(self, game_state: PlayerGameState, level_id: str, completion_time: int):
-        """Check for hand skin and achievement unlocks"""
-        # Check hand skin unlocks
-        hand_skins = await self.get_all_hand_skins()
-        for skin in hand_skins:
-            if skin.unlock_requirement and skin.id not in game_state.unlocked_hand_skins:
-                if await self._check_unlock_condition(game_state, skin.unlock_requirement):
-                    game_state.unlocked_hand_skins.append(skin.id)
-        
-        # Check achievement unlocks
-        achievements = await self.get_all_achievements()
-        for achievement in achievements:
-            if achievement.id not in game_state.unlocked_achievements:
-                if await self._check_unlock_condition(game_state, achievement.unlock_condition, completion_time):
-                    game_state.unlocked_achievements.append(achievement.id)
-    
-    async def _check_unlock_condition(self, game_state: PlayerGameState, condition: str, completion_time: int = None) -> bool:
-        """Check if unlock condition is met"""
-        if condition == "complete_level_1":
-            return "level1" in game_state.completed_levels
-        elif condition == "complete_level_2":
-            return "level2" in game_state.completed_levels
-        elif condition == "complete_level_3":
-            return "level3" in game_state.completed_levels
-        elif condition == "complete_level_4":
-            return "level4" in game_state.completed_levels
-        elif condition == "complete_all_levels":
-            return len(game_state.completed_levels) >= 5
-        elif condition == "teleports_10":
-            return game_state.statistics.total_teleports >= 10
-        elif condition == "fast_completion_30s":
-            return completion_time and completion_time < 30000
-        
-        return False
+    async def _require_level(self, level_id: str):
+        """Raise UnknownLevel unless the level is in the catalog"""
+        catalog = await self._get_catalog()
+        if level_id not in catalog.levels_by_id:
+            raise UnknownLevel(f"Unknown level: {level_id}")
+    
+    async def _verify_completion(self, request: LevelCompleteRequest) -> LevelCompleteRequest:
+        """Replace the claimed completion time with the replayed one"""
+        if self.replay_mode == "off":
+            return request
+        if request.replay is None:
+            if self.replay_mode == "required":
+                raise ReplayRejected("Level completions must include a replay")
+            return request
+        level = await self.get_level_by_id(request.level_id)
+        if not level:
+            raise ReplayRejected(f"Unknown level: {request.level_id}")
+        completion_time = await self.replay_verifier.verify(level, request.replay, request.completion_time)
+        return request.model_copy(update={"completion_time": completion_time})
+    
+    async def _record_leaderboard(self, player_id: str, request: LevelCompleteRequest):
+        """Submit a completion time to the level leaderboard without failing the completion"""
+        try:
+            await self.leaderboard.record(request.level_id, player_id, request.completion_time)
+        except Exception as e:
+            logger.error(f"Error updating leaderboard: {e}")
+    
+    async def _get_next_level_id(self, completed_level_id: str) -> Optional[str]:
+        """Get the id of the level that follows the given one in sequence"""
+        catalog = await self._get_catalog()
+        return catalog.next_level_ids.get(completed_level_id)
+    
+    async def _check_unlocks(self, game_state: PlayerGameState, changes: List[Dependency], completion_time: Optional[int] = None):
+        """Check for hand skin and achievement unlocks, returning the newly unlocked ids"""
+        catalog = await self._get_catalog()
+        new_skins, new_achievements = catalog.unlocks.evaluate(game_state, changes, completion_time)
+        game_state.unlocked_hand_skins.extend(new_skins)
+        game_state.unlocked_achievements.extend(new_achievements)
+        return new_skins, new_achievements
+    
+    async def _save_unlocks(self, player_id: str, new_skins: List[str], new_achievements: List[str]):
+        """Persist newly unlocked hand skins and achievements"""
+        if not new_skins and not new_achievements:
+            return
+        await self.storage.add_player_unlocks({player_id: (new_skins, new_achievements)})
+    
+    async def _publish_unlocks(self, player_id: str, new_skins: List[str], new_achievements: List[str],
+                               new_levels: Optional[List[str]] = None):
+        """Push unlocks to the player's event stream without failing the caller"""
+        events = [{"type": "level_unlocked", "id": level_id} for level_id in new_levels or []]
+        events += [{"type": "hand_skin_unlocked", "id": skin_id} for skin_id in new_skins]
+        events += [{"type": "achievement_unlocked", "id": achievement_id} for achievement_id in new_achievements]
+        try:
+            await self.events.publish(player_id, events)
+        except Exception as e:
+            logger.error(f"Error publishing unlock events: {e}")
     
     async def update_settings(self, player_id: str, request: UpdateSettingsRequest) -> bool:
         """Update player settings"""
         try:
-            result = await self.db.player_game_state.update_one(
-                {"player_id": player_id},
-                {
-                    "$set": {
-                        "settings": request.settings.dict(),
-                        "updated_at": datetime.utcnow()
-                    }
-                }
-            )
-            return result.modified_count > 0
+            async with self._player_write(player_id):
+                return await self.storage.set_player_fields(player_id, {
+                    "settings": request.settings.dict(),
+                    "updated_at": datetime.utcnow()
+                })
         except Exception as e:
             logger.error(f"Error updating settings: {e}")
             return False
@@ -454,54 +594,216 @@ class GameService:
     async def select_hand_skin(self, player_id: str, hand_skin_id: str) -> bool:
         """Select a hand skin"""
         try:
-            result = await self.db.player_game_state.update_one(
-                {"player_id": player_id},
-                {
-                    "$set": {
-                        "selected_hand_skin": hand_skin_id,
-                        "updated_at": datetime.utcnow()
-                    }
-                }
-            )
-            return result.modified_count > 0
+            async with self._player_write(player_id):
+                # Read directly: a shared read may predate an unlock
+                state_doc = await self.storage.get_player_state(player_id, ["unlocked_hand_skins"])
+                if not state_doc or hand_skin_id not in state_doc.get("unlocked_hand_skins", []):
+                    return False
+                return await self.storage.set_player_fields(player_id, {
+                    "selected_hand_skin": hand_skin_id,
+                    "updated_at": datetime.utcnow()
+                })
         except Exception as e:
             logger.error(f"Error selecting hand skin: {e}")
             return False
     
     async def start_game_session(self, player_id: str, request: StartGameSessionRequest) -> str:
-        """Start a new game session"""
+        """Start a new game session, raising UnknownLevel for a level not in the catalog"""
+        await self._require_level(request.level_id)
         try:
+            now = datetime.utcnow()
             session = GameSession(
                 player_id=player_id,
                 level_id=request.level_id,
-                start_time=datetime.utcnow()
+                start_time=now,
+                last_heartbeat=now,
+                expires_at=now + timedelta(seconds=self.session_ttl)
             )
             
-            await self.db.game_sessions.insert_one(session.dict())
+            await self.storage.insert_session(session.dict())
+            await self.analytics.record_session_start(request.level_id, now)
             return session.id
             
         except Exception as e:
             logger.error(f"Error starting game session: {e}")
             return None
     
+    async def heartbeat_game_session(self, player_id: str, session_id: str, request: SessionHeartbeatRequest) -> bool:
+        """Record progress on an open session and push back its expiry"""
+        try:
+            now = datetime.utcnow()
+            return await self.storage.update_open_session(player_id, session_id, {
+                "grabs_count": request.grabs_count,
+                "releases_count": request.releases_count,
+                "teleports_count": request.teleports_count,
+                "last_heartbeat": now,
+                "expires_at": now + timedelta(seconds=self.session_ttl),
+                "updated_at": now
+            })
+        except Exception as e:
+            logger.error(f"Error updating game session: {e}")
+            return False
+    
+    async def end_game_session(self, player_id: str, session_id: str, request: EndGameSessionRequest) -> bool:
+        """End a session, completing its level when the session was won.
+
+        A won session is completed through complete_level, so it raises
+        UnknownLevel, ReplayRejected and ReplayUnavailable the same way.
+        """
+        try:
+            if request.completed:
+                session_doc = await self.storage.get_open_session(player_id, session_id)
+                if not session_doc:
+                    return False
+                return await self.complete_level(player_id, LevelCompleteRequest(
+                    level_id=session_doc["level_id"],
+                    completion_time=request.completion_time,
+                    grabs_count=request.grabs_count,
+                    releases_count=request.releases_count,
+                    teleports_count=request.teleports_count,
+                    session_id=session_id,
+                    replay=request.replay
+                ))
+            
+            return await self._close_game_session(
+                player_id,
+                session_id,
+                completed=False,
+                completion_time=None,
+                grabs_count=request.grabs_count,
+                releases_count=request.releases_count,
+                teleports_count=request.teleports_count
+            )
+        except (UnknownLevel, ReplayRejected, ReplayUnavailable):
+            raise
+        except Exception as e:
+            logger.error(f"Error ending game session: {e}")
+            return False
+    
+    async def _close_game_session(self, player_id: str, session_id: str, completed: bool,
+                                  completion_time: Optional[int], grabs_count: int,
+                                  releases_count: int, teleports_count: int) -> bool:
+        """Mark an open session as ended and exempt it from the abandoned-session TTL"""
+        now = datetime.utcnow()
+        return await self.storage.update_open_session(
+            player_id,
+            session_id,
+            {
+                "end_time": now,
+                "completed": completed,
+                "completion_time": completion_time,
+                "grabs_count": grabs_count,
+                "releases_count": releases_count,
+                "teleports_count": teleports_count,
+                "updated_at": now
+            },
+            unset=["expires_at"]
+        )
+    
+    async def rollup_game_sessions(self) -> int:
+        """Fold ended sessions older than the retention window into per-player daily rollups"""
+        cutoff = datetime.utcnow() - timedelta(days=self.session_retention_days)
+        removed = await self.storage.rollup_sessions(cutoff)
+        if removed:
+            logger.info(f"Rolled up {removed} game sessions")
+        return removed
+    
     async def update_game_stats(self, player_id: str, request: UpdateGameStatsRequest) -> bool:
         """Update game statistics"""
         try:
-            result = await self.db.player_game_state.update_one(
-                {"player_id": player_id},
-                {
-                    "$inc": {
-                        "statistics.total_grabs": request.grabs,
-                        "statistics.total_releases": request.releases,
-                        "statistics.total_teleports": request.teleports,
-                        "statistics.total_play_time": request.play_time
-                    },
-                    "$set": {
-                        "updated_at": datetime.utcnow()
-                    }
-                }
-            )
-            return result.modified_count > 0
+            async with self._player_write(player_id):
+                now = datetime.utcnow()
+                state_doc = await self.storage.increment_player_stats(
+                    player_id, request, now, UNLOCK_STATE_FIELDS
+                )
+                if not state_doc:
+                    return False
+                await self.analytics.record_stat_deltas([request], now)
+                
+                # Stat thresholds (e.g. teleports_10) can be crossed outside a completion
+                changes = stat_changes(
+                    grabs=request.grabs,
+                    releases=request.releases,
+                    teleports=request.teleports,
+                    play_time=request.play_time
+                )
+                if changes:
+                    with validation_timer("PlayerGameState"):
+                        game_state = PlayerGameState(**state_doc)
+                    new_skins, new_achievements = await self._check_unlocks(game_state, changes)
+                    await self._save_unlocks(player_id, new_skins, new_achievements)
+                    await self._publish_unlocks(player_id, new_skins, new_achievements)
+                return True
         except Exception as e:
             logger.error(f"Error updating game stats: {e}")
-            return False
\ No newline at end of file
+            return False
+    
+    async def apply_stat_deltas(self, deltas: Dict[str, UpdateGameStatsRequest]) -> int:
+        """Apply coalesced statistics increments for many players in one storage call.
+
+        Raises StatsNotApplied with the increments that were not written, so
+        the caller retries those alone. Once increments are written, failures
+        in the analytics and unlock follow-up are logged, never retried, so
+        no increment is applied twice.
+        """
+        if not deltas:
+            return 0
+        
+        now = datetime.utcnow()
+        try:
+            updated = await self.storage.increment_many_player_stats(deltas, now)
+        except PartialWriteError as e:
+            failed = set(e.failed)
+            applied = {player_id: delta for player_id, delta in deltas.items() if player_id not in failed}
+            await self._after_stat_deltas(applied, now)
+            raise StatsNotApplied({player_id: deltas[player_id] for player_id in e.failed if player_id in deltas}) from e
+        except Exception as e:
+            raise StatsNotApplied(deltas) from e
+        await self._after_stat_deltas(deltas, now)
+        return updated
+    
+    async def _after_stat_deltas(self, deltas: Dict[str, UpdateGameStatsRequest], now: datetime):
+        """Record analytics and unlocks for increments that have been written"""
+        for player_id in deltas:
+            self.single_flight.forget(player_id)
+        try:
+            await self.analytics.record_stat_deltas(deltas.values(), now)
+        except Exception as e:
+            logger.error(f"Error recording stats analytics for {len(deltas)} players: {e}")
+        try:
+            await self._unlock_after_stat_deltas(deltas)
+        except Exception as e:
+            logger.error(f"Error evaluating unlocks after stats for {len(deltas)} players: {e}")
+    
+    async def _unlock_after_stat_deltas(self, deltas: Dict[str, UpdateGameStatsRequest]):
+        """Grant the unlocks that written stats increments earned"""
+        # Only players whose increments touch an unlock condition need re-reading
+        catalog = await self._get_catalog()
+        changes_by_player = {
+            player_id: stat_changes(
+                grabs=delta.grabs,
+                releases=delta.releases,
+                teleports=delta.teleports,
+                play_time=delta.play_time
+            )
+            for player_id, delta in deltas.items()
+        }
+        affected = {
+            player_id: changes
+            for player_id, changes in changes_by_player.items()
+            if catalog.unlocks.depends_on(changes)
+        }
+        if affected:
+            state_docs = await self.storage.get_player_states(list(affected), UNLOCK_STATE_FIELDS)
+            unlocks = {}
+            for state_doc in state_docs:
+                with validation_timer("PlayerGameState"):
+                    game_state = PlayerGameState(**state_doc)
+                new_skins, new_achievements = catalog.unlocks.evaluate(game_state, affected[game_state.player_id])
+                if new_skins or new_achievements:
+                    unlocks[game_state.player_id] = (new_skins, new_achievements)
+            if unlocks:
+                await self.storage.add_player_unlocks(unlocks)
+                for player_id, (new_skins, new_achievements) in unlocks.items():
+                    self.single_flight.forget(player_id)
+                    await self._publish_unlocks(player_id, new_skins, new_achievements)
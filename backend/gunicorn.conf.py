@@ -0,0 +1,34 @@
+"""Production run profile: gunicorn managing uvicorn workers.
+
+    gunicorn -c gunicorn.conf.py server:app
+
+Each worker imports the app on its own (no preload) and opens its Mongo
+connection pool in the lifespan handler, so no sockets are shared across
+fork. Size MONGO_MAX_POOL_SIZE per worker: the server sees
+WEB_CONCURRENCY * MONGO_MAX_POOL_SIZE connections from each host.
+"""
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8001')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = False
+
+# Seconds; a worker stuck longer than timeout is killed and replaced
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '30'))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', '5'))
+
+# Recycle workers periodically to bound memory growth; jitter avoids
+# restarting them all at once
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', '0'))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', '0'))
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG') or None
+
+def child_exit(server, worker):
+    """Drop a dead worker's live gauges when metrics are shared across processes"""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
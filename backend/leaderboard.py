@@ -0,0 +1,150 @@
+from typing import List, Optional, Dict, Tuple
+from datetime import datetime
+from pathlib import Path
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from models import LeaderboardEntry
+from storage import GameStorage, MotorGameStorage
+import asyncio
+import bisect
+import typer
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+def _sort_key(entry: LeaderboardEntry) -> Tuple[int, datetime, str]:
+    # Ties on best_time go to whoever set it first
+    return (entry.best_time, entry.achieved_at, entry.player_id)
+
+class TopKCache:
+    """Sorted in-memory copy of the best ``size`` entries of one level"""
+    def __init__(self, entries: List[LeaderboardEntry], size: int):
+        self.entries = entries
+        self.size = size
+        self.loaded_at = time.monotonic()
+
+    def update(self, entry: LeaderboardEntry):
+        """Write-through an improved time for a player"""
+        self.entries = [e for e in self.entries if e.player_id != entry.player_id]
+        bisect.insort(self.entries, entry, key=_sort_key)
+        del self.entries[self.size:]
+
+    def rank_of(self, player_id: str) -> Optional[int]:
+        for index, entry in enumerate(self.entries):
+            if entry.player_id == player_id:
+                return index + 1
+        return None
+
+class LeaderboardService:
+    """Per-level best times, kept up to date from level completions.
+
+    The storage backend keeps one entry per (level_id, player_id) holding the
+    player's best time and serves top-N in (best_time, achieved_at) order, and
+    each worker keeps the top ``top_k`` entries of every level it has served
+    in memory, refreshed every ``cache_ttl`` seconds to pick up other workers'
+    writes.
+    """
+    def __init__(self, storage: GameStorage, top_k: int = 100, cache_ttl: float = 30.0):
+        self.storage = storage
+        self.top_k = top_k
+        self.cache_ttl = cache_ttl
+        self._top: Dict[str, TopKCache] = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def record(self, level_id: str, player_id: str, completion_time: int) -> bool:
+        """Record a completion time, returning True if it is the player's new best"""
+        now = datetime.utcnow()
+        if not await self.storage.record_best_time(level_id, player_id, completion_time, now):
+            return False
+
+        cache = self._top.get(level_id)
+        if cache:
+            cache.update(LeaderboardEntry(
+                level_id=level_id,
+                player_id=player_id,
+                best_time=completion_time,
+                achieved_at=now
+            ))
+        return True
+
+    async def _get_top_cache(self, level_id: str) -> TopKCache:
+        cache = self._top.get(level_id)
+        if cache and time.monotonic() - cache.loaded_at < self.cache_ttl:
+            self.hits += 1
+            return cache
+        self.misses += 1
+        docs = await self.storage.get_leaderboard(level_id, self.top_k)
+        cache = TopKCache([LeaderboardEntry(**doc) for doc in docs], self.top_k)
+        self._top[level_id] = cache
+        return cache
+
+    async def get_top(self, level_id: str, limit: int = 10) -> List[LeaderboardEntry]:
+        """Get the fastest players for a level"""
+        if limit <= self.top_k:
+            cache = await self._get_top_cache(level_id)
+            entries = cache.entries[:limit]
+        else:
+            docs = await self.storage.get_leaderboard(level_id, limit)
+            entries = [LeaderboardEntry(**doc) for doc in docs]
+        return [entry.model_copy(update={"rank": index + 1}) for index, entry in enumerate(entries)]
+
+    async def get_rank(self, level_id: str, player_id: str) -> Optional[LeaderboardEntry]:
+        """Get a player's leaderboard entry and rank for a level.
+
+        Ranks within the cached top ``top_k`` cost nothing; deeper ranks are
+        counted by the storage backend from its per-level best-time counts,
+        so their cost does not grow with the player's rank.
+        """
+        cache = await self._get_top_cache(level_id)
+        rank = cache.rank_of(player_id)
+        if rank:
+            return cache.entries[rank - 1].model_copy(update={"rank": rank})
+
+        doc = await self.storage.get_leaderboard_entry(level_id, player_id)
+        if not doc:
+            return None
+        entry = LeaderboardEntry(**doc)
+        ahead = await self.storage.count_leaderboard_ahead(level_id, entry.best_time, entry.achieved_at)
+        entry.rank = ahead + 1
+        return entry
+
+    async def rebuild_counts(self) -> int:
+        """Rebuild the per-level best-time counts that deep ranks are computed from"""
+        rebuilt = await self.storage.rebuild_leaderboard_counts()
+        logger.info(f"Rebuilt leaderboard counts for {rebuilt} levels")
+        return rebuilt
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "cached_levels": len(self._top)
+        }
+
+# Maintenance jobs, run from the backend directory:
+#     python leaderboard.py rebuild-counts
+# Run once after upgrading onto leaderboard_buckets, and to repair counts
+# left behind by a crash between a best-time write and its bucket update
+cli = typer.Typer(help="Leaderboard maintenance jobs")
+
+@cli.callback()
+def callback():
+    # Keeps the job a named subcommand; Typer runs a lone command without its name
+    pass
+
+@cli.command("rebuild-counts")
+def rebuild_counts_command(
+    mongo_url: str = typer.Option(..., envvar="MONGO_URL"),
+    db_name: str = typer.Option(..., envvar="DB_NAME")
+):
+    """Rebuild leaderboard_buckets from the leaderboards collection"""
+    storage = MotorGameStorage(AsyncIOMotorClient(mongo_url)[db_name])
+    rebuilt = asyncio.run(LeaderboardService(storage).rebuild_counts())
+    typer.echo(f"Rebuilt leaderboard counts for {rebuilt} levels")
+
+if __name__ == "__main__":
+    load_dotenv(Path(__file__).parent / '.env')
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    cli()
@@ -0,0 +1,361 @@
+"""Precompiled, content-hashed level bundles.
+
+A bundle is built offline from level sources (JSON files, or the built-in
+DEFAULT_LEVELS). The build validates every level against GameLevel and
+checks that the levels fit together: unique ids and orders, 3-component
+vectors, teleporters linked to a teleporter in the same level, and patrol
+paths for patrolling enemies. It then precomputes each level's layout:
+spatial bounds, the resolved teleporter graph, patrol segment lengths and
+the previous/next level in play order.
+
+The output is a single immutable file, levels-<version>.bundle, where
+version is a hash of the level content. It holds every response body the
+level routes serve (full and render views, the layouts and the level
+lists), each with its ETag and gzip/brotli variants compressed at the
+highest settings. The server memory-maps the file (LEVEL_BUNDLE) and slices
+bodies out of it, so startup does no serialization or compression and the
+pages are shared by every worker on the host. Adding levels grows the file,
+not the per-request work.
+
+Run from the backend directory:
+
+    python level_bundle.py build --output-dir level_bundles
+    python level_bundle.py build community_levels/ extra_level.json --output-dir level_bundles
+    python level_bundle.py inspect level_bundles/levels-<version>.bundle
+"""
+import hashlib
+import json
+import logging
+import math
+import mmap
+import os
+import struct
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import typer
+from pydantic import ValidationError
+
+from catalog_manifest import DEFAULT_LEVELS
+from models import GameLevel
+from responses import CONTENT_CODINGS, PrecomputedBody, compress, etag_for, render_json
+
+logger = logging.getLogger(__name__)
+
+BUNDLE_MAGIC = b"HOGLVL\x00\x01"
+BUNDLE_FORMAT = 1
+# Magic followed by the little-endian length of the JSON index
+HEADER = struct.Struct("<8sQ")
+
+class LevelBuildError(ValueError):
+    """Level sources that do not form a valid bundle"""
+    def __init__(self, problems: List[str]):
+        super().__init__(f"{len(problems)} problem(s) in level sources:\n" + "\n".join(problems))
+        self.problems = problems
+
+def level_render_view(level: GameLevel) -> Dict[str, Any]:
+    """A level without the document timestamps and unset optional fields the client ignores"""
+    return level.model_dump(mode="json", exclude={"created_at", "updated_at"}, exclude_none=True)
+
+def _vectors(level: GameLevel) -> List[Tuple[str, List[float]]]:
+    """Every 3-vector in a level, labelled for error messages"""
+    vectors = [("gravity", level.gravity)]
+    if level.gravity_shift_trigger:
+        vectors.append(("gravity_shift_trigger.new_gravity", level.gravity_shift_trigger.new_gravity))
+    vectors += [(f"balls.{ball.id}.position", ball.position) for ball in level.balls]
+    for target in level.targets:
+        vectors += [(f"targets.{target.id}.position", target.position), (f"targets.{target.id}.size", target.size)]
+    vectors += [(f"teleporters.{teleporter.id}.position", teleporter.position) for teleporter in level.teleporters or []]
+    for enemy in level.enemy_hands or []:
+        vectors.append((f"enemy_hands.{enemy.id}.position", enemy.position))
+        vectors += [(f"enemy_hands.{enemy.id}.patrol_path.{index}", point)
+                    for index, point in enumerate(enemy.patrol_path or [])]
+    return vectors
+
+def _level_problems(level: GameLevel) -> List[str]:
+    """Consistency problems within one validated level"""
+    problems = [f"{name} must have 3 components" for name, vector in _vectors(level) if len(vector) != 3]
+    if not level.balls:
+        problems.append("needs at least one ball")
+    if not level.targets:
+        problems.append("needs at least one target")
+    teleporter_ids = [teleporter.id for teleporter in level.teleporters or []]
+    if len(set(teleporter_ids)) != len(teleporter_ids):
+        problems.append("teleporter ids must be unique")
+    for teleporter in level.teleporters or []:
+        if teleporter.linked_to == teleporter.id or teleporter.linked_to not in teleporter_ids:
+            problems.append(f"teleporter {teleporter.id} links to unknown teleporter {teleporter.linked_to}")
+    for enemy in level.enemy_hands or []:
+        if enemy.behavior == "patrol" and len(enemy.patrol_path or []) < 2:
+            problems.append(f"patrolling enemy hand {enemy.id} needs a patrol_path of at least 2 points")
+    return problems
+
+def validate_levels(sources: List[Dict[str, Any]]) -> List[GameLevel]:
+    """Validate level sources, returning the levels in play order or raising
+    LevelBuildError with every problem found"""
+    problems: List[str] = []
+    levels: List[GameLevel] = []
+    for index, source in enumerate(sources):
+        label = source.get("id", f"source #{index}") if isinstance(source, dict) else f"source #{index}"
+        try:
+            level = GameLevel.model_validate(source)
+        except ValidationError as e:
+            errors = "; ".join(f"{'.'.join(map(str, error['loc']))}: {error['msg']}" for error in e.errors())
+            problems.append(f"level {label}: {errors}")
+            continue
+        problems += [f"level {label}: {problem}" for problem in _level_problems(level)]
+        levels.append(level)
+
+    for attribute in ("id", "order"):
+        seen: Dict[Any, int] = {}
+        for level in levels:
+            seen[getattr(level, attribute)] = seen.get(getattr(level, attribute), 0) + 1
+        problems += [f"duplicate level {attribute}: {value}" for value, count in seen.items() if count > 1]
+
+    if problems:
+        raise LevelBuildError(problems)
+    return sorted(levels, key=lambda level: level.order)
+
+def _bounds(level: GameLevel) -> Dict[str, List[float]]:
+    """Axis-aligned box around every object and patrol point in a level"""
+    boxes = [(ball.position, ball.position) for ball in level.balls]
+    for target in level.targets:
+        half = [size / 2 for size in target.size]
+        boxes.append(([p - h for p, h in zip(target.position, half)], [p + h for p, h in zip(target.position, half)]))
+    boxes += [(teleporter.position, teleporter.position) for teleporter in level.teleporters or []]
+    for enemy in level.enemy_hands or []:
+        boxes += [(point, point) for point in [enemy.position] + (enemy.patrol_path or [])]
+    return {
+        "min": [min(low[axis] for low, _ in boxes) for axis in range(3)],
+        "max": [max(high[axis] for _, high in boxes) for axis in range(3)]
+    }
+
+def level_layout(level: GameLevel, previous_level: Optional[str], next_level: Optional[str]) -> Dict[str, Any]:
+    """Data derived from a level's geometry and its place in the play order"""
+    positions = {teleporter.id: teleporter.position for teleporter in level.teleporters or []}
+    links = {teleporter.id: teleporter.linked_to for teleporter in level.teleporters or []}
+    patrols = []
+    for enemy in level.enemy_hands or []:
+        if enemy.behavior != "patrol" or not enemy.patrol_path:
+            continue
+        # Patrols loop back to their first point
+        path = enemy.patrol_path
+        segments = [math.dist(path[index], path[(index + 1) % len(path)]) for index in range(len(path))]
+        patrols.append({"id": enemy.id, "segment_lengths": segments, "loop_length": sum(segments)})
+    return {
+        "level_id": level.id,
+        "bounds": _bounds(level),
+        "teleporters": [
+            {
+                "id": teleporter_id,
+                "linked_to": linked_to,
+                "exit": positions.get(linked_to),
+                "two_way": links.get(linked_to) == teleporter_id
+            }
+            for teleporter_id, linked_to in links.items()
+        ],
+        "patrols": patrols,
+        "previous_level": previous_level,
+        "next_level": next_level
+    }
+
+def level_layouts(levels: List[GameLevel]) -> Dict[str, Dict[str, Any]]:
+    """Layouts for levels in play order, chained previous/next"""
+    ids = [level.id for level in levels]
+    return {
+        level.id: level_layout(level, ids[index - 1] if index else None, ids[index + 1] if index + 1 < len(ids) else None)
+        for index, level in enumerate(levels)
+    }
+
+def level_bodies(levels: List[GameLevel]) -> Dict[str, Any]:
+    """Every level route's response content, keyed by bundle body name"""
+    bodies: Dict[str, Any] = {
+        "levels": {"success": True, "data": levels, "message": "Levels retrieved successfully"},
+        "render_levels": {
+            "success": True,
+            "data": [level_render_view(level) for level in levels],
+            "message": "Levels retrieved successfully"
+        }
+    }
+    for level_id, layout in level_layouts(levels).items():
+        bodies[f"layout/{level_id}"] = {"success": True, "data": layout, "message": "Level layout retrieved successfully"}
+    for level in levels:
+        bodies[f"level/{level.id}"] = level
+        bodies[f"render_level/{level.id}"] = level_render_view(level)
+    return bodies
+
+def content_version(levels: List[GameLevel]) -> str:
+    """Hash of the level content; the document timestamps do not count"""
+    canonical = json.dumps(
+        {"format": BUNDLE_FORMAT, "levels": [level_render_view(level) for level in levels]},
+        sort_keys=True, separators=(",", ":"), ensure_ascii=False
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:16]
+
+def build_bundle(levels: List[GameLevel]) -> Tuple[str, bytes]:
+    """Serialize validated levels into a bundle, returning its version and bytes"""
+    version = content_version(levels)
+    payload = bytearray()
+    index: Dict[str, Dict[str, Any]] = {}
+
+    def append(data: bytes) -> List[int]:
+        span = [len(payload), len(data)]
+        payload.extend(data)
+        return span
+
+    for name, content in level_bodies(levels).items():
+        body = render_json(content)
+        index[name] = {
+            "body": append(body),
+            "etag": etag_for(body),
+            "encodings": {encoding: append(compress(body, encoding)) for encoding in CONTENT_CODINGS}
+        }
+
+    header = json.dumps({
+        "format": BUNDLE_FORMAT,
+        "version": version,
+        "levels": [level.id for level in levels],
+        "payload_sha256": hashlib.sha256(payload).hexdigest(),
+        "bodies": index
+    }, separators=(",", ":")).encode("utf-8")
+    return version, HEADER.pack(BUNDLE_MAGIC, len(header)) + header + bytes(payload)
+
+def load_sources(paths: List[Path]) -> List[Dict[str, Any]]:
+    """Read level sources from JSON files (one level or a list) and directories of them"""
+    files: List[Path] = []
+    for path in paths:
+        files += sorted(path.glob("*.json")) if path.is_dir() else [path]
+    sources: List[Dict[str, Any]] = []
+    for file in files:
+        content = json.loads(file.read_text(encoding="utf-8"))
+        sources += content if isinstance(content, list) else [content]
+    return sources
+
+def write_bundle(sources: List[Dict[str, Any]], output_dir: Path) -> Tuple[Path, bool]:
+    """Build a bundle into output_dir unless one with the same content exists.
+
+    Returns the bundle path and whether it was written. Bundles are never
+    rewritten; the file appears atomically under its final name.
+    """
+    levels = validate_levels(sources)
+    path = output_dir / f"levels-{content_version(levels)}.bundle"
+    if path.exists():
+        return path, False
+    version, data = build_bundle(levels)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    temporary = path.with_suffix(f".tmp-{os.getpid()}")
+    temporary.write_bytes(data)
+    os.replace(temporary, path)
+    return path, True
+
+class BundleBody(PrecomputedBody):
+    """A precomputed body whose bytes live in a memory-mapped bundle"""
+    def __init__(self, bundle: "LevelBundle", entry: Dict[str, Any]):
+        self._bundle = bundle
+        self._entry = entry
+        self.etag = entry["etag"]
+        self._variants = {}
+
+    @property
+    def body(self) -> bytes:
+        return self._bundle.read(self._entry["body"])
+
+    def variant(self, media_type: str, encoding: Optional[str]) -> Tuple[bytes, str]:
+        if media_type == "application/json":
+            if encoding is None:
+                return self.body, self.etag
+            if encoding in self._entry["encodings"]:
+                return self._bundle.read(self._entry["encodings"][encoding]), self.etag[:-1] + f'-{encoding}"'
+        return super().variant(media_type, encoding)
+
+class LevelBundle:
+    """A level bundle opened read-only and memory-mapped"""
+    def __init__(self, path: str):
+        self.path = Path(path)
+        with open(self.path, "rb") as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, index_length = HEADER.unpack_from(self._map)
+            if magic != BUNDLE_MAGIC:
+                raise ValueError(f"{self.path} is not a level bundle")
+            self._payload_start = HEADER.size + index_length
+            index = json.loads(self._map[HEADER.size:self._payload_start])
+            if index["format"] != BUNDLE_FORMAT:
+                raise ValueError(f"{self.path} has unsupported bundle format {index['format']}")
+            payload = memoryview(self._map)[self._payload_start:]
+            try:
+                intact = hashlib.sha256(payload).hexdigest() == index["payload_sha256"]
+            finally:
+                payload.release()
+            if not intact:
+                raise ValueError(f"{self.path} is corrupt: payload checksum mismatch")
+        except Exception:
+            self._map.close()
+            raise
+        self.version: str = index["version"]
+        self.level_ids: List[str] = index["levels"]
+        self._bodies: Dict[str, Dict[str, Any]] = index["bodies"]
+        logger.info(f"Opened level bundle {self.version} with {len(self.level_ids)} levels")
+
+    def read(self, span: List[int]) -> bytes:
+        offset, length = span
+        start = self._payload_start + offset
+        return self._map[start:start + length]
+
+    def body(self, name: str) -> Optional[BundleBody]:
+        """The precomputed response stored under a body name, e.g. level/<id>"""
+        entry = self._bodies.get(name)
+        return BundleBody(self, entry) if entry else None
+
+    def bodies(self) -> Dict[str, BundleBody]:
+        """Every stored response, keyed by body name"""
+        return {name: BundleBody(self, entry) for name, entry in self._bodies.items()}
+
+    def levels(self) -> List[GameLevel]:
+        """The bundled levels in play order (validated when the bundle was built)"""
+        return [GameLevel.model_validate_json(self.read(self._bodies[f"level/{level_id}"]["body"]))
+                for level_id in self.level_ids]
+
+    def close(self):
+        self._map.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"version": self.version, "levels": len(self.level_ids), "bytes": len(self._map)}
+
+app = typer.Typer(help="Build and inspect precompiled level bundles")
+
+@app.command("build")
+def build_command(
+    sources: Optional[List[Path]] = typer.Argument(
+        None, exists=True, help="Level JSON files or directories of them; defaults to the built-in levels"
+    ),
+    output_dir: Path = typer.Option(Path("level_bundles"), help="Directory the bundle is written to")
+):
+    """Validate level sources and write a content-hashed bundle"""
+    try:
+        path, written = write_bundle(load_sources(sources) if sources else DEFAULT_LEVELS, output_dir)
+    except LevelBuildError as e:
+        typer.echo(str(e), err=True)
+        raise typer.Exit(1)
+    typer.echo(f"Wrote {path}" if written else f"{path} is up to date")
+
+@app.command("inspect")
+def inspect_command(bundle: Path = typer.Argument(..., exists=True, help="Bundle file")):
+    """Print a bundle's version and each level's layout summary"""
+    level_bundle = LevelBundle(str(bundle))
+    try:
+        stats = level_bundle.stats()
+        typer.echo(f"Bundle {stats['version']}: {stats['levels']} levels, {stats['bytes']} bytes")
+        for level_id in level_bundle.level_ids:
+            layout = json.loads(level_bundle.body(f"layout/{level_id}").body)["data"]
+            typer.echo(
+                f"  {level_id}: bounds {layout['bounds']['min']}..{layout['bounds']['max']}, "
+                f"{len(layout['teleporters'])} teleporters, {len(layout['patrols'])} patrols, "
+                f"next {layout['next_level']}"
+            )
+    finally:
+        level_bundle.close()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    app()
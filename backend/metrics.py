@@ -0,0 +1,248 @@
+from typing import List, Optional, Dict, Any, Callable, Iterator
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, generate_latest
+from prometheus_client import multiprocess
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from pymongo import monitoring
+import os
+import random
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Kept separate from the prometheus_client default registry so importing the
+# app twice (tests, benchmarks) does not register metrics twice
+REGISTRY = CollectorRegistry()
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+VALIDATION_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01)
+
+HTTP_REQUESTS = Counter(
+    "http_requests_total", "HTTP requests by route and status",
+    ["method", "route", "status"], registry=REGISTRY
+)
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route",
+    ["method", "route"], buckets=LATENCY_BUCKETS, registry=REGISTRY
+)
+HTTP_REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "HTTP requests currently being handled",
+    ["method"], registry=REGISTRY, multiprocess_mode="livesum"
+)
+MONGO_COMMAND_DURATION = Histogram(
+    "mongo_command_duration_seconds", "MongoDB command latency as reported by the driver",
+    ["command", "collection", "outcome"], buckets=LATENCY_BUCKETS, registry=REGISTRY
+)
+MODEL_VALIDATION_DURATION = Histogram(
+    "model_validation_duration_seconds", "Time spent building Pydantic models from stored documents",
+    ["model"], buckets=VALIDATION_BUCKETS, registry=REGISTRY
+)
+
+class Span:
+    """A timed operation inside a traced request"""
+    __slots__ = ("name", "start", "duration", "attributes")
+
+    def __init__(self, name: str, start: float, duration: float, attributes: Dict[str, Any]):
+        self.name = name
+        self.start = start
+        self.duration = duration
+        self.attributes = attributes
+
+class RequestTrace:
+    """Spans recorded while handling one request"""
+    def __init__(self, method: str, path: str):
+        self.method = method
+        self.path = path
+        self.route: Optional[str] = None
+        self.status: Optional[int] = None
+        self.started_at = datetime.utcnow()
+        self.start = time.perf_counter()
+        self.duration = 0.0
+        self.spans: List[Span] = []
+
+    def add_span(self, name: str, duration: float, end: Optional[float] = None, **attributes):
+        end = time.perf_counter() if end is None else end
+        self.spans.append(Span(name, end - duration - self.start, duration, attributes))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "method": self.method,
+            "path": self.path,
+            "route": self.route,
+            "status": self.status,
+            "started_at": self.started_at.isoformat(),
+            "duration_ms": round(self.duration * 1000, 3),
+            "spans": [
+                {
+                    "name": span.name,
+                    "start_ms": round(span.start * 1000, 3),
+                    "duration_ms": round(span.duration * 1000, 3),
+                    **span.attributes
+                }
+                for span in sorted(self.spans, key=lambda span: span.start)
+            ]
+        }
+
+# Motor copies the context into its executor threads, so driver callbacks
+# see the trace of the request that issued the command
+_current_trace: ContextVar[Optional[RequestTrace]] = ContextVar("current_trace", default=None)
+
+class SlowTraceBuffer:
+    """Ring buffer of traces for requests slower than a threshold"""
+    def __init__(self, threshold: float, capacity: int = 100, sample_rate: float = 1.0):
+        self.threshold = threshold
+        self.sample_rate = sample_rate
+        self.traces: deque = deque(maxlen=capacity)
+        self.recorded = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.threshold > 0 and self.traces.maxlen > 0
+
+    def offer(self, trace: RequestTrace):
+        if trace.duration < self.threshold:
+            return
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return
+        self.traces.append(trace)
+        self.recorded += 1
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """Recorded traces, slowest first"""
+        return [trace.to_dict() for trace in sorted(list(self.traces), key=lambda trace: -trace.duration)]
+
+@contextmanager
+def validation_timer(model: str) -> Iterator[None]:
+    """Time building a model from a stored document"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        end = time.perf_counter()
+        MODEL_VALIDATION_DURATION.labels(model).observe(end - start)
+        trace = _current_trace.get()
+        if trace:
+            trace.add_span(f"validate {model}", end - start, end)
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Records the latency of every command the driver sends"""
+    def __init__(self):
+        # (connection_id, request_id) -> collection, from the started event
+        self._collections: Dict[Any, str] = {}
+        self._lock = threading.Lock()
+
+    def started(self, event: monitoring.CommandStartedEvent):
+        collection = event.command.get(event.command_name)
+        with self._lock:
+            self._collections[(event.connection_id, event.request_id)] = (
+                collection if isinstance(collection, str) else ""
+            )
+
+    def _finished(self, event, outcome: str):
+        with self._lock:
+            collection = self._collections.pop((event.connection_id, event.request_id), "")
+        duration = event.duration_micros / 1e6
+        MONGO_COMMAND_DURATION.labels(event.command_name, collection, outcome).observe(duration)
+        trace = _current_trace.get()
+        if trace:
+            trace.add_span(f"mongo {event.command_name}", duration, collection=collection, outcome=outcome)
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent):
+        self._finished(event, "success")
+
+    def failed(self, event: monitoring.CommandFailedEvent):
+        self._finished(event, "failure")
+
+class MetricsMiddleware:
+    """ASGI middleware recording per-route latency, status counts and in-flight requests"""
+    def __init__(self, app, traces: SlowTraceBuffer, exclude_paths: tuple = ("/metrics",)):
+        self.app = app
+        self.traces = traces
+        self.exclude_paths = exclude_paths
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(self.exclude_paths):
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status = 500
+        trace = RequestTrace(method, scope["path"]) if self.traces.enabled else None
+        token = _current_trace.set(trace)
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        in_flight = HTTP_REQUESTS_IN_FLIGHT.labels(method)
+        in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            duration = time.perf_counter() - start
+            in_flight.dec()
+            _current_trace.reset(token)
+            # Route templates keep label cardinality bounded
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            HTTP_REQUEST_DURATION.labels(method, route).observe(duration)
+            HTTP_REQUESTS.labels(method, route, str(status)).inc()
+            if trace:
+                trace.route = route
+                trace.status = status
+                trace.duration = duration
+                self.traces.offer(trace)
+
+class ServiceStatsCollector:
+    """Exports in-process cache and aggregator counters at scrape time"""
+    def __init__(self, sources: Dict[str, Callable[[], Dict[str, Any]]]):
+        self.sources = sources
+
+    def collect(self):
+        for name, source in self.sources.items():
+            try:
+                stats = source()
+            except Exception as e:
+                logger.error(f"Error collecting {name} stats: {e}")
+                continue
+            for key, value in stats.items():
+                if not isinstance(value, (int, float)) or isinstance(value, bool):
+                    continue
+                metric_name = f"{name}_{key}"
+                if key in ("hits", "misses", "reloads", "received", "rejected", "flushes", "writes", "batches",
+                           "published", "delivered", "dropped", "relay_errors", "evictions", "flush_errors",
+                           "calls", "coalesced", "player_writes", "player_write_waits"):
+                    yield CounterMetricFamily(metric_name, f"{name} {key}", value=value)
+                else:
+                    yield GaugeMetricFamily(metric_name, f"{name} {key}", value=value)
+
+_stats_collector = ServiceStatsCollector({})
+REGISTRY.register(_stats_collector)
+
+def register_stats_sources(sources: Dict[str, Callable[[], Dict[str, Any]]]):
+    """Export the numeric values of each stats() source as <name>_<key> metrics.
+
+    Replaces any earlier sources, so re-importing the app (multiprocessing
+    spawn runs server.py again as __mp_main__) does not export them twice.
+    """
+    _stats_collector.sources = sources
+
+def render_metrics() -> bytes:
+    """Render every registered metric in the Prometheus text format.
+
+    With several worker processes and PROMETHEUS_MULTIPROC_DIR set, the
+    request and command metrics are aggregated across workers; the
+    in-process cache stats are per worker and are left out.
+    """
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
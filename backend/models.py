@@ -1,5 +1,5 @@
-from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
+from pydantic import BaseModel, Field, field_validator, model_validator
+from typing import List, Optional, Dict, Any, Tuple
 from datetime import datetime
 import uuid
 
@@ -121,6 +121,15 @@ class PlayerGameState(BaseDocument):
     unlocked_achievements: List[str] = []
     statistics: GameStatistics = GameStatistics()
     settings: GameSettings = GameSettings()
+    # Incremented by every change; GET /api/game/state?since=<revision> returns
+    # only the fields changed after it
+    revision: int = 0
+
+    @field_validator("level_progress", mode="before")
+    @classmethod
+    def _level_progress_entries(cls, value):
+        # Documents stored in the "map" layout key progress by level_id
+        return list(value.values()) if isinstance(value, dict) else value
 
 # Game Session Models
 class GameSession(BaseDocument):
@@ -133,14 +142,83 @@ class GameSession(BaseDocument):
     grabs_count: int = 0
     releases_count: int = 0
     teleports_count: int = 0
+    last_heartbeat: Optional[datetime] = None
+    expires_at: Optional[datetime] = None  # TTL; cleared once the session ends
+
+class SessionDailyRollup(BaseModel):
+    player_id: str
+    day: str  # YYYY-MM-DD (UTC)
+    sessions: int = 0
+    completed_sessions: int = 0
+    total_completion_time: int = 0  # milliseconds
+    grabs_count: int = 0
+    releases_count: int = 0
+    teleports_count: int = 0
+
+# Leaderboard Models
+class LeaderboardEntry(BaseModel):
+    level_id: str
+    player_id: str
+    best_time: int  # milliseconds
+    achieved_at: datetime
+    rank: Optional[int] = None
+
+# Analytics Models
+class LevelAnalytics(BaseModel):
+    level_id: str
+    order: int
+    sessions_started: int = 0
+    completed_sessions: int = 0
+    completions: int = 0
+    first_completions: int = 0  # Players who have completed the level
+    completion_rate: Optional[float] = None  # completed_sessions / sessions_started
+    median_completion_time: Optional[int] = None  # milliseconds, estimated from a histogram
+    mean_completion_time: Optional[int] = None  # milliseconds
+    teleports_per_completion: Optional[float] = None
+    drop_off_to_next: Optional[float] = None  # Share of this level's players who have not completed the next
+
+class DailyAnalytics(BaseModel):
+    day: str  # YYYY-MM-DD (UTC)
+    sessions_started: int = 0
+    completions: int = 0
+    grabs: int = 0
+    releases: int = 0
+    teleports: int = 0
+    play_time: int = 0  # seconds
+    teleports_per_session: Optional[float] = None
+
+# Replay trace event kinds
+REPLAY_GRAB = 0
+REPLAY_MOVE = 1
+REPLAY_RELEASE = 2
+
+class ReplayTrace(BaseModel):
+    """Input recorded by the client while playing a level, for server-side replay"""
+    tick_rate: int = Field(default=60, ge=30, le=240)  # physics steps per second
+    # [tick, kind, ball_index, x, y, z] in tick order: a grab at the hand
+    # position, a move of the held ball to x, y, z, or a release. A release
+    # keeps the velocity of a move in the same tick
+    events: List[Tuple[int, int, int, float, float, float]] = Field(default_factory=list, max_length=36000)
+
+    @field_validator("events")
+    @classmethod
+    def _ordered_events(cls, events):
+        previous = 0
+        for tick, kind, ball, *_ in events:
+            if tick < previous or kind not in (REPLAY_GRAB, REPLAY_MOVE, REPLAY_RELEASE) or ball < 0:
+                raise ValueError("events must be [tick, kind, ball, x, y, z] in tick order")
+            previous = tick
+        return events
 
 # API Request/Response Models
 class LevelCompleteRequest(BaseModel):
     level_id: str
-    completion_time: int
+    completion_time: int = Field(..., gt=0)  # milliseconds
     grabs_count: int = 0
     releases_count: int = 0
     teleports_count: int = 0
+    session_id: Optional[str] = None  # Ends this session as completed
+    replay: Optional[ReplayTrace] = None  # Checked when replay verification is enabled
 
 class UpdateSettingsRequest(BaseModel):
     settings: GameSettings
@@ -154,12 +232,37 @@ class SelectHandSkinRequest(BaseModel):
 class StartGameSessionRequest(BaseModel):
     level_id: str
 
+class SessionHeartbeatRequest(BaseModel):
+    grabs_count: int = 0
+    releases_count: int = 0
+    teleports_count: int = 0
+
+class EndGameSessionRequest(BaseModel):
+    completed: bool = False
+    completion_time: Optional[int] = Field(default=None, gt=0)  # milliseconds
+    grabs_count: int = 0
+    releases_count: int = 0
+    teleports_count: int = 0
+    replay: Optional[ReplayTrace] = None  # Checked like LevelCompleteRequest.replay when completed
+
+    @model_validator(mode="after")
+    def _completed_has_time(self):
+        if self.completed and self.completion_time is None:
+            raise ValueError("completion_time is required when completed is true")
+        return self
+
 class UpdateGameStatsRequest(BaseModel):
     grabs: int = 0
     releases: int = 0
     teleports: int = 0
     play_time: int = 0  # seconds
 
+class PlayerStatsUpdate(UpdateGameStatsRequest):
+    player_id: str = "default"
+
+class BatchUpdateGameStatsRequest(BaseModel):
+    updates: List[PlayerStatsUpdate] = Field(..., max_length=1000)
+
 # Response Models
 class GameStateResponse(BaseModel):
     success: bool
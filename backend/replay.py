@@ -0,0 +1,357 @@
+from typing import List, Optional, Dict, Any, Tuple, NamedTuple, Union
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from models import GameLevel, ReplayTrace, REPLAY_GRAB, REPLAY_MOVE, REPLAY_RELEASE
+import asyncio
+import math
+import multiprocessing
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Body parameters mirrored from the client's physics setup (GameBall,
+# Teleporter). Balls rest on a ground plane at y=0
+BALL_RADIUS = 0.3
+BALL_RESTITUTION = 0.6
+BALL_FRICTION = 0.4
+FLOOR_HEIGHT = 0.0
+TELEPORTER_SIZE = (1.0, 2.0, 1.0)
+TELEPORT_COOLDOWN_MS = 1000
+# How far (m) from a ball a grab may start, and how fast (m/s) a held ball
+# can be moved by the hand
+GRAB_REACH = 2.0
+MAX_HAND_SPEED = 20.0
+
+# "off" trusts the claimed completion time, "optional" checks completions
+# that carry a replay and "required" rejects completions without one
+REPLAY_MODES = ["off", "optional", "required"]
+
+class ReplayRejected(ValueError):
+    """A level completion whose replay does not reproduce the claimed result"""
+
+class ReplayUnavailable(RuntimeError):
+    """Replay verification could not run, for example because the worker pool broke"""
+
+class SimulationFailed(NamedTuple):
+    """Stands in for the result of a submission the simulator raised on"""
+    error: str
+
+def level_payload(level: GameLevel) -> Dict[str, Any]:
+    """The parts of a level the simulator needs, as plain picklable values"""
+    teleporters = level.teleporters or []
+    positions = {teleporter.id: teleporter.position for teleporter in teleporters}
+    shift = level.gravity_shift_trigger
+    return {
+        "balls": [ball.position for ball in level.balls],
+        "gravity": level.gravity,
+        "gravity_shift": (shift.time, shift.new_gravity) if shift else None,
+        "targets": [(target.position, target.size) for target in level.targets],
+        # (entry position, exit position); links to missing teleporters are dropped
+        "teleporters": [
+            (teleporter.position, positions[teleporter.linked_to])
+            for teleporter in teleporters if teleporter.linked_to in positions
+        ]
+    }
+
+def _pad(rows: List[List[Any]], width: int, fill: float = 0.0) -> np.ndarray:
+    """Stack per-submission lists of 3-vectors into a (submissions, width, 3) array"""
+    array = np.full((len(rows), max(width, 1), 3), fill)
+    for index, row in enumerate(rows):
+        if row:
+            array[index, :len(row)] = row
+    return array
+
+def _mask(counts: List[int], width: int) -> np.ndarray:
+    return np.arange(max(width, 1))[None, :] < np.asarray(counts)[:, None]
+
+def _overlaps(position: np.ndarray, low: np.ndarray, high: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    """(submissions, balls, zones) sphere/box overlap for axis-aligned zones"""
+    point = position[:, :, None, :]
+    closest = np.clip(point, low[:, None], high[:, None])
+    distance = np.sum((point - closest) ** 2, axis=-1)
+    return (distance < BALL_RADIUS ** 2) & mask[:, None, :]
+
+def simulate_batch(submissions: List[Dict[str, Any]]) -> List[Optional[int]]:
+    """Replay a batch of input traces and return each one's completion time.
+
+    Each submission holds a ``level`` payload, its ``events`` as an (n, 6)
+    array of [tick, kind, ball, x, y, z], the ``tick_rate`` and ``max_ticks``.
+    All submissions advance together on (submissions, balls, 3) arrays with a
+    fixed-step semi-implicit Euler integrator. The result is the time in
+    milliseconds of the first tick at which every ball overlaps a target, or
+    None if that does not happen within ``max_ticks``.
+    """
+    count = len(submissions)
+    if not count:
+        return []
+    levels = [submission["level"] for submission in submissions]
+    ball_counts = [len(level["balls"]) for level in levels]
+    target_counts = [len(level["targets"]) for level in levels]
+    teleporter_counts = [len(level["teleporters"]) for level in levels]
+    max_balls, max_targets, max_teleporters = max(ball_counts), max(target_counts), max(teleporter_counts)
+
+    position = _pad([level["balls"] for level in levels], max_balls)
+    velocity = np.zeros_like(position)
+    balls = _mask(ball_counts, max_balls)
+    grabbed = np.zeros(balls.shape, dtype=bool)
+
+    target_center = _pad([[t[0] for t in level["targets"]] for level in levels], max_targets)
+    target_half = _pad([[t[1] for t in level["targets"]] for level in levels], max_targets) / 2
+    targets = _mask(target_counts, max_targets)
+    teleporter_center = _pad([[t[0] for t in level["teleporters"]] for level in levels], max_teleporters)
+    teleporter_exit = _pad([[t[1] for t in level["teleporters"]] for level in levels], max_teleporters)
+    teleporters = _mask(teleporter_counts, max_teleporters)
+    teleporter_half = np.asarray(TELEPORTER_SIZE) / 2
+
+    tick_rate = np.asarray([submission["tick_rate"] for submission in submissions], dtype=float)
+    dt = (1.0 / tick_rate)[:, None, None]
+    gravity = np.asarray([level["gravity"] for level in levels], dtype=float)[:, None, :]
+    # Tick at which each submission's gravity shifts (never, if it has no trigger)
+    shift_tick = np.full(count, -1)
+    shifted_gravity = gravity.copy()
+    for index, level in enumerate(levels):
+        if level["gravity_shift"]:
+            shift_time, new_gravity = level["gravity_shift"]
+            shift_tick[index] = max(1, math.ceil(shift_time * tick_rate[index] / 1000))
+            shifted_gravity[index, 0] = new_gravity
+    cooldown_ticks = np.ceil(TELEPORT_COOLDOWN_MS * tick_rate / 1000)[:, None]
+    teleport_ready = np.zeros(balls.shape)
+    max_ticks = np.asarray([submission["max_ticks"] for submission in submissions])
+
+    # All events of the batch, ordered by tick and then by their order in the trace
+    columns = [
+        np.column_stack([submission["events"][:, :3], np.full(len(submission["events"]), index),
+                         submission["events"][:, 3:]])
+        for index, submission in enumerate(submissions) if len(submission["events"])
+    ]
+    events = np.concatenate(columns) if columns else np.zeros((0, 7))
+    events = events[np.argsort(events[:, 0], kind="stable")]
+    event_ticks = events[:, 0].astype(int)
+    event_kinds = events[:, 1].astype(int)
+    event_balls = events[:, 2].astype(int)
+    event_submissions = events[:, 3].astype(int)
+    event_positions = events[:, 4:]
+
+    completed_at = np.full(count, -1)
+    running = np.ones(count, dtype=bool)
+    first_event = 0
+    tick = 0
+    while running.any():
+        tick += 1
+        last_event = np.searchsorted(event_ticks, tick, side="right")
+        # A held ball is still unless the hand moved it this tick
+        velocity[grabbed] = 0.0
+        # Within a tick, grabs apply before moves and moves before releases
+        for kind in (REPLAY_GRAB, REPLAY_MOVE, REPLAY_RELEASE):
+            selected = first_event + np.flatnonzero(event_kinds[first_event:last_event] == kind)
+            if not len(selected):
+                continue
+            s, b, hand = event_submissions[selected], event_balls[selected], event_positions[selected]
+            if kind == REPLAY_GRAB:
+                reach = np.linalg.norm(hand - position[s, b], axis=-1) <= GRAB_REACH
+                grabbed[s[reach], b[reach]] = True
+            elif kind == REPLAY_MOVE:
+                held = grabbed[s, b]
+                s, b, hand = s[held], b[held], hand[held]
+                step = hand - position[s, b]
+                step_dt = dt[s, 0]
+                length = np.linalg.norm(step, axis=-1, keepdims=True)
+                limit = MAX_HAND_SPEED * step_dt
+                step *= np.minimum(1.0, limit / np.maximum(length, 1e-12))
+                position[s, b] += step
+                velocity[s, b] = step / step_dt
+            else:
+                grabbed[s, b] = False
+        first_event = last_event
+
+        # Gravity shifts stop every ball, as on the client
+        shifting = shift_tick == tick
+        if shifting.any():
+            gravity[shifting] = shifted_gravity[shifting]
+            velocity[shifting] = 0.0
+
+        # Held balls only move with the hand; a release keeps the last hand velocity
+        free = balls & ~grabbed
+        velocity += np.where(free[..., None], gravity * dt, 0.0)
+        position += np.where(free[..., None], velocity * dt, 0.0)
+
+        # Ground plane: bounce with restitution and slow horizontal motion by friction
+        floor = BALL_RADIUS + FLOOR_HEIGHT
+        contact = free & (position[..., 1] <= floor)
+        position[..., 1] = np.where(contact, floor, position[..., 1])
+        falling = contact & (velocity[..., 1] < 0)
+        bounce = -velocity[..., 1] * BALL_RESTITUTION
+        # Bounces too small to leave the ground come to rest
+        bounce = np.where(bounce < 2 * np.abs(gravity[..., 1]) * dt[..., 0], 0.0, bounce)
+        velocity[..., 1] = np.where(falling, bounce, velocity[..., 1])
+        horizontal = velocity[..., [0, 2]]
+        speed = np.linalg.norm(horizontal, axis=-1)
+        braking = BALL_FRICTION * np.maximum(-gravity[..., 1], 0.0) * dt[..., 0]
+        scale = np.where(speed > 0, np.maximum(speed - braking, 0.0) / np.maximum(speed, 1e-12), 1.0)
+        velocity[..., [0, 2]] = np.where(contact[..., None], horizontal * scale[..., None], horizontal)
+
+        # Teleporters move a ball to the linked teleporter, then cool down
+        if max_teleporters and teleporters.any():
+            entered = _overlaps(position, teleporter_center - teleporter_half,
+                                teleporter_center + teleporter_half, teleporters)
+            entered &= (balls & (teleport_ready <= tick))[..., None]
+            teleporting = entered.any(axis=-1)
+            if teleporting.any():
+                which = entered.argmax(axis=-1)
+                exits = np.take_along_axis(teleporter_exit, which[..., None].repeat(3, axis=-1), axis=1)
+                position = np.where(teleporting[..., None], exits, position)
+                teleport_ready = np.where(teleporting, tick + cooldown_ticks, teleport_ready)
+
+        in_target = _overlaps(position, target_center - target_half, target_center + target_half, targets)
+        complete = (in_target.any(axis=-1) | ~balls).all(axis=-1) & running
+        completed_at[complete] = tick
+        running &= ~complete & (tick < max_ticks)
+
+    return [
+        int(round(ticks * 1000 / rate)) if ticks >= 0 else None
+        for ticks, rate in zip(completed_at, tick_rate)
+    ]
+
+def simulate_batch_isolated(submissions: List[Dict[str, Any]]) -> List[Union[Optional[int], SimulationFailed]]:
+    """simulate_batch, except that a submission the simulator raises on fails only itself.
+
+    The batch is simulated together first; if that raises, each submission
+    is simulated alone and the ones that still raise get a SimulationFailed.
+    """
+    try:
+        return simulate_batch(submissions)
+    except Exception:
+        results = []
+        for submission in submissions:
+            try:
+                results.extend(simulate_batch([submission]))
+            except Exception as e:
+                results.append(SimulationFailed(f"{type(e).__name__}: {e}"))
+        return results
+
+class ReplayVerifier:
+    """Checks level completion times by replaying the client's input trace.
+
+    Submissions are collected for up to ``batch_window`` seconds (or until
+    ``batch_size`` are waiting) and simulated together in a process pool, so
+    verification never runs on the event loop and the per-tick NumPy work is
+    shared across submissions. A completion passes when the replay finishes
+    the level within ``tolerance_ms`` of the claimed time.
+    """
+    def __init__(self, max_workers: Optional[int] = None, batch_size: int = 64,
+                 batch_window: float = 0.02, tolerance_ms: int = 250, max_replay_seconds: int = 600):
+        self.max_workers = max_workers
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.tolerance_ms = tolerance_ms
+        self.max_replay_seconds = max_replay_seconds
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pending: List[Tuple[Dict[str, Any], asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._batches: set = set()
+        self.received = 0
+        self.rejected = 0
+        self.batches = 0
+
+    def start(self):
+        """Start the worker processes"""
+        if not self._pool:
+            # Spawned rather than forked: the parent has driver and event loop
+            # threads that a forked child would inherit mid-operation
+            self._pool = ProcessPoolExecutor(self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+
+    async def stop(self):
+        """Finish the queued verifications and shut the worker processes down"""
+        self._dispatch()
+        if self._batches:
+            await asyncio.gather(*self._batches, return_exceptions=True)
+        if self._pool:
+            self._pool.shutdown()
+            self._pool = None
+
+    async def verify(self, level: GameLevel, trace: ReplayTrace, completion_time: int) -> int:
+        """Replay a trace and return the verified completion time in milliseconds.
+
+        Raises ReplayRejected if the trace does not complete the level, its
+        completion time is too far from the claimed one or the simulator
+        fails on it, and ReplayUnavailable if the worker pool fails.
+        """
+        self.received += 1
+        if any(event[2] >= len(level.balls) for event in trace.events):
+            self.rejected += 1
+            raise ReplayRejected("Replay refers to a ball the level does not have")
+        limit_ms = min(completion_time + self.tolerance_ms, self.max_replay_seconds * 1000)
+        submission = {
+            "level": level_payload(level),
+            "events": np.asarray(trace.events, dtype=float).reshape(-1, 6),
+            "tick_rate": trace.tick_rate,
+            "max_ticks": math.ceil(limit_ms * trace.tick_rate / 1000)
+        }
+
+        replayed = await self._submit(submission)
+        if isinstance(replayed, SimulationFailed):
+            self.rejected += 1
+            logger.warning(f"Replay could not be simulated: {replayed.error}")
+            raise ReplayRejected("Replay could not be simulated")
+        if replayed is None:
+            self.rejected += 1
+            raise ReplayRejected("Replay does not complete the level")
+        if abs(replayed - completion_time) > self.tolerance_ms:
+            self.rejected += 1
+            raise ReplayRejected(f"Replay completes the level in {replayed} ms, not {completion_time} ms")
+        return replayed
+
+    def _submit(self, submission: Dict[str, Any]) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((submission, future))
+        if len(self._pending) >= self.batch_size:
+            self._dispatch()
+        elif not self._timer:
+            self._timer = loop.call_later(self.batch_window, self._dispatch)
+        return future
+
+    def _dispatch(self):
+        """Send everything queued to the pool as one batch"""
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        task = asyncio.ensure_future(self._run_batch(batch))
+        self._batches.add(task)
+        task.add_done_callback(self._batches.discard)
+
+    async def _run_batch(self, batch: List[Tuple[Dict[str, Any], asyncio.Future]]):
+        self.start()
+        self.batches += 1
+        loop = asyncio.get_running_loop()
+        try:
+            results = await loop.run_in_executor(
+                self._pool, simulate_batch_isolated, [submission for submission, _ in batch]
+            )
+        except Exception as e:
+            # Bad submissions are caught in the worker, so this is the pool itself
+            logger.error(f"Error replaying batch of {len(batch)}: {e}")
+            if isinstance(e, BrokenProcessPool) and self._pool:
+                # Replaced by a fresh pool on the next batch
+                self._pool.shutdown(wait=False)
+                self._pool = None
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(ReplayUnavailable(f"Replay verification failed: {e}"))
+            return
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "received": self.received,
+            "rejected": self.rejected,
+            "batches": self.batches,
+            "pending": len(self._pending),
+            "in_flight_batches": len(self._batches)
+        }
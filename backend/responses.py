@@ -0,0 +1,205 @@
+from typing import Any, Dict, Optional, Tuple
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+import gzip
+import hashlib
+import json
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is an optional speed-up
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli is optional; gzip is always available
+    brotli = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - without msgpack every client gets JSON
+    msgpack = None
+
+# Content codings this process can produce, best first
+CONTENT_CODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack")
+
+# Content types worth compressing; everything else (images, event streams) is sent as-is
+COMPRESSIBLE_TYPES = ("application/json", "application/msgpack", "application/x-msgpack", "text/")
+
+def _default(obj: Any) -> Any:
+    """Serialize values orjson does not handle natively"""
+    if isinstance(obj, BaseModel):
+        return obj.model_dump()
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+def render_json(content: Any) -> bytes:
+    """Render content to JSON bytes the same way FastJSONResponse does"""
+    return FastJSONResponse(content).body
+
+def etag_for(body: bytes) -> str:
+    """Strong ETag derived from the response body"""
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Check an If-None-Match header against an ETag (weak comparison)"""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or any(tag.removeprefix("W/") == etag for tag in candidates)
+
+def compress(body: bytes, encoding: str, level: Optional[int] = None) -> bytes:
+    """Compress a body with "br" or "gzip"; level defaults to each codec's maximum"""
+    if encoding == "br":
+        return brotli.compress(body, quality=11 if level is None else level)
+    return gzip.compress(body, compresslevel=9 if level is None else level, mtime=0)
+
+def header_qualities(value: str) -> Dict[str, float]:
+    """Map each token of an Accept-style header to its q-value (1 when unset,
+    0 when unparseable)"""
+    qualities: Dict[str, float] = {}
+    for item in value.split(","):
+        token, *params = [part.strip() for part in item.split(";")]
+        if not token:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, raw = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(raw.strip())
+                except ValueError:
+                    quality = 0.0
+        qualities[token.lower()] = quality
+    return qualities
+
+def accepted_encoding(headers: Headers) -> Optional[str]:
+    """The content coding to use for a client: the one it weights highest,
+    br before gzip on ties, or none if it accepts neither"""
+    qualities = header_qualities(headers.get("accept-encoding", ""))
+    # "*" covers codings the header does not name
+    wildcard = qualities.get("*", 0.0)
+    weighted = [(qualities.get(coding, wildcard), coding) for coding in CONTENT_CODINGS]
+    best = max(weighted, key=lambda item: item[0])
+    return best[1] if best[0] > 0 else None
+
+def wants_msgpack(headers: Headers) -> bool:
+    """Whether the client asked for MessagePack and it can be produced"""
+    qualities = header_qualities(headers.get("accept", ""))
+    return msgpack is not None and any(qualities.get(media_type, 0.0) > 0 for media_type in MSGPACK_MEDIA_TYPES)
+
+class PrecomputedBody:
+    """A serialized response body and its ETag.
+
+    MessagePack and compressed variants are built on first request and kept
+    with the body, at the codecs' highest settings since each is built once
+    per catalog load.
+    """
+    def __init__(self, content: Any):
+        self.body = render_json(content)
+        self.etag = etag_for(self.body)
+        self._variants: Dict[Tuple[str, Optional[str]], Tuple[bytes, str]] = {}
+
+    def variant(self, media_type: str, encoding: Optional[str]) -> Tuple[bytes, str]:
+        """Body and ETag for a media type and content coding"""
+        key = (media_type, encoding)
+        if key not in self._variants:
+            if encoding:
+                body, etag = self.variant(media_type, None)
+                self._variants[key] = (compress(body, encoding), etag[:-1] + f'-{encoding}"')
+            elif media_type != "application/json":
+                body = msgpack.packb(json.loads(self.body))
+                self._variants[key] = (body, etag_for(body))
+            else:
+                self._variants[key] = (self.body, self.etag)
+        return self._variants[key]
+
+def conditional_response(request: Request, precomputed: PrecomputedBody, max_age: int,
+                         compress_min_size: Optional[int] = None) -> Response:
+    """Serve a precomputed body as JSON or MessagePack, compressed when it is
+    at least compress_min_size bytes, or 304 if the client already has it"""
+    media_type = "application/msgpack" if wants_msgpack(request.headers) else "application/json"
+    encoding = accepted_encoding(request.headers)
+    if compress_min_size is None or len(precomputed.variant(media_type, None)[0]) < compress_min_size:
+        encoding = None
+    body, etag = precomputed.variant(media_type, encoding)
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"public, max-age={max_age}, stale-while-revalidate={max_age}",
+        "Vary": "Accept, Accept-Encoding"
+    }
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(content=body, media_type=media_type, headers=headers)
+
+class CompressionMiddleware:
+    """Compresses complete responses of at least minimum_size bytes with
+    brotli or gzip, whichever the client accepts (brotli preferred).
+
+    Streaming responses (server-sent events, exports) and responses that
+    already carry a Content-Encoding pass through untouched.
+    """
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.levels = {"gzip": gzip_level, "br": brotli_quality}
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        encoding = accepted_encoding(Headers(scope=scope)) if scope["type"] == "http" else None
+        if not encoding:
+            await self.app(scope, receive, send)
+            return
+
+        start: Optional[Message] = None
+
+        async def send_wrapper(message: Message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                # Held back until the first body chunk shows whether to compress
+                start = message
+                return
+            if message["type"] != "http.response.body" or start is None:
+                await send(message)
+                return
+            response_start, start = start, None
+            headers = MutableHeaders(scope=response_start)
+            body = message.get("body", b"")
+            if (
+                message.get("more_body", False)
+                or "content-encoding" in headers
+                or len(body) < self.minimum_size
+                or not headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES)
+            ):
+                await send(response_start)
+                await send(message)
+                return
+            body = compress(body, encoding, self.levels[encoding])
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(body))
+            headers.add_vary_header("Accept-Encoding")
+            etag = headers.get("etag")
+            if etag and not etag.startswith("W/"):
+                headers["ETag"] = "W/" + etag
+            await send(response_start)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_wrapper)
+
+class FastJSONResponse(JSONResponse):
+    """JSON response for already-typed data, rendered with orjson when available.
+
+    Returning this from a route bypasses FastAPI's response_model validation,
+    so it must only carry data that was validated on the way into the
+    database or catalog cache.
+    """
+    def render(self, content: Any) -> bytes:
+        if orjson is not None:
+            return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+        return super().render(jsonable_encoder(content))
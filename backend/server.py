@@ -1,46 +1,241 @@
-from fastapi import FastAPI, APIRouter, HTTPException
+from fastapi import FastAPI, APIRouter, HTTPException, Query, Request
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import Response, StreamingResponse
 from motor.motor_asyncio import AsyncIOMotorClient
 import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field
-from typing import List
+from typing import List, Literal, Optional
 import uuid
 from datetime import datetime
 from contextlib import asynccontextmanager
+import asyncio
 
 # Import game models and services
 from models import (
     StatusCheck, StatusCheckCreate, PlayerGameState, GameLevel, HandSkin, Achievement,
     LevelCompleteRequest, UpdateSettingsRequest, SelectHandSkinRequest,
-    StartGameSessionRequest, UpdateGameStatsRequest,
+    StartGameSessionRequest, UpdateGameStatsRequest, BatchUpdateGameStatsRequest,
+    SessionHeartbeatRequest, EndGameSessionRequest,
     GameStateResponse, LevelListResponse, HandSkinListResponse, AchievementListResponse,
     GenericResponse
 )
-from game_service import GameService
+from game_service import GameService, UnknownLevel
+from level_bundle import LevelBundle
+from storage import GameStorage, MotorGameStorage, MemoryGameStorage, WriteBehindStorage
+from stats_aggregator import StatsAggregator
+from replay import ReplayVerifier, ReplayRejected, ReplayUnavailable
+from events import EventBroker, LocalBroker, HubBroker, sse_stream
+from responses import FastJSONResponse, CompressionMiddleware, conditional_response
+from metrics import (
+    CONTENT_TYPE_LATEST, MetricsMiddleware, MongoCommandMetrics, SlowTraceBuffer,
+    register_stats_sources, render_metrics
+)
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
+# Prometheus metrics on /metrics, including per-command MongoDB latency
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() == 'true'
+
+# MongoDB connection settings. Each setting is passed to the driver only
+# when its variable is set, so unset ones keep the driver defaults
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+MONGO_CLIENT_OPTIONS = {
+    option: cast(os.environ[name])
+    for name, option, cast in [
+        ('MONGO_MAX_POOL_SIZE', 'maxPoolSize', int),
+        ('MONGO_MIN_POOL_SIZE', 'minPoolSize', int),
+        ('MONGO_MAX_IDLE_TIME_MS', 'maxIdleTimeMS', int),
+        ('MONGO_MAX_CONNECTING', 'maxConnecting', int),
+        ('MONGO_WAIT_QUEUE_TIMEOUT_MS', 'waitQueueTimeoutMS', int),
+        ('MONGO_CONNECT_TIMEOUT_MS', 'connectTimeoutMS', int),
+        ('MONGO_SOCKET_TIMEOUT_MS', 'socketTimeoutMS', int),
+        ('MONGO_SERVER_SELECTION_TIMEOUT_MS', 'serverSelectionTimeoutMS', int),
+        ('MONGO_READ_PREFERENCE', 'readPreference', str),  # e.g. secondaryPreferred
+        ('MONGO_WRITE_CONCERN', 'w', lambda value: int(value) if value.isdigit() else value),  # 1, majority
+        ('MONGO_JOURNAL', 'journal', lambda value: value.lower() == 'true')
+    ]
+    if os.environ.get(name)
+}
+
+# Created in lifespan so every worker process opens its own connection pool
+# instead of inheriting sockets from a pre-fork parent
+client: Optional[AsyncIOMotorClient] = None
+db = None
+
+def create_mongo_client() -> AsyncIOMotorClient:
+    """Create the Motor client from MONGO_URL and the MONGO_* pool settings"""
+    return AsyncIOMotorClient(
+        mongo_url,
+        event_listeners=[MongoCommandMetrics()] if METRICS_ENABLED else [],
+        **MONGO_CLIENT_OPTIONS
+    )
+
+# Opt-in fast serialization: trusted data is rendered with orjson and
+# returned directly, skipping response_model re-validation
+FAST_JSON_RESPONSES = os.environ.get('FAST_JSON_RESPONSES', 'false').lower() == 'true'
+
+# Cache-Control max-age (seconds) for catalog responses; clients and CDNs
+# revalidate with If-None-Match once it lapses
+CATALOG_CACHE_MAX_AGE = int(os.environ.get('CATALOG_CACHE_MAX_AGE', '3600'))
+
+# Most players one /api/game/states request may ask for
+STATE_BATCH_MAX_PLAYERS = int(os.environ.get('STATE_BATCH_MAX_PLAYERS', '100'))
+
+# Responses of at least COMPRESSION_MIN_SIZE bytes are brotli- or gzip-compressed
+# for clients that accept it (0 disables compression)
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', '1024'))
+
+# Game data backend: "mongo" (default) or "memory" for tests, benchmarks and
+# single-process deployments that do not need persistence (each worker
+# would hold its own copy)
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'mongo').lower()
+
+# "list" (default) or "map": store level_progress keyed by level_id so
+# completions and single-level reads address the entry directly
+LEVEL_PROGRESS_LAYOUT = os.environ.get('LEVEL_PROGRESS_LAYOUT', 'list').lower()
+
+# "write_behind" keeps hot player states in an LRU cache, applies settings,
+# skin, stat and unlock changes there and writes them back in bulk at least
+# every PLAYER_CACHE_MAX_UNFLUSHED_MS (what a crash can lose). Needs each
+# player served by one worker: WEB_CONCURRENCY=1 or player-affine routing
+PLAYER_STATE_CACHE = os.environ.get('PLAYER_STATE_CACHE', 'off').lower()
+
+def create_storage(backend: str) -> GameStorage:
+    """Create the game storage backend selected by STORAGE_BACKEND"""
+    if backend == 'memory':
+        storage = MemoryGameStorage(LEVEL_PROGRESS_LAYOUT)
+    elif backend == 'mongo':
+        storage = MotorGameStorage(db, LEVEL_PROGRESS_LAYOUT)
+    else:
+        raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
+    if PLAYER_STATE_CACHE == 'write_behind':
+        return WriteBehindStorage(
+            storage,
+            capacity=int(os.environ.get('PLAYER_CACHE_SIZE', '10000')),
+            ttl=float(os.environ.get('PLAYER_CACHE_TTL_SECONDS', '300')),
+            max_unflushed=float(os.environ.get('PLAYER_CACHE_MAX_UNFLUSHED_MS', '1000')) / 1000,
+            flush_batch_size=int(os.environ.get('PLAYER_CACHE_FLUSH_BATCH_SIZE', '500'))
+        )
+    if PLAYER_STATE_CACHE != 'off':
+        raise ValueError(f"Unknown PLAYER_STATE_CACHE: {PLAYER_STATE_CACHE}")
+    return storage
+
+# Server-side replay of level completions: "off" (default), "optional"
+# (completions that include a replay are checked) or "required". Each worker
+# process runs its own pool of REPLAY_WORKERS simulator processes
+REPLAY_VERIFICATION = os.environ.get('REPLAY_VERIFICATION', 'off').lower()
+
+def create_replay_verifier() -> Optional[ReplayVerifier]:
+    """Create the replay verifier unless REPLAY_VERIFICATION is off"""
+    if REPLAY_VERIFICATION == 'off':
+        return None
+    workers = os.environ.get('REPLAY_WORKERS')
+    return ReplayVerifier(
+        max_workers=int(workers) if workers else None,
+        batch_size=int(os.environ.get('REPLAY_BATCH_SIZE', '64')),
+        batch_window=float(os.environ.get('REPLAY_BATCH_WINDOW_MS', '20')) / 1000,
+        tolerance_ms=int(os.environ.get('REPLAY_TOLERANCE_MS', '250'))
+    )
+
+# Unlock events pushed on /api/game/events: "local" (default) fans out within
+# this process; "hub" also relays through the event hub at EVENT_HUB_ADDRESS
+# (python events.py hub) so a player's stream may be held by any worker
+EVENT_BROKER = os.environ.get('EVENT_BROKER', 'local').lower()
+
+def create_event_broker() -> EventBroker:
+    """Create the event broker selected by EVENT_BROKER"""
+    if EVENT_BROKER == 'hub':
+        return HubBroker(os.environ.get('EVENT_HUB_ADDRESS', 'tcp://127.0.0.1:8765'))
+    if EVENT_BROKER == 'local':
+        return LocalBroker()
+    raise ValueError(f"Unknown EVENT_BROKER: {EVENT_BROKER}")
 
-# Initialize game service
-game_service = GameService(db)
+# Path of a level bundle built with python level_bundle.py build. When set,
+# levels are served from the memory-mapped bundle instead of the levels collection
+LEVEL_BUNDLE = os.environ.get('LEVEL_BUNDLE')
+
+# Game service and stats aggregator, created in lifespan unless bound beforehand
+game_service: Optional[GameService] = None
+stats_aggregator: Optional[StatsAggregator] = None
+
+def create_services():
+    """Connect to the database and create the game service for this worker"""
+    global client, db, game_service, stats_aggregator
+    client = create_mongo_client()
+    db = client[os.environ['DB_NAME']]
+    game_service = GameService(
+        create_storage(STORAGE_BACKEND),
+        session_ttl=int(os.environ.get('SESSION_TTL_SECONDS', '1800')),
+        session_retention_days=int(os.environ.get('SESSION_RETENTION_DAYS', '7')),
+        replay_verifier=create_replay_verifier(),
+        replay_mode=REPLAY_VERIFICATION,
+        event_broker=create_event_broker(),
+        level_bundle=LevelBundle(LEVEL_BUNDLE) if LEVEL_BUNDLE else None
+    )
+    # Coalesces batched stats updates into periodic bulk writes; increments
+    # that fail STATS_MAX_FLUSH_ATTEMPTS flushes in a row are logged and dropped
+    stats_aggregator = StatsAggregator(
+        game_service,
+        flush_interval=float(os.environ.get('STATS_FLUSH_INTERVAL', '1.0')),
+        max_pending_players=int(os.environ.get('STATS_MAX_PENDING_PLAYERS', '10000')),
+        max_flush_attempts=int(os.environ.get('STATS_MAX_FLUSH_ATTEMPTS', '5'))
+    )
+
+# Requests slower than SLOW_TRACE_THRESHOLD_MS keep their span trace (a
+# SLOW_TRACE_SAMPLE_RATE fraction of them) in a ring buffer served on /metrics/traces
+slow_traces = SlowTraceBuffer(
+    threshold=float(os.environ.get('SLOW_TRACE_THRESHOLD_MS', '500')) / 1000,
+    capacity=int(os.environ.get('SLOW_TRACE_BUFFER_SIZE', '100')),
+    sample_rate=float(os.environ.get('SLOW_TRACE_SAMPLE_RATE', '1.0'))
+)
+
+async def session_rollup_loop(interval: float):
+    """Periodically roll old game sessions up into daily aggregates"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await game_service.rollup_game_sessions()
+        except Exception as e:
+            logging.error(f"Error rolling up game sessions: {e}")
 
 # Create the main app without a prefix
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Startup logic
+    # Startup logic. Services bound before startup (benchmarks, tests) are
+    # used as they are
+    owns_services = game_service is None
+    if owns_services:
+        create_services()
+    await game_service.ensure_indexes()
     await game_service.initialize_game_data()
     logging.info("Game data initialized")
+    if os.environ.get('VERIFY_QUERY_PLANS', 'false').lower() == 'true':
+        await game_service.verify_query_plans()
+    game_service.storage.start()
+    stats_aggregator.start()
+    if game_service.replay_verifier:
+        game_service.replay_verifier.start()
+    await game_service.events.start()
+    rollup_task = asyncio.create_task(
+        session_rollup_loop(float(os.environ.get('SESSION_ROLLUP_INTERVAL', '3600')))
+    )
     yield
     # Shutdown logic
-    client.close()
+    rollup_task.cancel()
+    await stats_aggregator.stop()
+    # After the aggregator, whose last flush may land in the player cache
+    await game_service.storage.stop()
+    if game_service.replay_verifier:
+        await game_service.replay_verifier.stop()
+    await game_service.events.stop()
+    if owns_services:
+        if game_service.level_bundle:
+            game_service.level_bundle.close()
+        client.close()
 
 app = FastAPI(
     title="Hand of Gravity API",
@@ -69,11 +264,33 @@ async def get_status_checks():
     status_checks = await db.status_checks.find().to_list(1000)
     return [StatusCheck(**status_check) for status_check in status_checks]
 
+def fast_envelope(data, message: str) -> FastJSONResponse:
+    """Build a success envelope for data that is already typed"""
+    return FastJSONResponse({"success": True, "data": data, "message": message})
+
 # Game API Routes
 @api_router.get("/game/state", response_model=GameStateResponse)
-async def get_game_state(player_id: str = "default"):
-    """Get current game state for player"""
+async def get_game_state(
+    player_id: str = "default",
+    since: Optional[int] = Query(None, ge=0, description="Revision the client holds; only later changes are returned")
+):
+    """Get current game state for player, or only what changed since a revision"""
     try:
+        if since is not None:
+            changes = await game_service.get_game_state_changes(player_id, since)
+            if changes is None:
+                raise HTTPException(status_code=404, detail="Game state not found")
+            revision, fields = changes
+            if not fields:
+                return Response(status_code=304)
+            return fast_envelope({**fields, "revision": revision}, "Game state changes retrieved successfully")
+        
+        if FAST_JSON_RESPONSES:
+            state_doc = await game_service.get_game_state_document(player_id)
+            if not state_doc:
+                raise HTTPException(status_code=404, detail="Game state not found")
+            return fast_envelope(state_doc, "Game state retrieved successfully")
+        
         game_state = await game_service.get_game_state(player_id)
         if not game_state:
             raise HTTPException(status_code=404, detail="Game state not found")
@@ -83,62 +300,242 @@ async def get_game_state(player_id: str = "default"):
             data=game_state,
             message="Game state retrieved successfully"
         )
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Error getting game state: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
-@api_router.get("/game/levels", response_model=LevelListResponse)
-async def get_all_levels():
-    """Get all game levels"""
+@api_router.get("/game/states", response_model=GenericResponse)
+async def get_game_states(
+    player_id: List[str] = Query(..., description="Repeat for each player"),
+    fields: Optional[List[str]] = Query(None, description="Top-level state fields to return; all if omitted")
+):
+    """Get many players' states in one query, keyed by player id; unknown players are left out"""
     try:
-        levels = await game_service.get_all_levels()
-        return LevelListResponse(
+        player_ids = list(dict.fromkeys(player_id))
+        if len(player_ids) > STATE_BATCH_MAX_PLAYERS:
+            raise HTTPException(status_code=400, detail=f"At most {STATE_BATCH_MAX_PLAYERS} players per request")
+        unknown_fields = [field for field in fields or [] if field not in PlayerGameState.model_fields]
+        if unknown_fields:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown_fields)}")
+        
+        states = await game_service.get_game_states(player_ids, fields)
+        if FAST_JSON_RESPONSES:
+            return fast_envelope(states, "Game states retrieved successfully")
+        return GenericResponse(
             success=True,
-            data=levels,
-            message="Levels retrieved successfully"
+            message="Game states retrieved successfully",
+            data=states
         )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Error getting game states: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+@api_router.get("/game/state/statistics", response_model=GenericResponse)
+async def get_game_statistics(player_id: str = "default"):
+    """Get a player's statistics"""
+    try:
+        statistics = await game_service.get_statistics(player_id)
+        if not statistics:
+            raise HTTPException(status_code=404, detail="Game state not found")
+        return GenericResponse(
+            success=True,
+            message="Statistics retrieved successfully",
+            data=statistics
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Error getting statistics: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+@api_router.get("/game/state/progress/{level_id}", response_model=GenericResponse)
+async def get_level_progress(level_id: str, player_id: str = "default"):
+    """Get a player's progress on one level"""
+    try:
+        progress = await game_service.get_level_progress(player_id, level_id)
+        if not progress:
+            raise HTTPException(status_code=404, detail="Game state not found")
+        return GenericResponse(
+            success=True,
+            message="Level progress retrieved successfully",
+            data=progress
+        )
+    except UnknownLevel as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Error getting level progress: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+# Catalog responses negotiate MessagePack (Accept: application/msgpack) and
+# carry precompressed bodies; view=render drops level metadata the client ignores
+LevelView = Literal["full", "render"]
+
+def catalog_response(request: Request, precomputed) -> Response:
+    return conditional_response(request, precomputed, CATALOG_CACHE_MAX_AGE, COMPRESSION_MIN_SIZE or None)
+
+@api_router.get("/game/levels", response_model=LevelListResponse)
+async def get_all_levels(request: Request, view: LevelView = "full"):
+    """Get all game levels"""
+    try:
+        precomputed = await game_service.get_catalog_body("render_levels" if view == "render" else "levels")
+        return catalog_response(request, precomputed)
     except Exception as e:
         logging.error(f"Error getting levels: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
 @api_router.get("/game/levels/{level_id}", response_model=GameLevel)
-async def get_level_by_id(level_id: str):
+async def get_level_by_id(level_id: str, request: Request, view: LevelView = "full"):
     """Get specific level by ID"""
     try:
-        level = await game_service.get_level_by_id(level_id)
-        if not level:
+        precomputed = await game_service.get_level_body(level_id, view)
+        if not precomputed:
             raise HTTPException(status_code=404, detail="Level not found")
-        return level
+        return catalog_response(request, precomputed)
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Error getting level: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
+@api_router.get("/game/levels/{level_id}/layout", response_model=GenericResponse)
+async def get_level_layout(level_id: str, request: Request):
+    """Get a level's bounds, teleporter links, patrol lengths and neighbouring levels"""
+    try:
+        precomputed = await game_service.get_level_layout_body(level_id)
+        if not precomputed:
+            raise HTTPException(status_code=404, detail="Level not found")
+        return catalog_response(request, precomputed)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Error getting level layout: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
 @api_router.get("/game/hand-skins", response_model=HandSkinListResponse)
-async def get_all_hand_skins():
+async def get_all_hand_skins(request: Request):
     """Get all hand skins"""
     try:
-        hand_skins = await game_service.get_all_hand_skins()
-        return HandSkinListResponse(
-            success=True,
-            data=hand_skins,
-            message="Hand skins retrieved successfully"
-        )
+        precomputed = await game_service.get_catalog_body("hand_skins")
+        return catalog_response(request, precomputed)
     except Exception as e:
         logging.error(f"Error getting hand skins: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
 @api_router.get("/game/achievements", response_model=AchievementListResponse)
-async def get_all_achievements():
+async def get_all_achievements(request: Request):
     """Get all achievements"""
     try:
-        achievements = await game_service.get_all_achievements()
-        return AchievementListResponse(
+        precomputed = await game_service.get_catalog_body("achievements")
+        return catalog_response(request, precomputed)
+    except Exception as e:
+        logging.error(f"Error getting achievements: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+@api_router.get("/game/catalog/stats", response_model=GenericResponse)
+async def get_catalog_stats():
+    """Get catalog cache hit/miss counters"""
+    return GenericResponse(
+        success=True,
+        message="Catalog cache stats retrieved successfully",
+        data=game_service.get_catalog_stats()
+    )
+
+@api_router.get("/game/leaderboard/{level_id}", response_model=GenericResponse)
+async def get_leaderboard(level_id: str, limit: int = Query(10, ge=1, le=1000)):
+    """Get the fastest players for a level"""
+    try:
+        entries = await game_service.leaderboard.get_top(level_id, limit)
+        return GenericResponse(
             success=True,
-            data=achievements,
-            message="Achievements retrieved successfully"
+            message="Leaderboard retrieved successfully",
+            data=entries
         )
     except Exception as e:
-        logging.error(f"Error getting achievements: {e}")
+        logging.error(f"Error getting leaderboard: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+@api_router.get("/game/leaderboard/{level_id}/rank", response_model=GenericResponse)
+async def get_leaderboard_rank(level_id: str, player_id: str = "default"):
+    """Get a player's rank on a level leaderboard"""
+    try:
+        entry = await game_service.leaderboard.get_rank(level_id, player_id)
+        if not entry:
+            raise HTTPException(status_code=404, detail="Player has no time on this level")
+        return GenericResponse(
+            success=True,
+            message="Leaderboard rank retrieved successfully",
+            data=entry
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Error getting leaderboard rank: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+@api_router.get("/game/events")
+async def stream_game_events(player_id: str = "default"):
+    """Stream unlock events to the player as server-sent events.
+
+    Each message's data is a JSON list of {"type", "id"} events, with type
+    level_unlocked, hand_skin_unlocked or achievement_unlocked. Opening a
+    new stream closes the player's previous one.
+    """
+    subscription = await game_service.events.subscribe(player_id)
+    return StreamingResponse(
+        sse_stream(subscription, float(os.environ.get('EVENT_KEEPALIVE_SECONDS', '15'))),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Analytics routes
+@api_router.get("/analytics/levels", response_model=GenericResponse)
+async def get_level_analytics():
+    """Get completion, timing and drop-off summaries for every level"""
+    try:
+        return GenericResponse(
+            success=True,
+            message="Level analytics retrieved successfully",
+            data=await game_service.get_level_analytics()
+        )
+    except Exception as e:
+        logging.error(f"Error getting level analytics: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+@api_router.get("/analytics/levels/{level_id}", response_model=GenericResponse)
+async def get_level_analytics_by_id(level_id: str):
+    """Get the analytics summary of one level"""
+    try:
+        summary = next((s for s in await game_service.get_level_analytics() if s.level_id == level_id), None)
+        if not summary:
+            raise HTTPException(status_code=404, detail="Level not found")
+        return GenericResponse(
+            success=True,
+            message="Level analytics retrieved successfully",
+            data=summary
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Error getting level analytics: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+@api_router.get("/analytics/daily", response_model=GenericResponse)
+async def get_daily_analytics(days: int = Query(30, ge=1, le=366)):
+    """Get daily activity totals"""
+    try:
+        return GenericResponse(
+            success=True,
+            message="Daily analytics retrieved successfully",
+            data=await game_service.get_daily_analytics(days)
+        )
+    except Exception as e:
+        logging.error(f"Error getting daily analytics: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
 @api_router.post("/game/complete-level", response_model=GenericResponse)
@@ -153,6 +550,14 @@ async def complete_level(request: LevelCompleteRequest, player_id: str = "defaul
             success=True,
             message="Level completed successfully"
         )
+    except UnknownLevel as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ReplayRejected as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except ReplayUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Error completing level: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
@@ -202,10 +607,56 @@ async def start_game_session(request: StartGameSessionRequest, player_id: str =
             message="Game session started successfully",
             data={"session_id": session_id}
         )
+    except UnknownLevel as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Error starting game session: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
+@api_router.post("/game/sessions/{session_id}/heartbeat", response_model=GenericResponse)
+async def heartbeat_game_session(session_id: str, request: SessionHeartbeatRequest, player_id: str = "default"):
+    """Record progress on an open game session"""
+    try:
+        success = await game_service.heartbeat_game_session(player_id, session_id, request)
+        if not success:
+            raise HTTPException(status_code=404, detail="Open game session not found")
+        
+        return GenericResponse(
+            success=True,
+            message="Game session updated successfully"
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Error updating game session: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+@api_router.post("/game/sessions/{session_id}/end", response_model=GenericResponse)
+async def end_game_session(session_id: str, request: EndGameSessionRequest, player_id: str = "default"):
+    """End a game session, completing its level if it was won"""
+    try:
+        success = await game_service.end_game_session(player_id, session_id, request)
+        if not success:
+            raise HTTPException(status_code=404, detail="Open game session not found")
+        
+        return GenericResponse(
+            success=True,
+            message="Game session ended successfully"
+        )
+    except UnknownLevel as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ReplayRejected as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except ReplayUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Error ending game session: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
 @api_router.post("/game/update-stats", response_model=GenericResponse)
 async def update_game_stats(request: UpdateGameStatsRequest, player_id: str = "default"):
     """Update game statistics"""
@@ -222,9 +673,55 @@ async def update_game_stats(request: UpdateGameStatsRequest, player_id: str = "d
         logging.error(f"Error updating game stats: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
+@api_router.post("/game/update-stats/batch", response_model=GenericResponse)
+async def update_game_stats_batch(request: BatchUpdateGameStatsRequest):
+    """Queue statistics increments for one or many players"""
+    try:
+        # All or nothing, so a client retrying after a 503 cannot double-count
+        if not await stats_aggregator.submit_many([(update.player_id, update) for update in request.updates]):
+            raise HTTPException(status_code=503, detail="Stats buffer is full, retry later")
+        
+        return GenericResponse(
+            success=True,
+            message="Game stats queued successfully",
+            data={"accepted": len(request.updates)}
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Error queueing game stats: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
 # Include the router in the main app
 app.include_router(api_router)
 
+if METRICS_ENABLED:
+    register_stats_sources({
+        "catalog_cache": lambda: game_service.get_catalog_stats(),
+        "leaderboard_cache": lambda: game_service.leaderboard.stats(),
+        "stats_aggregator": lambda: stats_aggregator.stats(),
+        "replay_verifier": lambda: game_service.replay_verifier.stats() if game_service.replay_verifier else {},
+        "event_broker": lambda: game_service.events.stats(),
+        "player_cache": lambda: game_service.storage.stats(),
+        "request_coalescing": lambda: game_service.get_coalescing_stats()
+    })
+
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics():
+        return Response(render_metrics(), media_type=CONTENT_TYPE_LATEST)
+
+    @app.get("/metrics/traces", include_in_schema=False)
+    async def slow_request_traces():
+        return {
+            "threshold_ms": slow_traces.threshold * 1000,
+            "recorded": slow_traces.recorded,
+            "traces": slow_traces.snapshot()
+        }
+
+# Innermost, so request metrics include compression time
+if COMPRESSION_MIN_SIZE:
+    app.add_middleware(CompressionMiddleware, minimum_size=COMPRESSION_MIN_SIZE)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
@@ -234,6 +731,11 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+if METRICS_ENABLED:
+    # Added last so it wraps every other middleware
+    # Event streams stay open for the whole session, so they are not timed
+    app.add_middleware(MetricsMiddleware, traces=slow_traces, exclude_paths=("/metrics", "/api/game/events"))
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -243,4 +745,6 @@ logger = logging.getLogger(__name__)
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run("server:app", host="0.0.0.0", port=8000, reload=True)
+    # Development server; production runs gunicorn -c gunicorn.conf.py server:app
+    workers = int(os.environ.get('WEB_CONCURRENCY', '1'))
+    uvicorn.run("server:app", host="0.0.0.0", port=8000, workers=workers, reload=workers == 1)
@@ -0,0 +1,85 @@
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, TypeVar
+from contextlib import asynccontextmanager
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+class SingleFlight:
+    """Shares one in-flight call among concurrent identical reads.
+
+    Calls are grouped (GameService groups them by player) and keyed within
+    the group. The first caller starts the call as a task and everyone
+    asking for the same key while it runs awaits that task, so a burst of
+    identical reads costs one storage round trip. A caller that is
+    cancelled does not cancel the call for the others. forget() detaches a
+    group's running calls so reads issued after a write start fresh.
+    Results are shared between callers and must be treated as read-only.
+    """
+    def __init__(self):
+        self._flights: Dict[str, Dict[Hashable, asyncio.Future]] = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    async def do(self, group: str, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        flights = self._flights.setdefault(group, {})
+        task = flights.get(key)
+        if task is None:
+            self.calls += 1
+            task = asyncio.ensure_future(fn())
+            flights[key] = task
+            task.add_done_callback(lambda done: self._finish(group, key, done))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _finish(self, group: str, key: Hashable, task: asyncio.Future):
+        flights = self._flights.get(group)
+        if flights is not None and flights.get(key) is task:
+            del flights[key]
+            if not flights:
+                del self._flights[group]
+        # Mark the outcome retrieved in case every caller was cancelled
+        if not task.cancelled():
+            task.exception()
+
+    def forget(self, group: str):
+        """Make later calls in the group start new flights"""
+        self._flights.pop(group, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "in_flight": sum(len(flights) for flights in self._flights.values())
+        }
+
+class KeyedLocks:
+    """One FIFO asyncio lock per key, dropped once nobody holds or waits for it"""
+    def __init__(self):
+        # key -> [lock, holders and waiters]
+        self._locks: Dict[Hashable, List[Any]] = {}
+        self.acquired = 0
+        self.waits = 0
+
+    @asynccontextmanager
+    async def hold(self, key: Hashable):
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        self.acquired += 1
+        if entry[0].locked():
+            self.waits += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[key]
+
+    def stats(self) -> Dict[str, Any]:
+        return {"acquired": self.acquired, "waits": self.waits, "keys": len(self._locks)}
@@ -0,0 +1,191 @@
+from typing import Dict, Any, List, Optional, Tuple
+from models import UpdateGameStatsRequest
+from game_service import StatsNotApplied
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+def _merge_delta(pending: Dict[str, UpdateGameStatsRequest], player_id: str, delta: UpdateGameStatsRequest):
+    """Add a delta into the pending increments for a player"""
+    current = pending.get(player_id)
+    if current is None:
+        pending[player_id] = UpdateGameStatsRequest(
+            grabs=delta.grabs,
+            releases=delta.releases,
+            teleports=delta.teleports,
+            play_time=delta.play_time
+        )
+        return
+    current.grabs += delta.grabs
+    current.releases += delta.releases
+    current.teleports += delta.teleports
+    current.play_time += delta.play_time
+
+def _describe(deltas: Dict[str, UpdateGameStatsRequest]) -> str:
+    """Totals of a set of deltas, for logging increments that were lost"""
+    return (
+        f"{len(deltas)} players ("
+        f"grabs={sum(d.grabs for d in deltas.values())}, "
+        f"releases={sum(d.releases for d in deltas.values())}, "
+        f"teleports={sum(d.teleports for d in deltas.values())}, "
+        f"play_time={sum(d.play_time for d in deltas.values())})"
+    )
+
+class StatsAggregator:
+    """Coalesces statistics increments per player and flushes them in bulk.
+
+    Submissions are merged into one pending delta per player. A background
+    task flushes the pending deltas every ``flush_interval`` seconds with a
+    single bulk write. When ``max_pending_players`` distinct players are
+    pending, new players wait (up to ``submit_timeout`` seconds) for the next
+    flush instead of growing the buffer. A player's increments that fail to
+    write are retried on the next flushes and dropped, with their totals
+    logged, after ``max_flush_attempts`` failed attempts in a row.
+    """
+    def __init__(self, game_service, flush_interval: float = 1.0,
+                 max_pending_players: int = 10000, submit_timeout: float = 5.0,
+                 max_flush_attempts: int = 5):
+        self.game_service = game_service
+        self.flush_interval = flush_interval
+        self.max_pending_players = max_pending_players
+        self.submit_timeout = submit_timeout
+        self.max_flush_attempts = max_flush_attempts
+        self._pending: Dict[str, UpdateGameStatsRequest] = {}
+        # Failed flush attempts in a row, per player with requeued increments
+        self._attempts: Dict[str, int] = {}
+        self._space = asyncio.Condition()
+        self._flush_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.received = 0
+        self.rejected = 0
+        self.flushes = 0
+        self.writes = 0
+        self.dropped = 0
+
+    def start(self):
+        """Start the background flush loop"""
+        if not self._task:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the flush loop and flush whatever is still pending.
+
+        Increments that the final flush cannot write are logged and lost.
+        """
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        if self._pending:
+            logger.error(f"Lost stats increments on shutdown for {_describe(self._pending)}")
+            self.dropped += len(self._pending)
+            self._pending = {}
+            self._attempts = {}
+
+    async def submit(self, player_id: str, delta: UpdateGameStatsRequest) -> bool:
+        """Merge a delta into the player's pending increments.
+
+        Returns False if the buffer stayed full for ``submit_timeout`` seconds.
+        """
+        return await self.submit_many([(player_id, delta)])
+
+    async def submit_many(self, updates: List[Tuple[str, UpdateGameStatsRequest]]) -> bool:
+        """Merge several deltas, all or none.
+
+        Waits until the buffer has room for every new player in the batch and
+        returns False, queueing nothing, if it stayed full for
+        ``submit_timeout`` seconds or the batch alone exceeds the buffer.
+        """
+        player_ids = {player_id for player_id, _ in updates}
+        async with self._space:
+            def has_room():
+                new_players = sum(1 for player_id in player_ids if player_id not in self._pending)
+                return len(self._pending) + new_players <= self.max_pending_players
+
+            if len(player_ids) > self.max_pending_players:
+                self.rejected += len(updates)
+                return False
+            if not has_room():
+                self._wakeup.set()
+                try:
+                    await asyncio.wait_for(self._space.wait_for(has_room), self.submit_timeout)
+                except asyncio.TimeoutError:
+                    self.rejected += len(updates)
+                    return False
+
+            for player_id, delta in updates:
+                _merge_delta(self._pending, player_id, delta)
+            self.received += len(updates)
+        return True
+
+    async def flush(self) -> int:
+        """Write all pending increments, returning the number of players flushed"""
+        async with self._flush_lock:
+            async with self._space:
+                batch, self._pending = self._pending, {}
+                self._space.notify_all()
+            if not batch:
+                return 0
+
+            failed: Dict[str, UpdateGameStatsRequest] = {}
+            try:
+                await self.game_service.apply_stat_deltas(batch)
+            except StatsNotApplied as e:
+                logger.error(f"Error flushing stats for {len(e.deltas)} of {len(batch)} players: {e.__cause__}")
+                failed = e.deltas
+            for player_id in batch:
+                if player_id not in failed:
+                    self._attempts.pop(player_id, None)
+            if failed:
+                await self._requeue(failed)
+            written = len(batch) - len(failed)
+            if not written:
+                return 0
+
+            self.flushes += 1
+            self.writes += written
+            return written
+
+    async def _requeue(self, batch: Dict[str, UpdateGameStatsRequest]):
+        """Merge increments that were not written back so they are retried on the next flush,
+        dropping those of players that have run out of attempts"""
+        given_up = {}
+        async with self._space:
+            for player_id, delta in batch.items():
+                self._attempts[player_id] = self._attempts.get(player_id, 0) + 1
+                if self._attempts[player_id] >= self.max_flush_attempts:
+                    del self._attempts[player_id]
+                    given_up[player_id] = delta
+                else:
+                    _merge_delta(self._pending, player_id, delta)
+        if given_up:
+            self.dropped += len(given_up)
+            logger.error(f"Dropped stats increments after {self.max_flush_attempts} failed flushes "
+                         f"for {_describe(given_up)}")
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "received": self.received,
+            "rejected": self.rejected,
+            "pending_players": len(self._pending),
+            "max_pending_players": self.max_pending_players,
+            "flushes": self.flushes,
+            "writes": self.writes,
+            "dropped": self.dropped,
+            "coalescing_ratio": self.received / self.writes if self.writes else 0.0
+        }
@@ -0,0 +1,23 @@
+from storage.base import (
+    GameStorage, PartialWriteError, CATALOG_COLLECTIONS, ROLLUP_COUNTERS, LEVEL_PROGRESS_LAYOUTS, COMPLETION_TIME_BUCKETS,
+    STATE_FIELDS, progress_entries, completion_time_bucket, changed_since
+)
+from storage.mongo import MotorGameStorage
+from storage.memory import MemoryGameStorage
+from storage.write_behind import WriteBehindStorage
+
+__all__ = [
+    "GameStorage",
+    "PartialWriteError",
+    "MotorGameStorage",
+    "MemoryGameStorage",
+    "WriteBehindStorage",
+    "CATALOG_COLLECTIONS",
+    "ROLLUP_COUNTERS",
+    "LEVEL_PROGRESS_LAYOUTS",
+    "COMPLETION_TIME_BUCKETS",
+    "STATE_FIELDS",
+    "progress_entries",
+    "completion_time_bucket",
+    "changed_since"
+]
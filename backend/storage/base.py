@@ -0,0 +1,251 @@
+from typing import List, Optional, Dict, Any, Tuple
+from datetime import datetime
+from models import PlayerGameState, LevelCompleteRequest, UpdateGameStatsRequest
+
+# Catalog collections served through the catalog cache
+CATALOG_COLLECTIONS = ["levels", "hand_skins", "achievements"]
+
+# Counters summed into per-player daily session rollups
+ROLLUP_COUNTERS = [
+    "sessions",
+    "completed_sessions",
+    "total_completion_time",
+    "grabs_count",
+    "releases_count",
+    "teleports_count"
+]
+
+# Upper bounds (milliseconds) of the completion-time histogram buckets kept
+# in the per-level analytics rollups; slower completions go in "inf"
+COMPLETION_TIME_BUCKETS = [
+    1000, 2000, 3000, 5000, 7500, 10000, 15000, 20000, 30000,
+    45000, 60000, 90000, 120000, 180000, 300000, 600000
+]
+
+def completion_time_bucket(completion_time: int) -> str:
+    """Histogram key of the bucket a completion time falls in"""
+    for bound in COMPLETION_TIME_BUCKETS:
+        if completion_time < bound:
+            return str(bound)
+    return "inf"
+
+# Level rollup counters that recompute_level_analytics rebuilds from stored
+# data. Session counters are not among them: rolled-up and abandoned sessions
+# are deleted, and the per-player daily rollups carry no level
+RECOMPUTED_LEVEL_COUNTERS = ["completions", "first_completions"]
+
+# How level_progress is stored: a list of entries (the original layout) or a
+# map keyed by level_id, which makes single-level reads and updates direct
+LEVEL_PROGRESS_LAYOUTS = ["list", "map"]
+
+# Top-level player state fields, apart from the revision itself
+STATE_FIELDS = [field for field in PlayerGameState.model_fields if field != "revision"]
+
+# Every player-state mutation increments the document's revision and records
+# it under field_revisions for each top-level field it changes, so delta
+# reads can return just the fields changed since a client's revision
+COMPLETION_CHANGED_FIELDS = ["level_progress", "completed_levels", "unlocked_levels", "statistics", "updated_at"]
+STATS_CHANGED_FIELDS = ["statistics", "updated_at"]
+
+def unlock_changed_fields(new_skins: List[str], new_achievements: List[str]) -> List[str]:
+    """Top-level fields an add_player_unlocks call changes"""
+    return [field for field, ids in (("unlocked_hand_skins", new_skins), ("unlocked_achievements", new_achievements)) if ids]
+
+def changed_since(document: Dict[str, Any], since: int) -> List[str]:
+    """State fields changed after revision ``since``, judged from a document's
+    revision and field_revisions alone.
+
+    A field with no recorded revision has not changed since the document was
+    created, unless the document has no field_revisions at all (it was
+    imported or written before revisions existed); then every field counts
+    as changed at the current revision.
+    """
+    revision = document.get("revision", 0)
+    field_revisions = document.get("field_revisions")
+    if field_revisions is None:
+        return [field for field in STATE_FIELDS if revision > since]
+    return [field for field in STATE_FIELDS if field_revisions.get(field, 0) > since]
+
+def progress_entries(level_progress: Any) -> List[Dict[str, Any]]:
+    """Return level_progress as a list of entries whichever layout it is stored in"""
+    if isinstance(level_progress, dict):
+        return list(level_progress.values())
+    return level_progress or []
+
+class PartialWriteError(Exception):
+    """A batched write that was applied for some players but not others"""
+    def __init__(self, message: str, failed: List[str]):
+        super().__init__(message)
+        self.failed = failed
+
+class GameStorage:
+    """Persistence operations GameService depends on.
+
+    Methods work on plain documents (dicts shaped like the models in
+    models.py); validation stays in GameService. Every mutation that the
+    service relies on being atomic (level completion, stat increments,
+    best-time upserts) must be atomic in the implementation too.
+    """
+
+    # Setup
+    async def ensure_indexes(self):
+        """Create whatever indexes the backend needs"""
+
+    async def verify_query_plans(self) -> Dict[str, bool]:
+        """Check that hot queries are index-backed, keyed by query name"""
+        return {}
+
+    def start(self):
+        """Start any background work the backend does"""
+
+    async def stop(self):
+        """Stop background work, writing back anything still buffered"""
+
+    def stats(self) -> Dict[str, Any]:
+        return {}
+
+    # Catalog
+    async def upsert_catalog(self, collection: str, documents: List[Dict[str, Any]], now: datetime) -> int:
+        """Insert or update catalog documents by id in one batch, returning how many changed"""
+        raise NotImplementedError
+
+    async def load_catalog(self, collection: str) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    async def get_catalog_version(self) -> int:
+        raise NotImplementedError
+
+    async def get_catalog_manifest(self) -> Optional[str]:
+        """Version of the catalog manifest last applied, if any"""
+        raise NotImplementedError
+
+    async def bump_catalog_version(self, manifest: Optional[str] = None) -> int:
+        """Increment the catalog version, recording the applied manifest version if given"""
+        raise NotImplementedError
+
+    async def acquire_seed_lock(self, owner: str, ttl: float) -> bool:
+        """Take the catalog seeding lock unless another owner holds an unexpired one"""
+        raise NotImplementedError
+
+    async def release_seed_lock(self, owner: str):
+        raise NotImplementedError
+
+    # Player state
+    async def get_player_state(self, player_id: str, fields: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        """Get a player's state document, optionally restricted to top-level fields.
+
+        Like every player-state read, the document includes revision and
+        field_revisions when no fields are given.
+        """
+        raise NotImplementedError
+
+    async def get_level_progress(self, player_id: str, level_id: str) -> Optional[Dict[str, Any]]:
+        """Get one level's progress entry; {} if the level was never played, None if the player does not exist"""
+        raise NotImplementedError
+
+    async def get_player_states(self, player_ids: List[str], fields: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    async def insert_player_state(self, document: Dict[str, Any]) -> bool:
+        """Insert a state document unless the player already has one"""
+        raise NotImplementedError
+
+    async def set_player_fields(self, player_id: str, fields: Dict[str, Any]) -> bool:
+        """Overwrite top-level fields and bump the revision, returning False if the player does not exist"""
+        raise NotImplementedError
+
+    async def apply_level_completion(self, player_id: str, request: LevelCompleteRequest,
+                                     next_level_id: Optional[str], now: datetime) -> Optional[Dict[str, Any]]:
+        """Atomically record a completion and return the post-update state"""
+        raise NotImplementedError
+
+    async def increment_player_stats(self, player_id: str, delta: UpdateGameStatsRequest, now: datetime,
+                                     fields: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        """Atomically add to a player's statistics and return the post-update state"""
+        raise NotImplementedError
+
+    async def increment_many_player_stats(self, deltas: Dict[str, UpdateGameStatsRequest], now: datetime) -> int:
+        """Add statistics for many players, returning how many were updated.
+
+        Raises PartialWriteError naming the players that were not updated
+        when only part of the batch was applied; any other error means none
+        of it was.
+        """
+        raise NotImplementedError
+
+    async def add_player_unlocks(self, unlocks: Dict[str, Tuple[List[str], List[str]]]):
+        """Add (hand skin ids, achievement ids) to each player's unlocked sets"""
+        raise NotImplementedError
+
+    async def replace_player_states(self, documents: List[Dict[str, Any]]) -> int:
+        """Overwrite existing players' state documents in one batch, returning how many were written"""
+        raise NotImplementedError
+
+    # Sessions
+    async def insert_session(self, document: Dict[str, Any]):
+        raise NotImplementedError
+
+    async def get_open_session(self, player_id: str, session_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    async def update_open_session(self, player_id: str, session_id: str, fields: Dict[str, Any],
+                                  unset: Optional[List[str]] = None) -> bool:
+        """Update a session that has not ended yet"""
+        raise NotImplementedError
+
+    async def rollup_sessions(self, cutoff: datetime) -> int:
+        """Fold sessions that ended before cutoff into daily rollups, returning how many were removed"""
+        raise NotImplementedError
+
+    # Leaderboards
+    async def record_best_time(self, level_id: str, player_id: str, completion_time: int, now: datetime) -> bool:
+        """Store a time if it beats the player's best, returning True if it did"""
+        raise NotImplementedError
+
+    async def get_leaderboard(self, level_id: str, limit: int) -> List[Dict[str, Any]]:
+        """Fastest entries, ordered by best_time then achieved_at"""
+        raise NotImplementedError
+
+    async def get_leaderboard_entry(self, level_id: str, player_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    async def count_leaderboard_ahead(self, level_id: str, best_time: int, achieved_at: datetime) -> int:
+        """Number of entries ranked ahead of the given time.
+
+        Should not grow with the rank: backends keep per-level counts of best
+        times (or a sorted index) rather than walking the entries ahead.
+        """
+        raise NotImplementedError
+
+    async def rebuild_leaderboard_counts(self) -> int:
+        """Rebuild whatever count_leaderboard_ahead keeps beside the entries, returning how many levels were rebuilt"""
+        raise NotImplementedError
+
+    # Analytics
+    async def increment_level_analytics(self, level_id: str, increments: Dict[str, int]):
+        """Add to a level's rollup counters, creating the rollup if needed.
+
+        Keys may be dotted paths such as "completion_time_histogram.5000".
+        """
+        raise NotImplementedError
+
+    async def increment_daily_analytics(self, day: str, increments: Dict[str, int]):
+        """Add to a day's rollup counters, creating the rollup if needed"""
+        raise NotImplementedError
+
+    async def get_level_analytics(self) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    async def get_daily_analytics(self, since: str) -> List[Dict[str, Any]]:
+        """Daily rollups from the given YYYY-MM-DD day on, oldest first"""
+        raise NotImplementedError
+
+    async def recompute_level_analytics(self) -> int:
+        """Rebuild the level rollup counters that stored data can reproduce.
+
+        completions and first_completions come from player_game_state.
+        Other counters, including the session counters whose sessions may
+        since have been deleted, are left as they are. Returns the number of
+        levels written.
+        """
+        raise NotImplementedError
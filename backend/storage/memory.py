@@ -0,0 +1,335 @@
+from typing import List, Optional, Dict, Any, Tuple
+from datetime import datetime, timedelta
+from models import LevelCompleteRequest, UpdateGameStatsRequest, LevelProgress
+from storage.base import (
+    GameStorage, CATALOG_COLLECTIONS, ROLLUP_COUNTERS, LEVEL_PROGRESS_LAYOUTS, RECOMPUTED_LEVEL_COUNTERS,
+    COMPLETION_CHANGED_FIELDS, STATS_CHANGED_FIELDS, progress_entries, unlock_changed_fields
+)
+import bisect
+import copy
+
+def _select(document: Dict[str, Any], fields: Optional[List[str]]) -> Dict[str, Any]:
+    """Copy a document, optionally restricted to top-level fields"""
+    if fields is None:
+        return copy.deepcopy(document)
+    return {field: copy.deepcopy(document[field]) for field in fields if field in document}
+
+def _increment_paths(document: Dict[str, Any], increments: Dict[str, int]):
+    """Apply $inc-style increments, where keys may be dotted paths"""
+    for path, value in increments.items():
+        *parents, field = path.split(".")
+        target = document
+        for parent in parents:
+            target = target.setdefault(parent, {})
+        target[field] = target.get(field, 0) + value
+
+def _bump_revision(document: Dict[str, Any], fields: List[str]):
+    """Increment a state document's revision and stamp it on the changed fields"""
+    document["revision"] = document.get("revision", 0) + 1
+    field_revisions = document.setdefault("field_revisions", {})
+    for field in fields:
+        field_revisions[field] = document["revision"]
+
+def _is_faster(completion_time: int, best_time: Optional[int]) -> bool:
+    return not best_time or completion_time < best_time
+
+class MemoryGameStorage(GameStorage):
+    """GameStorage held entirely in process memory.
+
+    Documents live in dicts keyed by player_id, level_id and session id, and
+    leaderboards keep a sorted key list per level so top-N and rank lookups
+    are bisections. Every method runs without awaiting, so each one is
+    atomic with respect to the event loop. Data is lost when the process
+    exits; use it for tests, benchmarks and single-node edge deployments.
+    """
+    def __init__(self, level_progress_layout: str = "list"):
+        if level_progress_layout not in LEVEL_PROGRESS_LAYOUTS:
+            raise ValueError(f"Unknown level_progress layout: {level_progress_layout}")
+        self.level_progress_layout = level_progress_layout
+        self.catalog: Dict[str, Dict[str, Dict[str, Any]]] = {name: {} for name in CATALOG_COLLECTIONS}
+        self.catalog_version = 0
+        self.catalog_manifest: Optional[str] = None
+        self.seed_lock: Optional[Tuple[str, datetime]] = None
+        self.players: Dict[str, Dict[str, Any]] = {}
+        self.sessions: Dict[str, Dict[str, Any]] = {}
+        self.session_rollups: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        # level_id -> player_id -> entry, and level_id -> sorted ranking keys
+        self.leaderboards: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self.rankings: Dict[str, List[Tuple[int, datetime, str]]] = {}
+        # level_id -> level rollup, and YYYY-MM-DD -> daily rollup
+        self.level_analytics: Dict[str, Dict[str, Any]] = {}
+        self.daily_analytics: Dict[str, Dict[str, Any]] = {}
+
+    # Catalog
+    async def upsert_catalog(self, collection: str, documents: List[Dict[str, Any]], now: datetime) -> int:
+        changed = 0
+        for document in documents:
+            existing = self.catalog[collection].get(document["id"])
+            if existing and all(existing.get(key) == value for key, value in document.items()):
+                continue
+            created_at = existing["created_at"] if existing else now
+            self.catalog[collection][document["id"]] = {
+                **(existing or {}), **copy.deepcopy(document), "created_at": created_at, "updated_at": now
+            }
+            changed += 1
+        return changed
+
+    async def load_catalog(self, collection: str) -> List[Dict[str, Any]]:
+        return [copy.deepcopy(document) for document in self.catalog[collection].values()]
+
+    async def get_catalog_version(self) -> int:
+        return self.catalog_version
+
+    async def get_catalog_manifest(self) -> Optional[str]:
+        return self.catalog_manifest
+
+    async def bump_catalog_version(self, manifest: Optional[str] = None) -> int:
+        self.catalog_version += 1
+        if manifest is not None:
+            self.catalog_manifest = manifest
+        return self.catalog_version
+
+    async def acquire_seed_lock(self, owner: str, ttl: float) -> bool:
+        now = datetime.utcnow()
+        if self.seed_lock and self.seed_lock[1] >= now:
+            return False
+        self.seed_lock = (owner, now + timedelta(seconds=ttl))
+        return True
+
+    async def release_seed_lock(self, owner: str):
+        if self.seed_lock and self.seed_lock[0] == owner:
+            self.seed_lock = None
+
+    # Player state
+    async def get_player_state(self, player_id: str, fields: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        document = self.players.get(player_id)
+        return _select(document, fields) if document else None
+
+    async def get_level_progress(self, player_id: str, level_id: str) -> Optional[Dict[str, Any]]:
+        document = self.players.get(player_id)
+        if not document:
+            return None
+        progress = self._find_progress(document, level_id)
+        return copy.deepcopy(progress) if progress else {}
+
+    def _find_progress(self, document: Dict[str, Any], level_id: str) -> Optional[Dict[str, Any]]:
+        level_progress = document.get("level_progress") or []
+        if isinstance(level_progress, dict):
+            return level_progress.get(level_id)
+        return next((p for p in level_progress if p["level_id"] == level_id), None)
+
+    async def get_player_states(self, player_ids: List[str], fields: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        return [_select(self.players[player_id], fields) for player_id in player_ids if player_id in self.players]
+
+    async def insert_player_state(self, document: Dict[str, Any]) -> bool:
+        if document["player_id"] in self.players:
+            return False
+        self.players[document["player_id"]] = copy.deepcopy(document)
+        return True
+
+    async def set_player_fields(self, player_id: str, fields: Dict[str, Any]) -> bool:
+        document = self.players.get(player_id)
+        if not document:
+            return False
+        document.update(copy.deepcopy(fields))
+        _bump_revision(document, list(fields))
+        return True
+
+    async def apply_level_completion(self, player_id: str, request: LevelCompleteRequest,
+                                     next_level_id: Optional[str], now: datetime) -> Optional[Dict[str, Any]]:
+        document = self.players.get(player_id)
+        if not document:
+            return None
+
+        level_progress = document.get("level_progress") or []
+        if self.level_progress_layout == "map" and isinstance(level_progress, list):
+            level_progress = {p["level_id"]: p for p in level_progress}
+        document["level_progress"] = level_progress
+        progress = self._find_progress(document, request.level_id)
+        if not progress:
+            progress = LevelProgress(level_id=request.level_id).model_dump()
+            if isinstance(level_progress, dict):
+                level_progress[request.level_id] = progress
+            else:
+                level_progress.append(progress)
+        progress["completed"] = True
+        progress["attempts"] = progress.get("attempts", 0) + 1
+        progress["last_played"] = now
+        if _is_faster(request.completion_time, progress.get("best_time")):
+            progress["best_time"] = request.completion_time
+
+        completed_levels = document.setdefault("completed_levels", [])
+        if request.level_id not in completed_levels:
+            completed_levels.append(request.level_id)
+
+        statistics = document.setdefault("statistics", {})
+        statistics["total_grabs"] = statistics.get("total_grabs", 0) + request.grabs_count
+        statistics["total_releases"] = statistics.get("total_releases", 0) + request.releases_count
+        statistics["total_teleports"] = statistics.get("total_teleports", 0) + request.teleports_count
+        statistics["levels_completed"] = len(completed_levels)
+        if _is_faster(request.completion_time, statistics.get("fastest_time")):
+            statistics["fastest_time"] = request.completion_time
+
+        unlocked_levels = document.setdefault("unlocked_levels", [])
+        if next_level_id and next_level_id not in unlocked_levels:
+            unlocked_levels.append(next_level_id)
+
+        document["updated_at"] = now
+        _bump_revision(document, COMPLETION_CHANGED_FIELDS)
+        return copy.deepcopy(document)
+
+    def _increment(self, document: Dict[str, Any], delta: UpdateGameStatsRequest, now: datetime):
+        statistics = document.setdefault("statistics", {})
+        statistics["total_grabs"] = statistics.get("total_grabs", 0) + delta.grabs
+        statistics["total_releases"] = statistics.get("total_releases", 0) + delta.releases
+        statistics["total_teleports"] = statistics.get("total_teleports", 0) + delta.teleports
+        statistics["total_play_time"] = statistics.get("total_play_time", 0) + delta.play_time
+        document["updated_at"] = now
+        _bump_revision(document, STATS_CHANGED_FIELDS)
+
+    async def increment_player_stats(self, player_id: str, delta: UpdateGameStatsRequest, now: datetime,
+                                     fields: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        document = self.players.get(player_id)
+        if not document:
+            return None
+        self._increment(document, delta, now)
+        return _select(document, fields)
+
+    async def increment_many_player_stats(self, deltas: Dict[str, UpdateGameStatsRequest], now: datetime) -> int:
+        updated = 0
+        for player_id, delta in deltas.items():
+            document = self.players.get(player_id)
+            if document:
+                self._increment(document, delta, now)
+                updated += 1
+        return updated
+
+    async def add_player_unlocks(self, unlocks: Dict[str, Tuple[List[str], List[str]]]):
+        for player_id, (skins, achievements) in unlocks.items():
+            document = self.players.get(player_id)
+            if not document:
+                continue
+            for field, ids in (("unlocked_hand_skins", skins), ("unlocked_achievements", achievements)):
+                unlocked = document.setdefault(field, [])
+                unlocked.extend(unlock_id for unlock_id in ids if unlock_id not in unlocked)
+            if skins or achievements:
+                _bump_revision(document, unlock_changed_fields(skins, achievements))
+
+    async def replace_player_states(self, documents: List[Dict[str, Any]]) -> int:
+        written = 0
+        for document in documents:
+            if document["player_id"] in self.players:
+                self.players[document["player_id"]] = copy.deepcopy(document)
+                written += 1
+        return written
+
+    # Sessions
+    async def insert_session(self, document: Dict[str, Any]):
+        self.sessions[document["id"]] = copy.deepcopy(document)
+
+    def _open_session(self, player_id: str, session_id: str) -> Optional[Dict[str, Any]]:
+        session = self.sessions.get(session_id)
+        if session and session["player_id"] == player_id and session.get("end_time") is None:
+            return session
+        return None
+
+    async def get_open_session(self, player_id: str, session_id: str) -> Optional[Dict[str, Any]]:
+        session = self._open_session(player_id, session_id)
+        return copy.deepcopy(session) if session else None
+
+    async def update_open_session(self, player_id: str, session_id: str, fields: Dict[str, Any],
+                                  unset: Optional[List[str]] = None) -> bool:
+        session = self._open_session(player_id, session_id)
+        if not session:
+            return False
+        session.update(copy.deepcopy(fields))
+        for field in unset or []:
+            session.pop(field, None)
+        return True
+
+    async def rollup_sessions(self, cutoff: datetime) -> int:
+        now = datetime.utcnow()
+        removed = []
+        for session_id, session in self.sessions.items():
+            end_time = session.get("end_time")
+            if end_time is None:
+                # Stands in for the TTL index on abandoned sessions
+                expires_at = session.get("expires_at")
+                if expires_at and expires_at < now:
+                    removed.append(session_id)
+                continue
+            if end_time >= cutoff:
+                continue
+            key = (session["player_id"], end_time.strftime("%Y-%m-%d"))
+            rollup = self.session_rollups.setdefault(
+                key, {"player_id": key[0], "day": key[1], **{field: 0 for field in ROLLUP_COUNTERS}}
+            )
+            rollup["sessions"] += 1
+            rollup["completed_sessions"] += 1 if session.get("completed") else 0
+            rollup["total_completion_time"] += session.get("completion_time") or 0
+            rollup["grabs_count"] += session.get("grabs_count", 0)
+            rollup["releases_count"] += session.get("releases_count", 0)
+            rollup["teleports_count"] += session.get("teleports_count", 0)
+            removed.append(session_id)
+        for session_id in removed:
+            del self.sessions[session_id]
+        return len(removed)
+
+    # Leaderboards
+    async def record_best_time(self, level_id: str, player_id: str, completion_time: int, now: datetime) -> bool:
+        entries = self.leaderboards.setdefault(level_id, {})
+        ranking = self.rankings.setdefault(level_id, [])
+        entry = entries.get(player_id)
+        if entry and entry["best_time"] <= completion_time:
+            return False
+        if entry:
+            old_key = (entry["best_time"], entry["achieved_at"], player_id)
+            del ranking[bisect.bisect_left(ranking, old_key)]
+        entries[player_id] = {
+            "level_id": level_id,
+            "player_id": player_id,
+            "best_time": completion_time,
+            "achieved_at": now
+        }
+        bisect.insort(ranking, (completion_time, now, player_id))
+        return True
+
+    async def get_leaderboard(self, level_id: str, limit: int) -> List[Dict[str, Any]]:
+        entries = self.leaderboards.get(level_id, {})
+        return [dict(entries[player_id]) for _, _, player_id in self.rankings.get(level_id, [])[:limit]]
+
+    async def get_leaderboard_entry(self, level_id: str, player_id: str) -> Optional[Dict[str, Any]]:
+        entry = self.leaderboards.get(level_id, {}).get(player_id)
+        return dict(entry) if entry else None
+
+    async def count_leaderboard_ahead(self, level_id: str, best_time: int, achieved_at: datetime) -> int:
+        return bisect.bisect_left(self.rankings.get(level_id, []), (best_time, achieved_at, ""))
+
+    async def rebuild_leaderboard_counts(self) -> int:
+        # Rankings are kept sorted on every write, so there is nothing to rebuild
+        return 0
+
+    # Analytics
+    async def increment_level_analytics(self, level_id: str, increments: Dict[str, int]):
+        _increment_paths(self.level_analytics.setdefault(level_id, {"level_id": level_id}), increments)
+
+    async def increment_daily_analytics(self, day: str, increments: Dict[str, int]):
+        _increment_paths(self.daily_analytics.setdefault(day, {"day": day}), increments)
+
+    async def get_level_analytics(self) -> List[Dict[str, Any]]:
+        return [copy.deepcopy(document) for document in self.level_analytics.values()]
+
+    async def get_daily_analytics(self, since: str) -> List[Dict[str, Any]]:
+        return [copy.deepcopy(self.daily_analytics[day]) for day in sorted(self.daily_analytics) if day >= since]
+
+    async def recompute_level_analytics(self) -> int:
+        counters = {level_id: dict.fromkeys(RECOMPUTED_LEVEL_COUNTERS, 0) for level_id in self.level_analytics}
+        for document in self.players.values():
+            for progress in progress_entries(document.get("level_progress")):
+                if progress.get("completed"):
+                    level = counters.setdefault(progress["level_id"], dict.fromkeys(RECOMPUTED_LEVEL_COUNTERS, 0))
+                    level["first_completions"] += 1
+                    level["completions"] += progress.get("attempts", 0)
+        for level_id, values in counters.items():
+            self.level_analytics.setdefault(level_id, {"level_id": level_id}).update(values)
+        return len(counters)
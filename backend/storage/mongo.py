@@ -0,0 +1,682 @@
+from typing import List, Optional, Dict, Any, Tuple
+from datetime import datetime, timedelta
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ASCENDING, IndexModel, ReplaceOne, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from models import LevelCompleteRequest, UpdateGameStatsRequest, LevelProgress
+from storage.base import (
+    GameStorage, PartialWriteError, ROLLUP_COUNTERS, LEVEL_PROGRESS_LAYOUTS, RECOMPUTED_LEVEL_COUNTERS,
+    COMPLETION_CHANGED_FIELDS, STATS_CHANGED_FIELDS, unlock_changed_fields
+)
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+CATALOG_VERSION_ID = "catalog"
+SEED_LOCK_ID = "seed_lock"
+
+# Ties on best_time go to whoever set it first
+LEADERBOARD_SORT = [("best_time", ASCENDING), ("achieved_at", ASCENDING), ("player_id", ASCENDING)]
+
+# Width (milliseconds) of the best-time buckets counted per level in
+# leaderboard_buckets. A rank sums the buckets below the player's and counts
+# only the entries inside the player's own bucket
+LEADERBOARD_BUCKET_MS = 100
+
+# Cursor batch size for multi-player state reads
+PLAYER_STATES_BATCH_SIZE = 500
+
+# Indexes backing every hot query, keyed by collection
+INDEX_MANIFEST: Dict[str, List[IndexModel]] = {
+    "player_game_state": [
+        IndexModel([("player_id", ASCENDING)], name="player_id_unique", unique=True)
+    ],
+    "levels": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("order", ASCENDING)], name="order")
+    ],
+    "hand_skins": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True)
+    ],
+    "achievements": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True)
+    ],
+    "game_sessions": [
+        IndexModel(
+            [("player_id", ASCENDING), ("level_id", ASCENDING), ("start_time", ASCENDING)],
+            name="player_level_start"
+        ),
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        # Abandoned sessions are deleted once expires_at passes
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+        IndexModel([("end_time", ASCENDING)], name="end_time")
+    ],
+    "leaderboards": [
+        IndexModel([("level_id", ASCENDING), ("player_id", ASCENDING)], name="level_player_unique", unique=True),
+        IndexModel(
+            [("level_id", ASCENDING), ("best_time", ASCENDING), ("achieved_at", ASCENDING)],
+            name="level_best_time"
+        )
+    ],
+    "leaderboard_buckets": [
+        IndexModel([("level_id", ASCENDING), ("bucket", ASCENDING)], name="level_bucket_unique", unique=True)
+    ],
+    "session_daily_rollups": [
+        IndexModel([("player_id", ASCENDING), ("day", ASCENDING)], name="player_day_unique", unique=True)
+    ],
+    "level_analytics": [
+        IndexModel([("level_id", ASCENDING)], name="level_id_unique", unique=True)
+    ],
+    "daily_analytics": [
+        IndexModel([("day", ASCENDING)], name="day_unique", unique=True)
+    ]
+}
+
+def _projection(fields: Optional[List[str]]) -> Dict[str, int]:
+    if fields is None:
+        return {"_id": 0}
+    projection = {field: 1 for field in fields}
+    projection["_id"] = 0
+    return projection
+
+def _literal(value: str) -> Any:
+    """Quote a client-supplied string for use inside an aggregation expression.
+
+    Only strings starting with "$" would be read as field paths or operators,
+    so everything else is passed through unchanged.
+    """
+    return {"$literal": value} if value.startswith("$") else value
+
+def _plan_has_stage(plan: Dict[str, Any], stage: str) -> bool:
+    """Check whether a query plan tree contains the given stage"""
+    if plan.get("stage") == stage:
+        return True
+    children = list(plan.get("inputStages", []))
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            children.append(plan[key])
+    return any(_plan_has_stage(child, stage) for child in children)
+
+def _revision_stages(fields: List[str]) -> List[Dict[str, Any]]:
+    """Pipeline stages that bump a state document's revision and stamp it on the changed fields"""
+    return [
+        {"$set": {"revision": {"$add": [{"$ifNull": ["$revision", 0]}, 1]}}},
+        {"$set": {f"field_revisions.{field}": "$revision" for field in fields}}
+    ]
+
+def _add(field: str, amount: int) -> Dict[str, Any]:
+    return {"$add": [{"$ifNull": [field, 0]}, amount]}
+
+def _stats_increment(delta: UpdateGameStatsRequest, now: datetime) -> List[Dict[str, Any]]:
+    return [
+        {
+            "$set": {
+                "statistics.total_grabs": _add("$statistics.total_grabs", delta.grabs),
+                "statistics.total_releases": _add("$statistics.total_releases", delta.releases),
+                "statistics.total_teleports": _add("$statistics.total_teleports", delta.teleports),
+                "statistics.total_play_time": _add("$statistics.total_play_time", delta.play_time),
+                "updated_at": now
+            }
+        },
+        *_revision_stages(STATS_CHANGED_FIELDS)
+    ]
+
+def _append_missing(field: str, values: List[Any]) -> Dict[str, Any]:
+    """Expression appending the values an array field does not already hold, in order"""
+    array = {"$ifNull": [field, []]}
+    return {
+        "$concatArrays": [
+            array,
+            {"$filter": {"input": values, "as": "value", "cond": {"$cond": [{"$in": ["$$value", array]}, False, True]}}}
+        ]
+    }
+
+def _unlock_update(new_skins: List[str], new_achievements: List[str]) -> List[Dict[str, Any]]:
+    unlocked = {}
+    for field, ids in (("unlocked_hand_skins", new_skins), ("unlocked_achievements", new_achievements)):
+        if ids:
+            unlocked[field] = _append_missing(f"${field}", [_literal(unlock_id) for unlock_id in dict.fromkeys(ids)])
+    return [{"$set": unlocked}, *_revision_stages(unlock_changed_fields(new_skins, new_achievements))]
+
+def _progress_key(level_id: str) -> Optional[str]:
+    """The level_progress map key for a level id, or None if it cannot be a field name"""
+    if not level_id or "." in level_id or level_id.startswith("$"):
+        return None
+    return level_id
+
+# Converts a list-layout level_progress to the map layout; map documents pass through
+_LEVEL_PROGRESS_TO_MAP = {
+    "$cond": [
+        {"$isArray": "$level_progress"},
+        {
+            "$arrayToObject": {
+                "$map": {"input": "$level_progress", "as": "p", "in": {"k": "$$p.level_id", "v": "$$p"}}
+            }
+        },
+        {"$ifNull": ["$level_progress", {}]}
+    ]
+}
+
+def build_completion_pipeline(request: LevelCompleteRequest, next_level_id: Optional[str], now: datetime,
+                              level_progress_layout: str = "list") -> List[Dict[str, Any]]:
+    """Build the update pipeline that records a level completion"""
+    level_id = _literal(request.level_id)
+    completion_time = request.completion_time
+
+    def faster(field: str) -> Dict[str, Any]:
+        # Mirrors "not best or time < best": unset/zero times are replaced
+        return {
+            "$cond": [
+                {"$or": [{"$eq": [{"$ifNull": [field, 0]}, 0]}, {"$lt": [completion_time, field]}]},
+                completion_time,
+                field
+            ]
+        }
+
+    def append_missing(field: str, value: Any) -> Dict[str, Any]:
+        array = {"$ifNull": [field, []]}
+        return {"$cond": [{"$in": [value, array]}, array, {"$concatArrays": [array, [value]]}]}
+
+    def updated_progress(entry: str) -> Dict[str, Any]:
+        return {
+            "level_id": f"{entry}.level_id",
+            "completed": True,
+            "best_time": faster(f"{entry}.best_time"),
+            "attempts": {"$add": [{"$ifNull": [f"{entry}.attempts", 0]}, 1]},
+            "last_played": now
+        }
+
+    new_progress = LevelProgress(
+        level_id=request.level_id,
+        completed=True,
+        best_time=request.completion_time,
+        attempts=1,
+        last_played=now
+    ).model_dump()
+    new_progress["level_id"] = level_id
+
+    stages = []
+    if level_progress_layout == "map":
+        key = _progress_key(request.level_id)
+        if key is None:
+            raise ValueError(f"Level id cannot be used as a level_progress key: {request.level_id!r}")
+        entry = f"$level_progress.{key}"
+        stages.append({"$set": {"level_progress": _LEVEL_PROGRESS_TO_MAP}})
+        stage = {
+            f"level_progress.{key}": {
+                "$cond": [{"$eq": [{"$ifNull": [f"{entry}.level_id", ""]}, ""]}, new_progress, updated_progress(entry)]
+            }
+        }
+    else:
+        level_progress = {"$ifNull": ["$level_progress", []]}
+        stage = {
+            "level_progress": {
+                "$cond": [
+                    {"$in": [level_id, {"$map": {"input": level_progress, "as": "p", "in": "$$p.level_id"}}]},
+                    {
+                        "$map": {
+                            "input": level_progress,
+                            "as": "p",
+                            "in": {"$cond": [{"$eq": ["$$p.level_id", level_id]}, updated_progress("$$p"), "$$p"]}
+                        }
+                    },
+                    {"$concatArrays": [level_progress, [new_progress]]}
+                ]
+            }
+        }
+    stage.update({
+        "completed_levels": append_missing("$completed_levels", level_id),
+        "statistics.total_grabs": {"$add": [{"$ifNull": ["$statistics.total_grabs", 0]}, request.grabs_count]},
+        "statistics.total_releases": {"$add": [{"$ifNull": ["$statistics.total_releases", 0]}, request.releases_count]},
+        "statistics.total_teleports": {"$add": [{"$ifNull": ["$statistics.total_teleports", 0]}, request.teleports_count]},
+        "statistics.fastest_time": faster("$statistics.fastest_time"),
+        "updated_at": now
+    })
+    if next_level_id:
+        stage["unlocked_levels"] = append_missing("$unlocked_levels", _literal(next_level_id))
+
+    return stages + [
+        {"$set": stage},
+        {"$set": {"statistics.levels_completed": {"$size": "$completed_levels"}}},
+        *_revision_stages(COMPLETION_CHANGED_FIELDS)
+    ]
+
+class MotorGameStorage(GameStorage):
+    """GameStorage backed by MongoDB through Motor"""
+    def __init__(self, db: AsyncIOMotorDatabase, level_progress_layout: str = "list"):
+        if level_progress_layout not in LEVEL_PROGRESS_LAYOUTS:
+            raise ValueError(f"Unknown level_progress layout: {level_progress_layout}")
+        self.db = db
+        # In the map layout, list documents are still read correctly and are
+        # converted by their next completion; going back to list needs a migration
+        self.level_progress_layout = level_progress_layout
+
+    # Setup
+    async def ensure_indexes(self):
+        """Create the indexes listed in INDEX_MANIFEST"""
+        for collection, indexes in INDEX_MANIFEST.items():
+            try:
+                names = await self.db[collection].create_indexes(indexes)
+                logger.info(f"Ensured indexes on {collection}: {', '.join(names)}")
+            except Exception as e:
+                logger.error(f"Error creating indexes on {collection}: {e}")
+
+    def _hot_queries(self) -> Dict[str, Any]:
+        """Cursors for the hot queries whose plans must use an index"""
+        return {
+            "player_game_state by player_id": self.db.player_game_state.find({"player_id": "default"}),
+            "levels by id": self.db.levels.find({"id": "level1"}),
+            "levels sorted by order": self.db.levels.find().sort("order", ASCENDING),
+            "game_sessions by player and level": self.db.game_sessions.find(
+                {"player_id": "default", "level_id": "level1"}
+            ).sort("start_time", ASCENDING),
+            "leaderboard_buckets below a time": self.db.leaderboard_buckets.find(
+                {"level_id": "level1", "bucket": {"$lt": 100}}
+            )
+        }
+
+    async def verify_query_plans(self) -> Dict[str, bool]:
+        """Explain each hot query and warn when it falls back to a collection scan"""
+        results = {}
+        for name, cursor in self._hot_queries().items():
+            try:
+                plan = await cursor.explain()
+            except Exception as e:
+                logger.error(f"Error explaining query '{name}': {e}")
+                continue
+            uses_index = not _plan_has_stage(plan.get("queryPlanner", {}).get("winningPlan", {}), "COLLSCAN")
+            if not uses_index:
+                logger.warning(f"Query '{name}' uses a COLLSCAN; check INDEX_MANIFEST")
+            results[name] = uses_index
+        return results
+
+    # Catalog
+    async def upsert_catalog(self, collection: str, documents: List[Dict[str, Any]], now: datetime) -> int:
+        if not documents:
+            return 0
+        result = await self.db[collection].bulk_write(
+            [
+                UpdateOne(
+                    {"id": document["id"]},
+                    {"$set": {**document, "updated_at": now}, "$setOnInsert": {"created_at": now}},
+                    upsert=True
+                )
+                for document in documents
+            ],
+            ordered=False
+        )
+        return result.upserted_count + result.modified_count
+
+    async def load_catalog(self, collection: str) -> List[Dict[str, Any]]:
+        return await self.db[collection].find({}, {"_id": 0}).to_list(length=None)
+
+    async def get_catalog_version(self) -> int:
+        doc = await self.db.catalog_meta.find_one({"_id": CATALOG_VERSION_ID})
+        return doc["version"] if doc else 0
+
+    async def get_catalog_manifest(self) -> Optional[str]:
+        doc = await self.db.catalog_meta.find_one({"_id": CATALOG_VERSION_ID}, {"manifest": 1})
+        return doc.get("manifest") if doc else None
+
+    async def bump_catalog_version(self, manifest: Optional[str] = None) -> int:
+        fields: Dict[str, Any] = {"updated_at": datetime.utcnow()}
+        if manifest is not None:
+            fields["manifest"] = manifest
+        doc = await self.db.catalog_meta.find_one_and_update(
+            {"_id": CATALOG_VERSION_ID},
+            {"$inc": {"version": 1}, "$set": fields},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return doc["version"]
+
+    async def acquire_seed_lock(self, owner: str, ttl: float) -> bool:
+        now = datetime.utcnow()
+        try:
+            # Matches only a missing or expired lock; a live one makes the
+            # upsert collide on _id
+            await self.db.catalog_meta.update_one(
+                {"_id": SEED_LOCK_ID, "expires_at": {"$lt": now}},
+                {"$set": {"owner": owner, "expires_at": now + timedelta(seconds=ttl)}},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            return False
+        return True
+
+    async def release_seed_lock(self, owner: str):
+        await self.db.catalog_meta.delete_one({"_id": SEED_LOCK_ID, "owner": owner})
+
+    # Player state
+    async def get_player_state(self, player_id: str, fields: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        return await self.db.player_game_state.find_one({"player_id": player_id}, _projection(fields))
+
+    async def get_level_progress(self, player_id: str, level_id: str) -> Optional[Dict[str, Any]]:
+        key = _progress_key(level_id)
+        if self.level_progress_layout == "map" and key is not None:
+            doc = await self.db.player_game_state.find_one(
+                {"player_id": player_id}, {"_id": 0, "player_id": 1, f"level_progress.{key}": 1}
+            )
+            if doc is None:
+                return None
+            level_progress = doc.get("level_progress")
+            if not isinstance(level_progress, list):
+                return (level_progress or {}).get(key, {})
+        # $elemMatch returns only the matching entry of a list-layout document
+        doc = await self.db.player_game_state.find_one(
+            {"player_id": player_id},
+            {"_id": 0, "player_id": 1, "level_progress": {"$elemMatch": {"level_id": level_id}}}
+        )
+        if doc is None:
+            return None
+        level_progress = doc.get("level_progress")
+        return level_progress[0] if isinstance(level_progress, list) and level_progress else {}
+
+    async def get_player_states(self, player_ids: List[str], fields: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        if not player_ids:
+            return []
+        # Sized so a typical batch arrives in one round trip instead of the
+        # server's default 101-document first batch followed by getMores
+        cursor = self.db.player_game_state.find(
+            {"player_id": {"$in": player_ids}}, _projection(fields)
+        ).batch_size(min(len(player_ids), PLAYER_STATES_BATCH_SIZE))
+        return await cursor.to_list(length=None)
+
+    async def insert_player_state(self, document: Dict[str, Any]) -> bool:
+        try:
+            result = await self.db.player_game_state.update_one(
+                {"player_id": document["player_id"]},
+                {"$setOnInsert": document},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            # A concurrent upsert for the same player won
+            return False
+        return result.upserted_id is not None
+
+    async def set_player_fields(self, player_id: str, fields: Dict[str, Any]) -> bool:
+        result = await self.db.player_game_state.update_one(
+            {"player_id": player_id},
+            [{"$set": {field: {"$literal": value} for field, value in fields.items()}}, *_revision_stages(list(fields))]
+        )
+        return result.matched_count > 0
+
+    async def apply_level_completion(self, player_id: str, request: LevelCompleteRequest,
+                                     next_level_id: Optional[str], now: datetime) -> Optional[Dict[str, Any]]:
+        return await self.db.player_game_state.find_one_and_update(
+            {"player_id": player_id},
+            build_completion_pipeline(request, next_level_id, now, self.level_progress_layout),
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def increment_player_stats(self, player_id: str, delta: UpdateGameStatsRequest, now: datetime,
+                                     fields: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        return await self.db.player_game_state.find_one_and_update(
+            {"player_id": player_id},
+            _stats_increment(delta, now),
+            projection=_projection(fields),
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def increment_many_player_stats(self, deltas: Dict[str, UpdateGameStatsRequest], now: datetime) -> int:
+        if not deltas:
+            return 0
+        player_ids = list(deltas)
+        try:
+            result = await self.db.player_game_state.bulk_write(
+                [UpdateOne({"player_id": player_id}, _stats_increment(deltas[player_id], now)) for player_id in player_ids],
+                ordered=False
+            )
+        except BulkWriteError as e:
+            # Unordered: every operation without a write error was applied
+            failed = [player_ids[error["index"]] for error in e.details.get("writeErrors", [])]
+            if len(failed) == len(player_ids):
+                raise
+            raise PartialWriteError(f"{len(failed)} of {len(player_ids)} stats increments failed", failed) from e
+        return result.modified_count
+
+    async def add_player_unlocks(self, unlocks: Dict[str, Tuple[List[str], List[str]]]):
+        updates = [
+            ({"player_id": player_id}, _unlock_update(skins, achievements))
+            for player_id, (skins, achievements) in unlocks.items()
+            if skins or achievements
+        ]
+        if len(updates) == 1:
+            await self.db.player_game_state.update_one(*updates[0])
+        elif updates:
+            await self.db.player_game_state.bulk_write(
+                [UpdateOne(query, update) for query, update in updates],
+                ordered=False
+            )
+
+    async def replace_player_states(self, documents: List[Dict[str, Any]]) -> int:
+        if not documents:
+            return 0
+        result = await self.db.player_game_state.bulk_write(
+            [ReplaceOne({"player_id": document["player_id"]}, document) for document in documents],
+            ordered=False
+        )
+        return result.matched_count
+
+    # Sessions
+    async def insert_session(self, document: Dict[str, Any]):
+        await self.db.game_sessions.insert_one(document)
+
+    async def get_open_session(self, player_id: str, session_id: str) -> Optional[Dict[str, Any]]:
+        return await self.db.game_sessions.find_one(
+            {"id": session_id, "player_id": player_id, "end_time": None}, {"_id": 0}
+        )
+
+    async def update_open_session(self, player_id: str, session_id: str, fields: Dict[str, Any],
+                                  unset: Optional[List[str]] = None) -> bool:
+        update: Dict[str, Any] = {"$set": fields}
+        if unset:
+            update["$unset"] = {field: "" for field in unset}
+        result = await self.db.game_sessions.update_one(
+            {"id": session_id, "player_id": player_id, "end_time": None},
+            update
+        )
+        return result.matched_count > 0
+
+    async def rollup_sessions(self, cutoff: datetime) -> int:
+        match = {"end_time": {"$ne": None, "$lt": cutoff}}
+        pipeline = [
+            {"$match": match},
+            {
+                "$group": {
+                    "_id": {
+                        "player_id": "$player_id",
+                        "day": {"$dateToString": {"format": "%Y-%m-%d", "date": "$end_time"}}
+                    },
+                    "sessions": {"$sum": 1},
+                    "completed_sessions": {"$sum": {"$cond": ["$completed", 1, 0]}},
+                    "total_completion_time": {"$sum": {"$ifNull": ["$completion_time", 0]}},
+                    "grabs_count": {"$sum": "$grabs_count"},
+                    "releases_count": {"$sum": "$releases_count"},
+                    "teleports_count": {"$sum": "$teleports_count"}
+                }
+            },
+            {
+                "$project": {
+                    "_id": 0,
+                    "player_id": "$_id.player_id",
+                    "day": "$_id.day",
+                    **{field: 1 for field in ROLLUP_COUNTERS}
+                }
+            },
+            {
+                "$merge": {
+                    "into": "session_daily_rollups",
+                    "on": ["player_id", "day"],
+                    "whenMatched": [
+                        {
+                            "$set": {
+                                field: {"$add": [f"${field}", f"$$new.{field}"]}
+                                for field in ROLLUP_COUNTERS
+                            }
+                        }
+                    ],
+                    "whenNotMatched": "insert"
+                }
+            }
+        ]
+        await self.db.game_sessions.aggregate(pipeline, allowDiskUse=True).to_list(length=None)
+        # end_time is only ever set to "now", so no new session can match the cutoff after the merge
+        result = await self.db.game_sessions.delete_many(match)
+        return result.deleted_count
+
+    # Leaderboards
+    async def record_best_time(self, level_id: str, player_id: str, completion_time: int, now: datetime) -> bool:
+        try:
+            # Only matches when the stored time is worse (or absent); otherwise
+            # the upsert collides with the unique (level_id, player_id) index
+            previous = await self.db.leaderboards.find_one_and_update(
+                {
+                    "level_id": level_id,
+                    "player_id": player_id,
+                    "best_time": {"$not": {"$lte": completion_time}}
+                },
+                {"$set": {"best_time": completion_time, "achieved_at": now}},
+                projection={"_id": 0, "best_time": 1},
+                upsert=True,
+                return_document=ReturnDocument.BEFORE
+            )
+        except DuplicateKeyError:
+            return False
+        # Move the player's count to the new bucket. Not atomic with the entry
+        # write; rebuild_leaderboard_counts repairs counts a crash left behind
+        moves = {completion_time // LEADERBOARD_BUCKET_MS: 1}
+        if previous:
+            old_bucket = previous["best_time"] // LEADERBOARD_BUCKET_MS
+            moves[old_bucket] = moves.get(old_bucket, 0) - 1
+        operations = [
+            UpdateOne({"level_id": level_id, "bucket": bucket}, {"$inc": {"count": change}}, upsert=True)
+            for bucket, change in moves.items() if change
+        ]
+        if operations:
+            await self.db.leaderboard_buckets.bulk_write(operations, ordered=False)
+        return True
+
+    async def get_leaderboard(self, level_id: str, limit: int) -> List[Dict[str, Any]]:
+        return await self.db.leaderboards.find(
+            {"level_id": level_id}, {"_id": 0}
+        ).sort(LEADERBOARD_SORT).limit(limit).to_list(length=None)
+
+    async def get_leaderboard_entry(self, level_id: str, player_id: str) -> Optional[Dict[str, Any]]:
+        return await self.db.leaderboards.find_one({"level_id": level_id, "player_id": player_id}, {"_id": 0})
+
+    async def count_leaderboard_ahead(self, level_id: str, best_time: int, achieved_at: datetime) -> int:
+        # Whole buckets below the player's, then the entries ahead within it.
+        # The cost follows the number of buckets and the bucket's size, not the rank
+        bucket = best_time // LEADERBOARD_BUCKET_MS
+        below, within = await asyncio.gather(
+            self.db.leaderboard_buckets.aggregate([
+                {"$match": {"level_id": level_id, "bucket": {"$lt": bucket}}},
+                {"$group": {"_id": None, "count": {"$sum": "$count"}}}
+            ]).to_list(length=1),
+            self.db.leaderboards.count_documents({
+                "level_id": level_id,
+                "$or": [
+                    {"best_time": {"$gte": bucket * LEADERBOARD_BUCKET_MS, "$lt": best_time}},
+                    {"best_time": best_time, "achieved_at": {"$lt": achieved_at}}
+                ]
+            })
+        )
+        return (below[0]["count"] if below else 0) + within
+
+    async def rebuild_leaderboard_counts(self) -> int:
+        counts: Dict[str, Dict[int, int]] = {}
+        pipeline = [
+            {
+                "$group": {
+                    "_id": {
+                        "level_id": "$level_id",
+                        "bucket": {"$toLong": {"$floor": {"$divide": ["$best_time", LEADERBOARD_BUCKET_MS]}}}
+                    },
+                    "count": {"$sum": 1}
+                }
+            }
+        ]
+        async for row in self.db.leaderboards.aggregate(pipeline, allowDiskUse=True):
+            counts.setdefault(row["_id"]["level_id"], {})[row["_id"]["bucket"]] = row["count"]
+        for level_id in await self.db.leaderboard_buckets.distinct("level_id"):
+            counts.setdefault(level_id, {})
+        for level_id, buckets in counts.items():
+            await self.db.leaderboard_buckets.delete_many({"level_id": level_id, "bucket": {"$nin": list(buckets)}})
+            if buckets:
+                await self.db.leaderboard_buckets.bulk_write(
+                    [
+                        UpdateOne({"level_id": level_id, "bucket": bucket}, {"$set": {"count": count}}, upsert=True)
+                        for bucket, count in buckets.items()
+                    ],
+                    ordered=False
+                )
+        return len(counts)
+
+    # Analytics
+    async def increment_level_analytics(self, level_id: str, increments: Dict[str, int]):
+        await self.db.level_analytics.update_one({"level_id": level_id}, {"$inc": increments}, upsert=True)
+
+    async def increment_daily_analytics(self, day: str, increments: Dict[str, int]):
+        await self.db.daily_analytics.update_one({"day": day}, {"$inc": increments}, upsert=True)
+
+    async def get_level_analytics(self) -> List[Dict[str, Any]]:
+        return await self.db.level_analytics.find({}, {"_id": 0}).to_list(length=None)
+
+    async def get_daily_analytics(self, since: str) -> List[Dict[str, Any]]:
+        return await self.db.daily_analytics.find(
+            {"day": {"$gte": since}}, {"_id": 0}
+        ).sort("day", ASCENDING).to_list(length=None)
+
+    async def recompute_level_analytics(self) -> int:
+        # level_progress entries whichever layout a document is stored in
+        entries = {
+            "$cond": [
+                {"$isArray": "$level_progress"},
+                "$level_progress",
+                {
+                    "$map": {
+                        "input": {"$objectToArray": {"$ifNull": ["$level_progress", {}]}},
+                        "as": "entry",
+                        "in": "$$entry.v"
+                    }
+                }
+            ]
+        }
+        pipelines = {
+            "player_game_state": [
+                {"$project": {"_id": 0, "entry": entries}},
+                {"$unwind": "$entry"},
+                {"$match": {"entry.completed": True}},
+                {
+                    "$group": {
+                        "_id": "$entry.level_id",
+                        "first_completions": {"$sum": 1},
+                        "completions": {"$sum": "$entry.attempts"}
+                    }
+                }
+            ]
+        }
+        # Levels that no longer appear in the sources are reset to zero
+        counters: Dict[str, Dict[str, int]] = {
+            level_id: {} for level_id in await self.db.level_analytics.distinct("level_id")
+        }
+        for collection, pipeline in pipelines.items():
+            async for row in self.db[collection].aggregate(pipeline, allowDiskUse=True):
+                counters.setdefault(row.pop("_id"), {}).update(row)
+        if not counters:
+            return 0
+        await self.db.level_analytics.bulk_write(
+            [
+                UpdateOne(
+                    {"level_id": level_id},
+                    {"$set": {field: values.get(field, 0) for field in RECOMPUTED_LEVEL_COUNTERS}},
+                    upsert=True
+                )
+                for level_id, values in counters.items()
+            ],
+            ordered=False
+        )
+        return len(counters)
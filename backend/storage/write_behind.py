@@ -0,0 +1,411 @@
+from typing import List, Optional, Dict, Any, Tuple
+from collections import OrderedDict
+from contextlib import AsyncExitStack
+from datetime import datetime
+from models import LevelCompleteRequest, UpdateGameStatsRequest
+from storage.base import GameStorage, PartialWriteError
+from storage.memory import MemoryGameStorage, _select
+import asyncio
+import copy
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+class _Entry:
+    """Bookkeeping for one cached player state"""
+    __slots__ = ("loaded_at", "dirty_since")
+
+    def __init__(self, loaded_at: float):
+        self.loaded_at = loaded_at
+        self.dirty_since: Optional[float] = None
+
+class WriteBehindStorage(GameStorage):
+    """Player-state cache in front of another GameStorage.
+
+    Hot player states are held in an LRU of up to ``capacity`` players.
+    Reads, settings and hand-skin changes, stat increments and unlocks are
+    applied to the cached document (with MemoryGameStorage's logic) and
+    marked dirty; dirty documents are written back in bulk at least every
+    ``max_unflushed`` seconds, when evicted and on stop(). That interval is
+    the durability knob: a crash loses at most that much of a player's
+    in-memory changes. Level completions stay write-through, so a completed
+    level is durable once the request returns.
+
+    Clean entries are reloaded after ``ttl`` seconds to pick up changes made
+    outside this process. Writes back replace whole documents, so each
+    player must be served by one process (a single worker, or workers
+    behind player-affine routing). Everything other than player state
+    passes straight through to the wrapped storage.
+    """
+    def __init__(self, storage: GameStorage, capacity: int = 10000, ttl: float = 300.0,
+                 max_unflushed: float = 1.0, flush_batch_size: int = 500):
+        self.storage = storage
+        self.capacity = capacity
+        self.ttl = ttl
+        self.max_unflushed = max_unflushed
+        self.flush_batch_size = flush_batch_size
+        # Cached documents live in a MemoryGameStorage so mutations behave
+        # exactly like the in-memory backend
+        self._cache = MemoryGameStorage(getattr(storage, "level_progress_layout", "list"))
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        # Dirty documents evicted but not yet written back
+        self._evicted: Dict[str, Dict[str, Any]] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._flush_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.flushes = 0
+        self.writes = 0
+        self.flush_errors = 0
+
+    # Lifecycle
+    def start(self):
+        """Start the background flush loop"""
+        if not self._task:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the flush loop and write back every dirty document"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        await self.storage.stop()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.max_unflushed)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Error flushing player states: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        dirty_since = [entry.dirty_since for entry in self._entries.values() if entry.dirty_since is not None]
+        return {
+            "entries": len(self._entries),
+            "dirty": len(dirty_since) + len(self._evicted),
+            "oldest_dirty_seconds": now - min(dirty_since) if dirty_since else 0.0,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "flushes": self.flushes,
+            "writes": self.writes,
+            "flush_errors": self.flush_errors
+        }
+
+    # Cache bookkeeping
+    def _lock(self, player_id: str) -> asyncio.Lock:
+        lock = self._locks.get(player_id)
+        if lock is None:
+            lock = self._locks[player_id] = asyncio.Lock()
+        return lock
+
+    def _cached(self, player_id: str) -> bool:
+        """Whether a usable copy of the player's state is cached, touching it if so"""
+        entry = self._entries.get(player_id)
+        if entry is None:
+            return False
+        if entry.dirty_since is None and time.monotonic() - entry.loaded_at > self.ttl:
+            self._drop(player_id)
+            return False
+        self._entries.move_to_end(player_id)
+        return True
+
+    async def _load(self, player_id: str) -> bool:
+        """Make sure the player's state is cached; call with the player's lock held.
+
+        Returns False if the player does not exist.
+        """
+        if self._cached(player_id):
+            self.hits += 1
+            return True
+        self.misses += 1
+        document = self._evicted.pop(player_id, None)
+        if document is not None:
+            # Still waiting to be written back, so it is newer than the stored copy.
+            # Copied because a flush may be encoding it right now
+            self._put(player_id, copy.deepcopy(document))
+            self._entries[player_id].dirty_since = time.monotonic()
+            return True
+        document = await self.storage.get_player_state(player_id)
+        if document is None:
+            return False
+        self._put(player_id, document)
+        return True
+
+    def _put(self, player_id: str, document: Dict[str, Any]):
+        self._cache.players[player_id] = document
+        self._entries[player_id] = _Entry(time.monotonic())
+        self._entries.move_to_end(player_id)
+        while len(self._entries) > self.capacity:
+            evicted_id, entry = self._entries.popitem(last=False)
+            evicted = self._cache.players.pop(evicted_id)
+            if entry.dirty_since is not None:
+                self._evicted[evicted_id] = evicted
+                self._wakeup.set()
+            self.evictions += 1
+
+    def _drop(self, player_id: str):
+        del self._entries[player_id]
+        del self._cache.players[player_id]
+
+    def _mark_dirty(self, player_id: str):
+        entry = self._entries[player_id]
+        if entry.dirty_since is None:
+            entry.dirty_since = time.monotonic()
+
+    # Write-back
+    async def flush(self) -> int:
+        """Write every dirty document back, returning how many were written"""
+        async with self._flush_lock:
+            written = await self._write_back(
+                [player_id for player_id, entry in self._entries.items() if entry.dirty_since is not None]
+                + list(self._evicted)
+            )
+        # Forget the locks of players no longer cached
+        for player_id, lock in list(self._locks.items()):
+            if player_id not in self._entries and not lock.locked():
+                del self._locks[player_id]
+        return written
+
+    async def _flush_player(self, player_id: str):
+        """Write one player's state back now if it is dirty"""
+        async with self._flush_lock:
+            entry = self._entries.get(player_id)
+            if player_id in self._evicted or (entry and entry.dirty_since is not None):
+                await self._write_back([player_id])
+
+    async def _write_back(self, player_ids: List[str]) -> int:
+        """Snapshot and write the given players' documents; call with the flush lock held"""
+        written = 0
+        for start in range(0, len(player_ids), self.flush_batch_size):
+            # player_id -> (document written, cache entry it came from and when that became dirty)
+            snapshots: Dict[str, Tuple[Dict[str, Any], Optional[_Entry], Optional[float]]] = {}
+            for player_id in player_ids[start:start + self.flush_batch_size]:
+                entry = self._entries.get(player_id)
+                if entry is not None and entry.dirty_since is not None:
+                    snapshots[player_id] = (copy.deepcopy(self._cache.players[player_id]), entry, entry.dirty_since)
+                    entry.dirty_since = None
+                elif player_id in self._evicted:
+                    snapshots[player_id] = (self._evicted[player_id], None, None)
+            if not snapshots:
+                continue
+            try:
+                written += await self.storage.replace_player_states([document for document, _, _ in snapshots.values()])
+            except Exception:
+                self.flush_errors += 1
+                # Keep every snapshot pending for the next flush
+                for player_id, (document, entry, dirty_since) in snapshots.items():
+                    if entry is None:
+                        continue
+                    if self._entries.get(player_id) is entry:
+                        entry.dirty_since = min(dirty_since, entry.dirty_since or dirty_since)
+                    else:
+                        # Evicted as clean while the write was in flight
+                        self._evicted.setdefault(player_id, document)
+                raise
+            for player_id, (document, entry, _) in snapshots.items():
+                if entry is None and self._evicted.get(player_id) is document:
+                    del self._evicted[player_id]
+            self.flushes += 1
+        self.writes += written
+        return written
+
+    # Setup and catalog
+    async def ensure_indexes(self):
+        await self.storage.ensure_indexes()
+
+    async def verify_query_plans(self) -> Dict[str, bool]:
+        return await self.storage.verify_query_plans()
+
+    async def upsert_catalog(self, collection: str, documents: List[Dict[str, Any]], now: datetime) -> int:
+        return await self.storage.upsert_catalog(collection, documents, now)
+
+    async def load_catalog(self, collection: str) -> List[Dict[str, Any]]:
+        return await self.storage.load_catalog(collection)
+
+    async def get_catalog_version(self) -> int:
+        return await self.storage.get_catalog_version()
+
+    async def get_catalog_manifest(self) -> Optional[str]:
+        return await self.storage.get_catalog_manifest()
+
+    async def bump_catalog_version(self, manifest: Optional[str] = None) -> int:
+        return await self.storage.bump_catalog_version(manifest)
+
+    async def acquire_seed_lock(self, owner: str, ttl: float) -> bool:
+        return await self.storage.acquire_seed_lock(owner, ttl)
+
+    async def release_seed_lock(self, owner: str):
+        await self.storage.release_seed_lock(owner)
+
+    # Player state
+    async def get_player_state(self, player_id: str, fields: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        async with self._lock(player_id):
+            if not await self._load(player_id):
+                return None
+            return await self._cache.get_player_state(player_id, fields)
+
+    async def get_level_progress(self, player_id: str, level_id: str) -> Optional[Dict[str, Any]]:
+        async with self._lock(player_id):
+            if not await self._load(player_id):
+                return None
+            return await self._cache.get_level_progress(player_id, level_id)
+
+    async def get_player_states(self, player_ids: List[str], fields: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        # Batch reads are not cached, so they do not push out hot players
+        cached = [player_id for player_id in player_ids if self._cached(player_id)]
+        documents = await self._cache.get_player_states(cached, fields)
+        pending = [self._evicted[player_id] for player_id in player_ids
+                   if player_id in self._evicted and player_id not in cached]
+        documents += [_select(document, fields) for document in pending]
+        skip = set(cached) | {document["player_id"] for document in pending}
+        uncached = [player_id for player_id in player_ids if player_id not in skip]
+        if uncached:
+            documents += await self.storage.get_player_states(uncached, fields)
+        return documents
+
+    async def insert_player_state(self, document: Dict[str, Any]) -> bool:
+        async with self._lock(document["player_id"]):
+            if self._cached(document["player_id"]) or document["player_id"] in self._evicted:
+                return False
+            return await self.storage.insert_player_state(document)
+
+    async def set_player_fields(self, player_id: str, fields: Dict[str, Any]) -> bool:
+        async with self._lock(player_id):
+            if not await self._load(player_id):
+                return False
+            await self._cache.set_player_fields(player_id, fields)
+            self._mark_dirty(player_id)
+            return True
+
+    async def apply_level_completion(self, player_id: str, request: LevelCompleteRequest,
+                                     next_level_id: Optional[str], now: datetime) -> Optional[Dict[str, Any]]:
+        async with self._lock(player_id):
+            # Write pending changes first so the stored update builds on them
+            await self._flush_player(player_id)
+            document = await self.storage.apply_level_completion(player_id, request, next_level_id, now)
+            if document is not None:
+                self._put(player_id, copy.deepcopy(document))
+            return document
+
+    async def increment_player_stats(self, player_id: str, delta: UpdateGameStatsRequest, now: datetime,
+                                     fields: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        async with self._lock(player_id):
+            if not await self._load(player_id):
+                return None
+            document = await self._cache.increment_player_stats(player_id, delta, now, fields)
+            self._mark_dirty(player_id)
+            return document
+
+    async def _locked(self, stack: AsyncExitStack, player_ids: List[str]) -> List[str]:
+        """Take the locks of many players (in a fixed order) and return the uncached ones"""
+        for player_id in sorted(player_ids):
+            await stack.enter_async_context(self._lock(player_id))
+        return [player_id for player_id in player_ids if not self._cached(player_id) and player_id not in self._evicted]
+
+    async def increment_many_player_stats(self, deltas: Dict[str, UpdateGameStatsRequest], now: datetime) -> int:
+        async with AsyncExitStack() as stack:
+            uncached = set(await self._locked(stack, list(deltas)))
+            updated = 0
+            for player_id, delta in deltas.items():
+                if player_id not in uncached and await self._load(player_id):
+                    await self._cache.increment_player_stats(player_id, delta, now)
+                    self._mark_dirty(player_id)
+                    updated += 1
+            # Players not in the cache are incremented in storage without loading them
+            remaining = {player_id: deltas[player_id] for player_id in deltas if player_id in uncached}
+            if remaining:
+                try:
+                    updated += await self.storage.increment_many_player_stats(remaining, now)
+                except PartialWriteError:
+                    raise
+                except Exception as e:
+                    # The cached players' increments are already applied
+                    if updated:
+                        raise PartialWriteError(str(e), list(remaining)) from e
+                    raise
+            return updated
+
+    async def add_player_unlocks(self, unlocks: Dict[str, Tuple[List[str], List[str]]]):
+        async with AsyncExitStack() as stack:
+            uncached = set(await self._locked(stack, list(unlocks)))
+            for player_id in unlocks:
+                if player_id not in uncached and await self._load(player_id):
+                    await self._cache.add_player_unlocks({player_id: unlocks[player_id]})
+                    self._mark_dirty(player_id)
+            remaining = {player_id: unlocks[player_id] for player_id in unlocks if player_id in uncached}
+            if remaining:
+                await self.storage.add_player_unlocks(remaining)
+
+    async def replace_player_states(self, documents: List[Dict[str, Any]]) -> int:
+        async with AsyncExitStack() as stack:
+            player_ids = [document["player_id"] for document in documents]
+            await self._locked(stack, player_ids)
+            for player_id in player_ids:
+                if player_id in self._entries:
+                    self._drop(player_id)
+                self._evicted.pop(player_id, None)
+            return await self.storage.replace_player_states(documents)
+
+    # Sessions
+    async def insert_session(self, document: Dict[str, Any]):
+        await self.storage.insert_session(document)
+
+    async def get_open_session(self, player_id: str, session_id: str) -> Optional[Dict[str, Any]]:
+        return await self.storage.get_open_session(player_id, session_id)
+
+    async def update_open_session(self, player_id: str, session_id: str, fields: Dict[str, Any],
+                                  unset: Optional[List[str]] = None) -> bool:
+        return await self.storage.update_open_session(player_id, session_id, fields, unset)
+
+    async def rollup_sessions(self, cutoff: datetime) -> int:
+        return await self.storage.rollup_sessions(cutoff)
+
+    # Leaderboards
+    async def record_best_time(self, level_id: str, player_id: str, completion_time: int, now: datetime) -> bool:
+        return await self.storage.record_best_time(level_id, player_id, completion_time, now)
+
+    async def get_leaderboard(self, level_id: str, limit: int) -> List[Dict[str, Any]]:
+        return await self.storage.get_leaderboard(level_id, limit)
+
+    async def get_leaderboard_entry(self, level_id: str, player_id: str) -> Optional[Dict[str, Any]]:
+        return await self.storage.get_leaderboard_entry(level_id, player_id)
+
+    async def count_leaderboard_ahead(self, level_id: str, best_time: int, achieved_at: datetime) -> int:
+        return await self.storage.count_leaderboard_ahead(level_id, best_time, achieved_at)
+
+    async def rebuild_leaderboard_counts(self) -> int:
+        return await self.storage.rebuild_leaderboard_counts()
+
+    # Analytics
+    async def increment_level_analytics(self, level_id: str, increments: Dict[str, int]):
+        await self.storage.increment_level_analytics(level_id, increments)
+
+    async def increment_daily_analytics(self, day: str, increments: Dict[str, int]):
+        await self.storage.increment_daily_analytics(day, increments)
+
+    async def get_level_analytics(self) -> List[Dict[str, Any]]:
+        return await self.storage.get_level_analytics()
+
+    async def get_daily_analytics(self, since: str) -> List[Dict[str, Any]]:
+        return await self.storage.get_daily_analytics(since)
+
+    async def recompute_level_analytics(self) -> int:
+        # Recompute reads player states from storage, so write back first
+        await self.flush()
+        return await self.storage.recompute_level_analytics()
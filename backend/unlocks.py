@@ -0,0 +1,140 @@
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+from models import PlayerGameState, HandSkin, Achievement
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+# A predicate receives the player's state and the completion time (if the
+# change being evaluated is a level completion)
+Predicate = Callable[[PlayerGameState, Optional[int]], bool]
+
+# A dependency is a (kind, key) pair describing what a condition reads:
+#   ("level", "<level_id>")   - the given level being completed
+#   ("stat", "<field>")       - a GameStatistics counter changing
+#   ("event", "completion")   - any level completion
+Dependency = Tuple[str, str]
+
+COMPLETION_EVENT: Dependency = ("event", "completion")
+
+# Condition prefixes that compare a GameStatistics counter against a threshold
+STAT_CONDITIONS = {
+    "grabs": "total_grabs",
+    "releases": "total_releases",
+    "teleports": "total_teleports",
+    "levels_completed": "levels_completed",
+    "play_time": "total_play_time"
+}
+
+class CompiledCondition:
+    """An unlock condition parsed once into a predicate and its dependencies"""
+    def __init__(self, condition: str, predicate: Predicate, dependencies: List[Dependency]):
+        self.condition = condition
+        self.predicate = predicate
+        self.dependencies = dependencies
+
+def _complete_level(match: re.Match, level_count: int) -> Tuple[Predicate, List[Dependency]]:
+    level_id = f"level{match.group(1)}"
+    return (
+        lambda state, completion_time: level_id in state.completed_levels,
+        [("level", level_id)]
+    )
+
+def _complete_all_levels(match: re.Match, level_count: int) -> Tuple[Predicate, List[Dependency]]:
+    return (
+        lambda state, completion_time: level_count > 0 and len(state.completed_levels) >= level_count,
+        [("stat", "levels_completed")]
+    )
+
+def _stat_threshold(match: re.Match, level_count: int) -> Tuple[Predicate, List[Dependency]]:
+    field = STAT_CONDITIONS[match.group(1)]
+    threshold = int(match.group(2))
+    return (
+        lambda state, completion_time: getattr(state.statistics, field) >= threshold,
+        [("stat", field)]
+    )
+
+def _fast_completion(match: re.Match, level_count: int) -> Tuple[Predicate, List[Dependency]]:
+    limit = int(match.group(1)) * 1000
+    return (
+        lambda state, completion_time: completion_time is not None and completion_time < limit,
+        [COMPLETION_EVENT]
+    )
+
+# Condition grammar: first matching pattern wins
+CONDITION_PARSERS = [
+    (re.compile(r"^complete_level_(\d+)$"), _complete_level),
+    (re.compile(r"^complete_all_levels$"), _complete_all_levels),
+    (re.compile(rf"^({'|'.join(STAT_CONDITIONS)})_(\d+)$"), _stat_threshold),
+    (re.compile(r"^fast_completion_(\d+)s$"), _fast_completion)
+]
+
+def compile_condition(condition: str, level_count: int) -> Optional[CompiledCondition]:
+    """Parse an unlock condition string, returning None if it is not recognised"""
+    for pattern, parser in CONDITION_PARSERS:
+        match = pattern.match(condition)
+        if match:
+            predicate, dependencies = parser(match, level_count)
+            return CompiledCondition(condition, predicate, dependencies)
+    return None
+
+class UnlockRegistry:
+    """Compiled unlock conditions for the catalog, indexed by what they depend on"""
+    def __init__(self, hand_skins: List[HandSkin], achievements: List[Achievement], level_count: int):
+        # dependency -> [(kind, unlock id, compiled condition)]
+        self.index: Dict[Dependency, List[Tuple[str, str, CompiledCondition]]] = {}
+        self.size = 0
+        for skin in hand_skins:
+            if skin.unlock_requirement:
+                self._register("hand_skin", skin.id, skin.unlock_requirement, level_count)
+        for achievement in achievements:
+            self._register("achievement", achievement.id, achievement.unlock_condition, level_count)
+
+    def _register(self, kind: str, unlock_id: str, condition: str, level_count: int):
+        compiled = compile_condition(condition, level_count)
+        if not compiled:
+            logger.warning(f"Unknown unlock condition '{condition}' for {kind} {unlock_id}")
+            return
+        for dependency in compiled.dependencies:
+            self.index.setdefault(dependency, []).append((kind, unlock_id, compiled))
+        self.size += 1
+
+    def depends_on(self, changes: Iterable[Dependency]) -> bool:
+        """Check whether any registered condition reads one of the given changes"""
+        return any(dependency in self.index for dependency in changes)
+
+    def evaluate(self, game_state: PlayerGameState, changes: Iterable[Dependency],
+                 completion_time: Optional[int] = None) -> Tuple[List[str], List[str]]:
+        """Evaluate only the conditions affected by the given changes.
+
+        Returns the newly unlocked hand skin ids and achievement ids.
+        """
+        unlocked = {
+            "hand_skin": set(game_state.unlocked_hand_skins),
+            "achievement": set(game_state.unlocked_achievements)
+        }
+        new_unlocks: Dict[str, List[str]] = {"hand_skin": [], "achievement": []}
+        seen: Set[Tuple[str, str]] = set()
+        for dependency in changes:
+            for kind, unlock_id, compiled in self.index.get(dependency, ()):
+                if (kind, unlock_id) in seen or unlock_id in unlocked[kind]:
+                    continue
+                seen.add((kind, unlock_id))
+                if compiled.predicate(game_state, completion_time):
+                    new_unlocks[kind].append(unlock_id)
+        return new_unlocks["hand_skin"], new_unlocks["achievement"]
+
+def completion_changes(level_id: str, grabs: int = 0, releases: int = 0, teleports: int = 0) -> List[Dependency]:
+    """Dependencies touched by completing a level"""
+    changes = [("level", level_id), ("stat", "levels_completed"), COMPLETION_EVENT]
+    return changes + stat_changes(grabs=grabs, releases=releases, teleports=teleports)
+
+def stat_changes(grabs: int = 0, releases: int = 0, teleports: int = 0, play_time: int = 0) -> List[Dependency]:
+    """Dependencies touched by incrementing statistics counters"""
+    deltas = {
+        "total_grabs": grabs,
+        "total_releases": releases,
+        "total_teleports": teleports,
+        "total_play_time": play_time
+    }
+    return [("stat", field) for field, delta in deltas.items() if delta]
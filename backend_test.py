@@ -4,18 +4,28 @@ import json
 import time
 import os
 import sys
+import threading
+import queue
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
-# Get the backend URL from the frontend .env file
+# Get the backend URL from BACKEND_URL or the frontend .env file
 def get_backend_url():
-    with open('/app/frontend/.env', 'r') as f:
+    if os.environ.get('BACKEND_URL'):
+        return os.environ['BACKEND_URL'].rstrip('/')
+    env_path = os.environ.get('FRONTEND_ENV', '/app/frontend/.env')
+    with open(env_path, 'r') as f:
         for line in f:
             if line.startswith('REACT_APP_BACKEND_URL='):
                 return line.strip().split('=')[1].strip('"\'')
     raise Exception("Could not find REACT_APP_BACKEND_URL in frontend/.env")
 
-# Base URL for API requests
-BASE_URL = f"{get_backend_url()}/api"
+# Base URL for API requests, and for /metrics which is served outside /api
+BACKEND_URL = get_backend_url()
+BASE_URL = f"{BACKEND_URL}/api"
+
+# Backend package, for the checks that cannot be driven through the API
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend")
 print(f"Using backend URL: {BASE_URL}")
 
 # Test player ID
@@ -65,6 +75,16 @@ def run_test(test_name, test_func):
         print(f"Error: {e}")
         return False
 
+def get_metric(name):
+    """Read one unlabelled value from /metrics, or None if it is not exported"""
+    response = requests.get(f"{BACKEND_URL}/metrics")
+    if response.status_code != 200:
+        return None
+    for line in response.text.splitlines():
+        if line.startswith(f"{name} "):
+            return float(line.split()[1])
+    return None
+
 def test_health_check():
     """Test the root endpoint and basic API connectivity"""
     response = requests.get(f"{BASE_URL}/")
@@ -396,6 +416,77 @@ def test_game_sessions():
     print(f"Game sessions test successful")
     return True
 
+def test_game_session_lifecycle():
+    """Test heartbeats and ending sessions, both abandoned and won"""
+    player_id = "default"
+    
+    def start_session():
+        response = requests.post(f"{BASE_URL}/game/start-session", params={"player_id": player_id},
+                                 json={"level_id": "level1"})
+        return response.json()["data"]["session_id"] if response.status_code == 200 else None
+    
+    def post(session_id, action, body):
+        return requests.post(f"{BASE_URL}/game/sessions/{session_id}/{action}",
+                             params={"player_id": player_id}, json=body)
+    
+    # A session that is given up on ends without completing its level
+    session_id = start_session()
+    if not session_id:
+        print(f"Start session failed")
+        return False
+    
+    heartbeat_response = post(session_id, "heartbeat", {"grabs_count": 2, "releases_count": 1})
+    if heartbeat_response.status_code != 200:
+        print(f"Heartbeat failed with status code: {heartbeat_response.status_code}")
+        return False
+    
+    before = requests.get(f"{BASE_URL}/game/state", params={"player_id": player_id}).json().get("data")
+    before_progress = next((p for p in before["level_progress"] if p["level_id"] == "level1"), None)
+    before_attempts = before_progress["attempts"] if before_progress else 0
+    
+    end_response = post(session_id, "end", {"completed": False, "grabs_count": 2, "releases_count": 1})
+    if end_response.status_code != 200:
+        print(f"End session failed with status code: {end_response.status_code}")
+        return False
+    
+    for action, body in [("end", {"completed": False}), ("heartbeat", {})]:
+        response = post(session_id, action, body)
+        if response.status_code != 404:
+            print(f"{action} on an ended session returned {response.status_code} instead of 404")
+            return False
+    
+    # A won session needs its completion time and completes the level
+    session_id = start_session()
+    won_response = post(session_id, "end", {"completed": True})
+    if won_response.status_code != 422:
+        print(f"Won session without a completion time returned {won_response.status_code} instead of 422")
+        return False
+    
+    won_response = post(session_id, "end", {"completed": True, "completion_time": 30000, "grabs_count": 1,
+                                            "releases_count": 1, "teleports_count": 0})
+    if won_response.status_code != 200:
+        print(f"Ending a won session failed with status code: {won_response.status_code}")
+        return False
+    
+    after = requests.get(f"{BASE_URL}/game/state", params={"player_id": player_id}).json().get("data")
+    after_progress = next((p for p in after["level_progress"] if p["level_id"] == "level1"), None)
+    if not after_progress or not after_progress["completed"] or after_progress["attempts"] != before_attempts + 1:
+        print(f"Won session did not complete level1 once: {before_progress} -> {after_progress}")
+        return False
+    
+    if post(session_id, "end", {"completed": True, "completion_time": 30000}).status_code != 404:
+        print(f"A won session could be ended twice")
+        return False
+    
+    unknown_response = requests.post(f"{BASE_URL}/game/start-session", params={"player_id": player_id},
+                                      json={"level_id": "no_such_level"})
+    if unknown_response.status_code != 404:
+        print(f"Session for an unknown level returned {unknown_response.status_code} instead of 404")
+        return False
+    
+    print(f"Game session lifecycle test successful")
+    return True
+
 def test_level_completion():
     """Test completing a level and verify proper state updates"""
     # Get all levels first
@@ -483,6 +574,739 @@ def test_level_completion():
     print(f"Level completion test successful")
     return True
 
+def test_concurrent_level_completion():
+    """Test that parallel completions for one player do not lose updates"""
+    # The default player is always seeded, so it is safe to complete levels for it
+    player_id = "default"
+    parallel_requests = 20
+    
+    before_response = requests.get(f"{BASE_URL}/game/state", params={"player_id": player_id})
+    if before_response.status_code != 200:
+        print(f"Get game state failed with status code: {before_response.status_code}")
+        return False
+    before = before_response.json().get("data")
+    before_progress = next((p for p in before.get("level_progress", []) if p["level_id"] == "level1"), None)
+    before_attempts = before_progress["attempts"] if before_progress else 0
+    
+    completion_request = {
+        "level_id": "level1",
+        "completion_time": 45000,
+        "grabs_count": 1,
+        "releases_count": 1,
+        "teleports_count": 1
+    }
+    
+    def complete(_):
+        return requests.post(
+            f"{BASE_URL}/game/complete-level",
+            params={"player_id": player_id},
+            json=completion_request
+        ).status_code
+    
+    with ThreadPoolExecutor(max_workers=parallel_requests) as executor:
+        status_codes = list(executor.map(complete, range(parallel_requests)))
+    
+    if any(code != 200 for code in status_codes):
+        print(f"Some parallel completions failed: {status_codes}")
+        return False
+    
+    after = requests.get(f"{BASE_URL}/game/state", params={"player_id": player_id}).json().get("data")
+    after_progress = next((p for p in after.get("level_progress", []) if p["level_id"] == "level1"), None)
+    
+    for counter in ["total_grabs", "total_releases", "total_teleports"]:
+        delta = after["statistics"][counter] - before["statistics"][counter]
+        if delta != parallel_requests:
+            print(f"Lost updates on {counter}: expected +{parallel_requests}, got +{delta}")
+            return False
+    
+    if not after_progress or after_progress["attempts"] - before_attempts != parallel_requests:
+        print(f"Lost updates on level attempts: {before_attempts} -> {after_progress}")
+        return False
+    
+    if len([p for p in after["level_progress"] if p["level_id"] == "level1"]) != 1:
+        print(f"Duplicate level progress entries: {after['level_progress']}")
+        return False
+    
+    print(f"Concurrent level completion test successful")
+    return True
+
+def test_concurrent_stats_updates():
+    """Test that parallel stats updates and reads for one player do not lose or tear updates"""
+    player_id = "default"
+    parallel_requests = 30
+    
+    before = requests.get(f"{BASE_URL}/game/state", params={"player_id": player_id}).json().get("data")
+    before_grabs = before["statistics"]["total_grabs"]
+    
+    def update(_):
+        return requests.post(f"{BASE_URL}/game/update-stats", params={"player_id": player_id},
+                             json={"grabs": 1, "releases": 1, "teleports": 0, "play_time": 2}).status_code
+    
+    def read(_):
+        response = requests.get(f"{BASE_URL}/game/state", params={"player_id": player_id})
+        return response.json().get("data")["statistics"] if response.status_code == 200 else None
+    
+    with ThreadPoolExecutor(max_workers=parallel_requests * 2) as executor:
+        updates = executor.map(update, range(parallel_requests))
+        reads = executor.map(read, range(parallel_requests))
+        status_codes, read_stats = list(updates), list(reads)
+    
+    if any(code != 200 for code in status_codes):
+        print(f"Some parallel stats updates failed: {status_codes}")
+        return False
+    
+    # Every update moves grabs and releases together, so a read never sees only half of one
+    for stats in read_stats:
+        if stats is None or not before_grabs <= stats["total_grabs"] <= before_grabs + parallel_requests or \
+                stats["total_releases"] - before["statistics"]["total_releases"] != stats["total_grabs"] - before_grabs:
+            print(f"Inconsistent read during parallel updates: {stats}")
+            return False
+    
+    after = requests.get(f"{BASE_URL}/game/state", params={"player_id": player_id}).json().get("data")
+    expected = {"total_grabs": parallel_requests, "total_releases": parallel_requests,
+                "total_play_time": parallel_requests * 2}
+    for counter, increment in expected.items():
+        delta = after["statistics"][counter] - before["statistics"][counter]
+        if delta != increment:
+            print(f"Lost updates on {counter}: expected +{increment}, got +{delta}")
+            return False
+    
+    print(f"Concurrent stats updates test successful")
+    return True
+
+def test_batch_stats_updates():
+    """Test that batched stats are merged per player and flushed with their unlocks"""
+    player_id = "default"
+    
+    before = requests.get(f"{BASE_URL}/game/state", params={"player_id": player_id}).json().get("data")
+    had_portal_runner = "portal_runner" in before["unlocked_achievements"]
+    # Enough teleports in total to cross the portal_runner threshold of 10
+    teleports = max(10 - before["statistics"]["total_teleports"], 2)
+    
+    batch_request = {
+        "updates": [
+            {"player_id": player_id, "grabs": 1, "releases": 1, "teleports": teleports // 2, "play_time": 5},
+            {"player_id": player_id, "grabs": 2, "releases": 1, "teleports": teleports - teleports // 2, "play_time": 5},
+            {"player_id": "batch_unknown_player", "grabs": 1}
+        ]
+    }
+    
+    response = requests.post(f"{BASE_URL}/game/update-stats/batch", json=batch_request)
+    if response.status_code != 200:
+        print(f"Batch stats update failed with status code: {response.status_code}")
+        return False
+    
+    if response.json().get("data", {}).get("accepted") != 3:
+        print(f"Batch stats update did not accept every update: {response.json()}")
+        return False
+    
+    # Updates are applied by the next flush, which runs every second by default
+    after = before
+    deadline = time.time() + 10
+    while time.time() < deadline and after["statistics"]["total_grabs"] == before["statistics"]["total_grabs"]:
+        time.sleep(0.5)
+        after = requests.get(f"{BASE_URL}/game/state", params={"player_id": player_id}).json().get("data")
+    
+    expected = {"total_grabs": 3, "total_releases": 2, "total_teleports": teleports, "total_play_time": 10}
+    for counter, increment in expected.items():
+        delta = after["statistics"][counter] - before["statistics"][counter]
+        if delta != increment:
+            print(f"Batched {counter} not merged correctly: expected +{increment}, got +{delta}")
+            return False
+    
+    if "portal_runner" not in after["unlocked_achievements"]:
+        print(f"Flush did not unlock portal_runner at {after['statistics']['total_teleports']} teleports "
+              f"(already unlocked before: {had_portal_runner})")
+        return False
+    
+    # A batch with more players than the buffer holds is refused as a whole
+    max_pending = get_metric("stats_aggregator_max_pending_players")
+    if max_pending is None or max_pending >= 1000:
+        print(f"Skipping full buffer check, STATS_MAX_PENDING_PLAYERS is {max_pending}")
+    else:
+        oversized_request = {
+            "updates": [{"player_id": player_id, "grabs": 1}] +
+                       [{"player_id": f"batch_player_{i}", "grabs": 1} for i in range(int(max_pending))]
+        }
+        response = requests.post(f"{BASE_URL}/game/update-stats/batch", json=oversized_request)
+        if response.status_code != 503:
+            print(f"Oversized batch returned {response.status_code} instead of 503")
+            return False
+        
+        time.sleep(2.5)
+        final = requests.get(f"{BASE_URL}/game/state", params={"player_id": player_id}).json().get("data")
+        if final["statistics"]["total_grabs"] != after["statistics"]["total_grabs"]:
+            print(f"Rejected batch was partly applied: {after['statistics']} -> {final['statistics']}")
+            return False
+    
+    print(f"Batch stats updates test successful")
+    return True
+
+def test_leaderboards():
+    """Test that leaderboards keep each player's best time in rank order"""
+    player_id = "default"
+    
+    def complete(completion_time):
+        return requests.post(f"{BASE_URL}/game/complete-level", params={"player_id": player_id},
+                             json={"level_id": "level1", "completion_time": completion_time}).status_code
+    
+    def get_entry():
+        response = requests.get(f"{BASE_URL}/game/leaderboard/level1/rank", params={"player_id": player_id})
+        return response.json().get("data") if response.status_code == 200 else None
+    
+    if complete(50000) != 200:
+        print(f"Level completion failed")
+        return False
+    
+    entry = get_entry()
+    if not entry or entry["best_time"] > 50000:
+        print(f"Leaderboard entry missing or slower than the completion: {entry}")
+        return False
+    
+    # A slower time leaves the best time alone
+    if complete(entry["best_time"] + 1000) != 200 or get_entry() != entry:
+        print(f"Slower completion changed the leaderboard entry: {entry} -> {get_entry()}")
+        return False
+    
+    # A faster time replaces it
+    if entry["best_time"] > 1:
+        if complete(entry["best_time"] - 1) != 200:
+            print(f"Level completion failed")
+            return False
+        improved = get_entry()
+        if improved["best_time"] != entry["best_time"] - 1:
+            print(f"Faster completion did not improve the best time: {entry} -> {improved}")
+            return False
+        entry = improved
+    
+    response = requests.get(f"{BASE_URL}/game/leaderboard/level1", params={"limit": 1000})
+    if response.status_code != 200:
+        print(f"Get leaderboard failed with status code: {response.status_code}")
+        return False
+    
+    # Ordered by best time, with earlier achievers first on ties
+    entries = response.json().get("data")
+    order = [(e["best_time"], e["achieved_at"]) for e in entries]
+    if order != sorted(order) or [e["rank"] for e in entries] != list(range(1, len(entries) + 1)):
+        print(f"Leaderboard is not in rank order: {entries}")
+        return False
+    
+    listed = next((e for e in entries if e["player_id"] == player_id), None)
+    if not listed or listed["rank"] != entry["rank"] or listed["best_time"] != entry["best_time"]:
+        print(f"Player rank {entry} does not match the leaderboard entry {listed}")
+        return False
+    
+    missing_response = requests.get(f"{BASE_URL}/game/leaderboard/level1/rank",
+                                    params={"player_id": "player_without_times"})
+    if missing_response.status_code != 404:
+        print(f"Rank for a player without times returned {missing_response.status_code} instead of 404")
+        return False
+    
+    print(f"Leaderboards test successful")
+    return True
+
+def drag_replay(start, end, first_tick=5, ticks=60):
+    """A replay that grabs the ball at start, drags it to end over ticks and lets go"""
+    events = [[first_tick, 0, 0, *start]]
+    for i in range(1, ticks + 1):
+        events.append([first_tick + i, 1, 0, *[a + (b - a) * i / ticks for a, b in zip(start, end)]])
+    events.append([first_tick + ticks, 2, 0, *end])
+    return {"events": events, "tick_rate": 60}
+
+def test_replay_verification():
+    """Test that completion times are checked against their replays when verification is on"""
+    player_id = "default"
+    # Replays to the target in 1100ms on level1
+    replay = drag_replay([0, 2, 0], [3, 0.6, 0])
+    
+    far_off_response = requests.post(f"{BASE_URL}/game/complete-level", params={"player_id": player_id},
+                                     json={"level_id": "level1", "completion_time": 5000, "replay": replay})
+    if far_off_response.status_code == 200:
+        entry = requests.get(f"{BASE_URL}/game/leaderboard/level1/rank", params={"player_id": player_id}).json()
+        if entry["data"]["best_time"] > 5000:
+            print(f"Claimed time was not recorded with verification off: {entry}")
+            return False
+        print(f"Replay verification is off on this server, checked that claimed times are recorded as sent")
+        return True
+    if far_off_response.status_code != 422:
+        print(f"Claim far from the replay returned {far_off_response.status_code} instead of 422")
+        return False
+    
+    before = requests.get(f"{BASE_URL}/game/leaderboard/level1/rank", params={"player_id": player_id})
+    before_best = before.json()["data"]["best_time"] if before.status_code == 200 else None
+    
+    session_response = requests.post(f"{BASE_URL}/game/start-session", params={"player_id": player_id},
+                                     json={"level_id": "level1"})
+    session_id = session_response.json()["data"]["session_id"]
+    end_url = f"{BASE_URL}/game/sessions/{session_id}/end"
+    
+    # A rejected claim leaves the session open for an honest one
+    rejected_response = requests.post(end_url, params={"player_id": player_id},
+                                      json={"completed": True, "completion_time": 5000, "replay": replay})
+    if rejected_response.status_code != 422:
+        print(f"Session end far from the replay returned {rejected_response.status_code} instead of 422")
+        return False
+    
+    # A claim within tolerance is replaced by the replayed time
+    end_response = requests.post(end_url, params={"player_id": player_id},
+                                 json={"completed": True, "completion_time": 1150, "replay": replay})
+    if end_response.status_code != 200:
+        print(f"Session end within tolerance failed with status code: {end_response.status_code}")
+        return False
+    
+    after = requests.get(f"{BASE_URL}/game/leaderboard/level1/rank", params={"player_id": player_id})
+    expected_best = min(before_best, 1100) if before_best else 1100
+    if after.status_code != 200 or after.json()["data"]["best_time"] != expected_best:
+        print(f"Best time is not the replayed time: expected {expected_best}, got {after.json()}")
+        return False
+    
+    print(f"Replay verification test successful")
+    return True
+
+def test_unlock_events():
+    """Test that unlocks are pushed to the player's event stream"""
+    player_id = "default"
+    received = queue.Queue()
+    
+    def listen(response):
+        event = None
+        try:
+            for line in response.iter_lines(decode_unicode=True):
+                if line.startswith("event: "):
+                    event = line[len("event: "):]
+                elif line.startswith("data: "):
+                    received.put((event, json.loads(line[len("data: "):])))
+                    event = None
+        except (AttributeError, requests.exceptions.RequestException):
+            # Closing the stream from the test thread ends iter_lines with one of these
+            pass
+    
+    stream = requests.get(f"{BASE_URL}/game/events", params={"player_id": player_id}, stream=True, timeout=30)
+    if stream.status_code != 200:
+        print(f"Event stream failed with status code: {stream.status_code}")
+        return False
+    threading.Thread(target=listen, args=(stream,), daemon=True).start()
+    
+    try:
+        event, data = received.get(timeout=5)
+        if event != "connected" or "connection_id" not in data:
+            print(f"Event stream did not start with a connected event: {event} {data}")
+            return False
+        
+        # First completing a level whose successor is still locked unlocks that successor
+        levels = [level["id"] for level in requests.get(f"{BASE_URL}/game/levels").json().get("data")]
+        state = requests.get(f"{BASE_URL}/game/state", params={"player_id": player_id}).json().get("data")
+        completed = {p["level_id"] for p in state["level_progress"] if p["completed"]}
+        candidates = [(level, following) for level, following in zip(levels, levels[1:])
+                      if level not in completed and following not in state["unlocked_levels"]]
+        if not candidates:
+            print(f"Every level is already unlocked for {player_id}, only checked the connected event")
+            return True
+        level_id, next_level_id = candidates[0]
+        
+        response = requests.post(f"{BASE_URL}/game/complete-level", params={"player_id": player_id},
+                                 json={"level_id": level_id, "completion_time": 40000})
+        if response.status_code != 200:
+            print(f"Level completion failed with status code: {response.status_code}")
+            return False
+        
+        event, data = received.get(timeout=5)
+        if event is not None or {"type": "level_unlocked", "id": next_level_id} not in data:
+            print(f"Completing {level_id} did not push the {next_level_id} unlock: {event} {data}")
+            return False
+    except queue.Empty:
+        print(f"Timed out waiting for an event")
+        return False
+    finally:
+        stream.close()
+    
+    print(f"Unlock events test successful")
+    return True
+
+def test_write_behind_cache():
+    """Test read-your-writes and background write-back with PLAYER_STATE_CACHE=write_behind"""
+    player_id = "default"
+    if get_metric("player_cache_entries") is None:
+        print(f"Player state cache is off on this server, skipping")
+        return True
+    
+    writes_before = get_metric("player_cache_writes_total")
+    before = requests.get(f"{BASE_URL}/game/state", params={"player_id": player_id}).json().get("data")
+    
+    settings = before["settings"]
+    settings["graphics"]["shadows"] = not settings["graphics"]["shadows"]
+    settings_response = requests.post(f"{BASE_URL}/game/settings", params={"player_id": player_id},
+                                      json={"settings": settings})
+    stats_response = requests.post(f"{BASE_URL}/game/update-stats", params={"player_id": player_id},
+                                   json={"grabs": 7})
+    if settings_response.status_code != 200 or stats_response.status_code != 200:
+        print(f"Writes failed: {settings_response.status_code} {stats_response.status_code}")
+        return False
+    
+    # The next read sees both writes although neither has been written back yet
+    after = requests.get(f"{BASE_URL}/game/state", params={"player_id": player_id}).json().get("data")
+    if after["settings"] != settings or \
+            after["statistics"]["total_grabs"] != before["statistics"]["total_grabs"] + 7:
+        print(f"Cached state does not reflect the writes: {after['settings']} {after['statistics']}")
+        return False
+    
+    # Dirty states are written back within PLAYER_CACHE_MAX_UNFLUSHED_MS (1s by default)
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        if get_metric("player_cache_dirty") == 0 and get_metric("player_cache_writes_total") > writes_before:
+            break
+        time.sleep(0.5)
+    else:
+        print(f"Dirty player states were not written back: dirty={get_metric('player_cache_dirty')}")
+        return False
+    
+    print(f"Write-behind cache test successful")
+    return True
+
+def test_write_behind_write_back():
+    """Test that evicted and unflushed cached states reach the wrapped storage.
+
+    Runs in process against the backend package next to this script, since
+    eviction and shutdown cannot be driven through the API.
+    """
+    if BACKEND_DIR not in sys.path:
+        sys.path.insert(0, BACKEND_DIR)
+    try:
+        from storage import MemoryGameStorage, WriteBehindStorage
+        from models import UpdateGameStatsRequest
+    except ImportError as e:
+        print(f"Backend package is not importable here, skipping: {e}")
+        return True
+    import asyncio
+    
+    async def scenario():
+        storage = MemoryGameStorage()
+        for player_id in ["player_a", "player_b"]:
+            await storage.insert_player_state({"player_id": player_id, "statistics": {"total_grabs": 0}})
+        # No flush loop, so only eviction and stop() write anything back
+        cache = WriteBehindStorage(storage, capacity=1, max_unflushed=3600)
+        
+        await cache.increment_player_stats("player_a", UpdateGameStatsRequest(grabs=3), datetime.utcnow())
+        if (await storage.get_player_state("player_a"))["statistics"]["total_grabs"] != 0:
+            print(f"Cached write reached the wrapped storage before a flush")
+            return False
+        
+        # Loading player_b evicts the dirty player_a, which stays readable until written back
+        await cache.get_player_state("player_b")
+        if (await cache.get_player_state("player_a"))["statistics"]["total_grabs"] != 3:
+            print(f"Evicted dirty state was lost before its write-back")
+            return False
+        await cache.get_player_state("player_b")
+        await cache.flush()
+        if (await storage.get_player_state("player_a"))["statistics"]["total_grabs"] != 3:
+            print(f"Evicted dirty state was not written back")
+            return False
+        
+        await cache.increment_player_stats("player_b", UpdateGameStatsRequest(grabs=2), datetime.utcnow())
+        await cache.stop()
+        if (await storage.get_player_state("player_b"))["statistics"]["total_grabs"] != 2:
+            print(f"Dirty state was not written back on stop")
+            return False
+        return True
+    
+    if not asyncio.run(scenario()):
+        return False
+    
+    print(f"Write-behind write-back test successful")
+    return True
+
+def test_partial_state_reads():
+    """Test the statistics and single-level progress endpoints against the full state"""
+    # Nothing creates players through the API, so read the seeded default player
+    player_id = "default"
+    state_response = requests.get(f"{BASE_URL}/game/state", params={"player_id": player_id})
+    if state_response.status_code != 200:
+        print(f"Get game state failed with status code: {state_response.status_code}")
+        return False
+    game_state = state_response.json().get("data")
+    
+    stats_response = requests.get(f"{BASE_URL}/game/state/statistics", params={"player_id": player_id})
+    if stats_response.status_code != 200:
+        print(f"Get statistics failed with status code: {stats_response.status_code}")
+        return False
+    if stats_response.json().get("data") != game_state.get("statistics"):
+        print(f"Statistics do not match game state: {stats_response.json()}")
+        return False
+    
+    for level_id in [p["level_id"] for p in game_state.get("level_progress", [])]:
+        progress_response = requests.get(f"{BASE_URL}/game/state/progress/{level_id}", params={"player_id": player_id})
+        if progress_response.status_code != 200:
+            print(f"Get {level_id} progress failed with status code: {progress_response.status_code}")
+            return False
+        expected = next(p for p in game_state["level_progress"] if p["level_id"] == level_id)
+        progress = progress_response.json().get("data")
+        if progress != expected:
+            print(f"Level progress does not match game state. Expected: {expected}, Got: {progress}")
+            return False
+    
+    for params, path in [({"player_id": "no_such_player"}, "statistics"),
+                         ({"player_id": player_id}, "progress/no_such_level")]:
+        missing_response = requests.get(f"{BASE_URL}/game/state/{path}", params=params)
+        if missing_response.status_code != 404:
+            print(f"Expected 404 for /game/state/{path} with {params}, got: {missing_response.status_code}")
+            return False
+    
+    print(f"Partial state reads test successful")
+    return True
+
+def test_state_delta_sync():
+    """Test that /game/state?since= returns only changes, or 304 when nothing changed"""
+    # Nothing creates players through the API, so sync the seeded default player
+    player_id = "default"
+    state_response = requests.get(f"{BASE_URL}/game/state", params={"player_id": player_id})
+    if state_response.status_code != 200:
+        print(f"Get game state failed with status code: {state_response.status_code}")
+        return False
+    game_state = state_response.json()["data"]
+    revision = game_state.get("revision")
+    if revision is None:
+        print(f"Game state has no revision: {game_state}")
+        return False
+    
+    unchanged_response = requests.get(f"{BASE_URL}/game/state", params={"player_id": player_id, "since": revision})
+    if unchanged_response.status_code != 304:
+        print(f"Expected 304 for an unchanged state, got: {unchanged_response.status_code}")
+        return False
+    
+    # Each write reports only the fields it changed, stats first and then settings
+    settings = game_state["settings"]
+    settings["graphics"]["shadows"] = not settings["graphics"]["shadows"]
+    writes = [
+        ("update-stats", {"grabs": 1}, {"statistics", "updated_at"}),
+        ("settings", {"settings": settings}, {"settings", "updated_at"})
+    ]
+    for route, body, changed_fields in writes:
+        write_response = requests.post(f"{BASE_URL}/game/{route}", params={"player_id": player_id}, json=body)
+        if write_response.status_code != 200:
+            print(f"POST /game/{route} failed with status code: {write_response.status_code}")
+            return False
+        
+        delta_response = requests.get(f"{BASE_URL}/game/state", params={"player_id": player_id, "since": revision})
+        if delta_response.status_code != 200:
+            print(f"Get state changes failed with status code: {delta_response.status_code}")
+            return False
+        delta = delta_response.json()["data"]
+        if delta.get("revision", 0) <= revision or set(delta) != changed_fields | {"revision"}:
+            print(f"Expected only {sorted(changed_fields)} to change after /game/{route}, got: {delta}")
+            return False
+        
+        current = requests.get(f"{BASE_URL}/game/state", params={"player_id": player_id}).json()["data"]
+        if any(delta[field] != current[field] for field in changed_fields):
+            print(f"State changes do not match the full state: {delta}")
+            return False
+        revision = delta["revision"]
+    
+    print(f"State delta sync test successful")
+    return True
+
+def test_batch_state_reads():
+    """Test fetching several players' states in one request"""
+    # Nothing creates players through the API, so the seeded default player is
+    # the one known player here; test_batch_state_reads_seeded covers several
+    player_id = "default"
+    response = requests.get(
+        f"{BASE_URL}/game/states",
+        params={"player_id": [player_id, "no_such_player"], "fields": ["statistics", "current_level"]}
+    )
+    if response.status_code != 200:
+        print(f"Get game states failed with status code: {response.status_code}")
+        return False
+    states = response.json().get("data")
+    # Unknown players are reported as missing by being left out
+    if set(states) != {player_id} or set(states[player_id]) != {"statistics", "current_level"}:
+        print(f"Unexpected batch state response: {states}")
+        return False
+    
+    stats_response = requests.get(f"{BASE_URL}/game/state/statistics", params={"player_id": player_id})
+    if stats_response.json().get("data") != states[player_id]["statistics"]:
+        print(f"Batch statistics do not match: {stats_response.json()}")
+        return False
+    
+    bad_field_response = requests.get(f"{BASE_URL}/game/states", params={"player_id": player_id, "fields": "password"})
+    if bad_field_response.status_code != 400:
+        print(f"Expected 400 for unknown field, got: {bad_field_response.status_code}")
+        return False
+    
+    # Same setting and default as the server
+    max_players = int(os.environ.get("STATE_BATCH_MAX_PLAYERS", "100"))
+    too_many = [player_id] + [f"batch_state_player_{i}" for i in range(max_players)]
+    too_many_response = requests.get(f"{BASE_URL}/game/states", params={"player_id": too_many})
+    if too_many_response.status_code != 400:
+        print(f"Expected 400 for {len(too_many)} players, got: {too_many_response.status_code}")
+        return False
+    
+    print(f"Batch state reads test successful")
+    return True
+
+def test_batch_state_reads_seeded():
+    """Test batch state reads for several seeded players.
+
+    Runs in process against the backend package next to this script, since
+    players cannot be created through the API.
+    """
+    if BACKEND_DIR not in sys.path:
+        sys.path.insert(0, BACKEND_DIR)
+    try:
+        from storage import MemoryGameStorage
+        from game_service import GameService
+        from models import PlayerGameState, GameStatistics
+    except ImportError as e:
+        print(f"Backend package is not importable here, skipping: {e}")
+        return True
+    import asyncio
+    
+    async def scenario():
+        storage = MemoryGameStorage()
+        seeded = {"player_a": 3, "player_b": 5}
+        for seeded_id, grabs in seeded.items():
+            state = PlayerGameState(player_id=seeded_id, statistics=GameStatistics(total_grabs=grabs))
+            await storage.insert_player_state(state.model_dump())
+        service = GameService(storage)
+        
+        states = await service.get_game_states(["player_a", "no_such_player", "player_b", "player_a"],
+                                               ["statistics", "current_level"])
+        if set(states) != set(seeded):
+            print(f"Expected exactly the seeded players, got: {sorted(states)}")
+            return False
+        for seeded_id, grabs in seeded.items():
+            if set(states[seeded_id]) != {"statistics", "current_level"} or \
+                    states[seeded_id]["statistics"]["total_grabs"] != grabs:
+                print(f"Unexpected state for {seeded_id}: {states[seeded_id]}")
+                return False
+        return True
+    
+    if not asyncio.run(scenario()):
+        return False
+    
+    print(f"Seeded batch state reads test successful")
+    return True
+
+def test_level_payloads():
+    """Test compressed, render-view and MessagePack level responses"""
+    full_response = requests.get(f"{BASE_URL}/game/levels", headers={"Accept-Encoding": "gzip"})
+    if full_response.status_code != 200:
+        print(f"Get levels failed with status code: {full_response.status_code}")
+        return False
+    if full_response.headers.get("Content-Encoding") not in ("gzip", "br"):
+        print(f"Levels response was not compressed: {full_response.headers}")
+        return False
+    levels = full_response.json()["data"]
+    
+    render_response = requests.get(f"{BASE_URL}/game/levels", params={"view": "render"})
+    render_levels = render_response.json().get("data", [])
+    if [level["id"] for level in render_levels] != [level["id"] for level in levels]:
+        print(f"Render view levels do not match: {render_response.text}")
+        return False
+    if any("created_at" in level or "updated_at" in level for level in render_levels):
+        print(f"Render view still carries document metadata: {render_levels[0]}")
+        return False
+    if len(render_response.content) >= len(requests.get(f"{BASE_URL}/game/levels").content):
+        print(f"Render view is not smaller than the full view")
+        return False
+    
+    bad_view_response = requests.get(f"{BASE_URL}/game/levels", params={"view": "compact"})
+    if bad_view_response.status_code != 422:
+        print(f"Expected 422 for unknown view, got: {bad_view_response.status_code}")
+        return False
+    
+    # MessagePack is optional on the server; JSON is the fallback
+    msgpack_response = requests.get(f"{BASE_URL}/game/levels/level1", headers={"Accept": "application/msgpack"})
+    if msgpack_response.status_code != 200:
+        print(f"Get level as MessagePack failed with status code: {msgpack_response.status_code}")
+        return False
+    content_type = msgpack_response.headers.get("Content-Type", "")
+    if not content_type.startswith(("application/msgpack", "application/json")):
+        print(f"Unexpected level content type: {content_type}")
+        return False
+    if msgpack_response.headers.get("ETag") == requests.get(f"{BASE_URL}/game/levels/level1").headers.get("ETag") \
+            and content_type.startswith("application/msgpack"):
+        print(f"MessagePack and JSON variants share an ETag")
+        return False
+    
+    print(f"Level payloads test successful")
+    return True
+
+def test_level_layouts():
+    """Test the precomputed level layouts"""
+    levels = requests.get(f"{BASE_URL}/game/levels").json()["data"]
+    layouts = {}
+    for level in levels:
+        response = requests.get(f"{BASE_URL}/game/levels/{level['id']}/layout")
+        if response.status_code != 200:
+            print(f"Get layout for {level['id']} failed with status code: {response.status_code}")
+            return False
+        layouts[level["id"]] = response.json()["data"]
+    
+    # Layouts chain the levels in play order
+    ids = [level["id"] for level in sorted(levels, key=lambda level: level["order"])]
+    if [layouts[level_id]["next_level"] for level_id in ids] != ids[1:] + [None]:
+        print(f"Level layouts are not chained in order: {layouts}")
+        return False
+    
+    for level in levels:
+        layout = layouts[level["id"]]
+        low, high = layout["bounds"]["min"], layout["bounds"]["max"]
+        if any(not all(l <= p <= h for l, p, h in zip(low, ball["position"], high)) for ball in level["balls"]):
+            print(f"Level {level['id']} bounds do not contain its balls: {layout['bounds']}")
+            return False
+        for teleporter in layout["teleporters"]:
+            linked = next((t for t in level.get("teleporters") or [] if t["id"] == teleporter["linked_to"]), None)
+            if not linked or teleporter["exit"] != linked["position"]:
+                print(f"Teleporter link not resolved: {teleporter}")
+                return False
+    
+    missing_response = requests.get(f"{BASE_URL}/game/levels/no_such_level/layout")
+    if missing_response.status_code != 404:
+        print(f"Expected 404 for unknown level layout, got: {missing_response.status_code}")
+        return False
+    
+    print(f"Level layouts test successful")
+    return True
+
+def test_analytics():
+    """Test the level and daily analytics endpoints"""
+    levels_response = requests.get(f"{BASE_URL}/analytics/levels")
+    if levels_response.status_code != 200:
+        print(f"Get level analytics failed with status code: {levels_response.status_code}")
+        return False
+    summaries = levels_response.json().get("data")
+    if not summaries or [s["order"] for s in summaries] != sorted(s["order"] for s in summaries):
+        print(f"Level analytics missing or out of order: {summaries}")
+        return False
+    
+    # Earlier tests completed level1
+    level1 = next((s for s in summaries if s["level_id"] == "level1"), None)
+    if not level1 or level1["completions"] < 1 or level1["first_completions"] < 1:
+        print(f"Level1 completions not recorded: {level1}")
+        return False
+    
+    single_response = requests.get(f"{BASE_URL}/analytics/levels/level1")
+    if single_response.status_code != 200 or single_response.json().get("data") != level1:
+        print(f"Single level analytics do not match: {single_response.text}")
+        return False
+    
+    missing_response = requests.get(f"{BASE_URL}/analytics/levels/no_such_level")
+    if missing_response.status_code != 404:
+        print(f"Expected 404 for unknown level, got: {missing_response.status_code}")
+        return False
+    
+    daily_response = requests.get(f"{BASE_URL}/analytics/daily", params={"days": 7})
+    if daily_response.status_code != 200:
+        print(f"Get daily analytics failed with status code: {daily_response.status_code}")
+        return False
+    days = daily_response.json().get("data")
+    if len(days) != 7 or days[-1]["completions"] < 1:
+        print(f"Daily analytics missing today's completions: {days}")
+        return False
+    
+    print(f"Analytics test successful")
+    return True
+
 def test_achievements():
     """Test getting all achievements"""
     response = requests.get(f"{BASE_URL}/game/achievements")
@@ -524,7 +1348,23 @@ def run_all_tests():
         ("Settings Management", test_settings_management),
         ("Game Statistics", test_game_statistics),
         ("Game Sessions", test_game_sessions),
+        ("Game Session Lifecycle", test_game_session_lifecycle),
         ("Level Completion", test_level_completion),
+        ("Concurrent Level Completion", test_concurrent_level_completion),
+        ("Concurrent Stats Updates", test_concurrent_stats_updates),
+        ("Batch Stats Updates", test_batch_stats_updates),
+        ("Leaderboards", test_leaderboards),
+        ("Replay Verification", test_replay_verification),
+        ("Unlock Events", test_unlock_events),
+        ("Write-Behind Cache", test_write_behind_cache),
+        ("Write-Behind Write Back", test_write_behind_write_back),
+        ("Partial State Reads", test_partial_state_reads),
+        ("Batch State Reads", test_batch_state_reads),
+        ("Seeded Batch State Reads", test_batch_state_reads_seeded),
+        ("State Delta Sync", test_state_delta_sync),
+        ("Level Payloads", test_level_payloads),
+        ("Level Layouts", test_level_layouts),
+        ("Analytics", test_analytics),
         ("Achievements", test_achievements)
     ]
     
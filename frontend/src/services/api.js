@@ -49,14 +49,30 @@ api.interceptors.response.use(
   }
 );
 
+// Last game state response per player, updated from delta reads
+const gameStateCache = new Map();
+
 // Game API Service
 export class GameApiService {
   
   // Game State Management
   static async getGameState(playerId = 'default') {
     try {
-      const response = await api.get(`/game/state?player_id=${playerId}`);
-      return response.data;
+      // After the first load only fields changed since the cached revision
+      // are sent, and nothing at all (304) when the state is unchanged
+      const cached = gameStateCache.get(playerId);
+      const since = cached?.data?.revision !== undefined ? `&since=${cached.data.revision}` : '';
+      const response = await api.get(`/game/state?player_id=${playerId}${since}`, {
+        validateStatus: (status) => (status >= 200 && status < 300) || status === 304
+      });
+      if (response.status === 304) {
+        return cached;
+      }
+      const result = since
+        ? { ...response.data, data: { ...cached.data, ...response.data.data } }
+        : response.data;
+      gameStateCache.set(playerId, result);
+      return result;
     } catch (error) {
       console.error('Failed to get game state:', error);
       throw error;
@@ -66,7 +82,8 @@ export class GameApiService {
   // Level Management
   static async getAllLevels() {
     try {
-      const response = await api.get('/game/levels');
+      // The render view leaves out document metadata the game never reads
+      const response = await api.get('/game/levels', { params: { view: 'render' } });
       return response.data;
     } catch (error) {
       console.error('Failed to get levels:', error);
@@ -76,7 +93,7 @@ export class GameApiService {
 
   static async getLevelById(levelId) {
     try {
-      const response = await api.get(`/game/levels/${levelId}`);
+      const response = await api.get(`/game/levels/${levelId}`, { params: { view: 'render' } });
       return response.data;
     } catch (error) {
       console.error('Failed to get level:', error);